@@ -0,0 +1,159 @@
+"""
+Archival of closed elections.
+
+Once an election has been closed for a while, its votes and ballots are only
+needed to display its results. Archiving an election freezes its tallies and
+progress in `election_archives`, moves its raw ballots and votes into a
+compressed blob next to them, and deletes them from the hot tables.
+
+The results and the progress of an archived election are served from the
+archive. Its ballots can not be read nor updated until it is restored.
+"""
+import base64
+import json
+import typing as t
+import uuid
+import zlib
+from datetime import datetime, timedelta
+from sqlalchemy import (
+    DateTime,
+    LargeBinary,
+    Table,
+    UUID,
+    delete,
+    func,
+    insert,
+    or_,
+    select,
+)
+from sqlalchemy.orm import Session
+from . import crud, errors, models
+
+# Ballots first, since votes reference them
+TABLES: tuple[Table, ...] = (models.Ballot.__table__, models.Vote.__table__)
+BATCH_SIZE = 10_000
+
+
+def _dump_value(value: t.Any) -> str:
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode()
+    return str(value)
+
+
+def _dump_row(row: t.Mapping[str, t.Any]) -> bytes:
+    return json.dumps(dict(row), default=_dump_value).encode() + b"\n"
+
+
+def _load_row(table: Table, row: dict[str, t.Any]) -> dict[str, t.Any]:
+    for column in table.columns:
+        value = row.get(column.name)
+        if value is None:
+            continue
+        if isinstance(column.type, DateTime):
+            row[column.name] = datetime.fromisoformat(value)
+        elif isinstance(column.type, UUID):
+            row[column.name] = uuid.UUID(value)
+        elif isinstance(column.type, LargeBinary):
+            row[column.name] = base64.b64decode(value)
+    return row
+
+
+def find_archivable(
+    db: Session, retention_days: int, now: datetime | None = None
+) -> list[str]:
+    """
+    List the refs of the elections closed for more than retention_days
+    """
+    limit = (now or datetime.now()) - timedelta(days=retention_days)
+    date_closed = func.coalesce(
+        models.Election.date_modified, models.Election.date_created
+    )
+    query = select(models.Election.ref).filter(
+        models.Election.archived.is_not(True)
+        & or_(
+            models.Election.date_end < limit,
+            models.Election.force_close.is_(True) & (date_closed < limit),
+        )
+    )
+    return [str(ref) for ref in db.scalars(query)]
+
+
+def archive_election(db: Session, election_ref: str) -> models.ElectionArchive:
+    """
+    Freeze the results of an election and move its ballots out of the hot tables
+    """
+    db_election = crud.get_election(db, election_ref)
+    crud._check_election_is_not_archived(db_election)
+
+    num_voters, num_voters_voted = crud.count_voters(db, db_election)
+
+    compressor = zlib.compressobj(level=9)
+    chunks = []
+    for table in TABLES:
+        rows = db.execute(
+            select(table)
+            .filter(table.c.election_ref == election_ref)
+            .order_by(table.c.id)
+            .execution_options(yield_per=BATCH_SIZE)
+        ).mappings()
+        for row in rows:
+            chunks.append(compressor.compress(_dump_row({"table": table.name, **row})))
+    chunks.append(compressor.flush())
+
+    db_archive = models.ElectionArchive(
+        election_ref=election_ref,
+        tallies=[
+            list(row)
+            for row in crud.get_tallies(
+                db, election_ref, bool(db_election.compact_ballots)
+            )
+        ],
+        num_voters=num_voters,
+        num_voters_voted=num_voters_voted,
+        data=b"".join(chunks),
+    )
+
+    try:
+        db.add(db_archive)
+        for table in reversed(TABLES):
+            db.execute(delete(table).where(table.c.election_ref == election_ref))
+        setattr(db_election, "archived", True)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise e
+
+    return db_archive
+
+
+def restore_election(db: Session, election_ref: str) -> int:
+    """
+    Move the ballots of an archived election back into the hot tables.
+
+    Rows keep their ids, so the tokens given to the voters remain valid.
+    Return the number of restored rows.
+    """
+    db_election = crud.get_election(db, election_ref)
+    if not db_election.archived:
+        raise errors.BadRequestError("The election is not archived")
+    db_archive = crud.get_archive(db, election_ref)
+
+    tables = {table.name: table for table in TABLES}
+    rows: dict[str, list[dict[str, t.Any]]] = {name: [] for name in tables}
+    for line in zlib.decompress(db_archive.data).splitlines():
+        row = json.loads(line)
+        table = tables[row.pop("table")]
+        rows[table.name].append(_load_row(table, row))
+
+    try:
+        for table in TABLES:
+            for start in range(0, len(rows[table.name]), BATCH_SIZE):
+                db.execute(insert(table), rows[table.name][start : start + BATCH_SIZE])
+        db.delete(db_archive)
+        setattr(db_election, "archived", False)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise e
+
+    return sum(len(r) for r in rows.values())
@@ -0,0 +1,433 @@
+"""
+Asyncio variants of the hot CRUD functions.
+
+They follow the same rules as their counterpart in `crud`, but they never rely
+on lazy loading: every relationship they need is loaded eagerly.
+"""
+import typing as t
+from datetime import datetime
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import flag_modified
+from . import compact, models, provisional, schemas, errors, timeline, tracing
+from .auth import create_ballot_token, jws_verify
+from .database import invalidation_bus
+from .crud import (
+    _check_archive_exists,
+    _check_ballot_is_consistent,
+    _check_election_is_not_archived,
+    _check_election_is_not_ended,
+    _check_election_is_started,
+    _check_results_are_visible,
+    _compute_results,
+    _elections,
+    _grades_of,
+    _results,
+)
+
+
+async def get_election(db: AsyncSession, election_ref_or_id: str) -> models.Election:
+    """
+    Load an election given its ID or its ref, with its candidates and grades
+    """
+    query = select(models.Election).options(
+        selectinload(models.Election.candidates),
+        selectinload(models.Election.grades),
+    )
+    if election_ref_or_id.isnumeric():
+        query = query.filter(models.Election.id == int(election_ref_or_id))
+    else:
+        query = query.filter(models.Election.ref == election_ref_or_id)
+
+    elections = (await db.execute(query)).scalars().all()
+
+    if len(elections) > 1:
+        raise errors.InconsistentDatabaseError(
+            "elections",
+            f"Several elections have the same primary keys {election_ref_or_id}",
+        )
+
+    if len(elections) == 1:
+        return elections[0]
+
+    raise errors.NotFoundError("elections")
+
+
+async def get_election_get(db: AsyncSession, election_ref: str) -> schemas.ElectionGet:
+    """
+    Serialize an election given its ref, from the cache when possible
+    """
+
+    async def compute() -> schemas.ElectionGet:
+        return schemas.ElectionGet.model_validate(await get_election(db, election_ref))
+
+    return await _elections.get_or_set_async(election_ref, compute)
+
+
+async def _check_items_in_election(
+    db: AsyncSession,
+    ids: t.Sequence[int],
+    election_ref: str,
+    model: t.Type[models.Grade | models.Candidate],
+):
+    """
+    Check the items are related to the election.
+    """
+    unique_ids = list(set(ids))
+    num_items = await db.scalar(
+        select(func.count(model.id)).filter(
+            model.id.in_(unique_ids) & (model.election_ref == election_ref)
+        )
+    )
+    if num_items != len(unique_ids):
+        raise errors.ForbiddenError(
+            "Asking for resources related to a different election"
+        )
+
+
+def _votes_get(
+    db_votes: t.Sequence[models.Vote], election: schemas.ElectionGet
+) -> list[schemas.VoteGet]:
+    """
+    Serialize votes using the candidates and grades of an already loaded election
+    """
+    candidates = {c.id: c for c in election.candidates}
+    grades = {g.id: g for g in election.grades}
+    return [
+        schemas.VoteGet(
+            id=int(v.id),
+            election_ref=str(v.election_ref),
+            candidate=candidates.get(v.candidate_id),  # type: ignore
+            grade=grades.get(v.grade_id),  # type: ignore
+        )
+        for v in db_votes
+    ]
+
+
+async def create_ballot(
+    db: AsyncSession, ballot: schemas.BallotCreate
+) -> schemas.BallotGet:
+    if ballot.votes == []:
+        raise errors.ForbiddenError("The ballot contains no vote")
+
+    with tracing.span("load_election"):
+        db_election = await get_election(db, ballot.election_ref)
+        if db_election.restricted:
+            raise errors.ElectionRestrictedError(
+                "The election is restricted. You can not create new votes"
+            )
+        election = schemas.ElectionGet.model_validate(db_election)
+
+    with tracing.span("validate"):
+        _check_election_is_started(db_election)
+        _check_election_is_not_ended(db_election)
+
+        await _check_items_in_election(
+            db,
+            [v.candidate_id for v in ballot.votes],
+            ballot.election_ref,
+            models.Candidate,
+        )
+        await _check_items_in_election(
+            db, [v.grade_id for v in ballot.votes], ballot.election_ref, models.Grade
+        )
+        _check_ballot_is_consistent(election, ballot)
+
+    if db_election.compact_ballots:
+        return await _create_compact_ballot(db, ballot, election)
+
+    try:
+        with tracing.span("write", votes=len(ballot.votes)):
+            db_ballot = models.Ballot(election_ref=ballot.election_ref)
+            db.add(db_ballot)
+            await db.flush()
+
+            db_votes = [
+                models.Vote(
+                    **v.model_dump(),
+                    election_ref=ballot.election_ref,
+                    ballot_id=db_ballot.id,
+                )
+                for v in ballot.votes
+            ]
+            db.add_all(db_votes)
+            await db.flush()
+
+        await invalidation_bus.publish_async(db, ballot.election_ref)
+        with tracing.span("commit"):
+            await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise e
+    provisional.record(ballot.election_ref, _grades_of(ballot))
+
+    with tracing.span("serialize"):
+        votes_get = _votes_get(db_votes, election)
+
+    with tracing.span("sign_token"):
+        vote_ids = [v.id for v in votes_get]
+        token = create_ballot_token(vote_ids, ballot.election_ref, int(db_ballot.id))
+    return schemas.BallotGet(votes=votes_get, token=token, election=election)
+
+
+async def _create_compact_ballot(
+    db: AsyncSession, ballot: schemas.BallotCreate, election: schemas.ElectionGet
+) -> schemas.BallotGet:
+    try:
+        with tracing.span("write", votes=len(ballot.votes)):
+            packed = compact.pack_ballot(ballot, election)
+            db_ballot = models.Ballot(election_ref=ballot.election_ref, grades=packed)
+            db.add(db_ballot)
+            await db.flush()
+            ballot_id = int(db_ballot.id)
+
+        await invalidation_bus.publish_async(db, ballot.election_ref)
+        with tracing.span("commit"):
+            await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise e
+    provisional.record(ballot.election_ref, _grades_of(ballot))
+
+    with tracing.span("serialize"):
+        votes_get = compact.votes_get(ballot_id, packed, election)
+
+    with tracing.span("sign_token"):
+        token = create_ballot_token([], ballot.election_ref, ballot_id)
+    return schemas.BallotGet(votes=votes_get, token=token, election=election)
+
+
+async def _get_compact_ballot(
+    db: AsyncSession, payload: t.Mapping[str, t.Any]
+) -> models.Ballot:
+    """
+    Load the ballot of a token, in an election with compact ballots
+    """
+    db_ballot = None
+    if payload.get("ballot") is not None:
+        db_ballot = await db.scalar(
+            select(models.Ballot).filter(
+                (models.Ballot.id == payload["ballot"])
+                & (models.Ballot.election_ref == payload["election"])
+            )
+        )
+    if db_ballot is None:
+        raise errors.NotFoundError("ballots")
+    return db_ballot
+
+
+async def _get_compact_ballot_get(
+    db: AsyncSession,
+    payload: t.Mapping[str, t.Any],
+    token: str,
+    db_election: models.Election,
+) -> schemas.BallotGet:
+    db_ballot = await _get_compact_ballot(db, payload)
+    if db_ballot.grades is None:
+        raise errors.NotFoundError("votes")
+    election = schemas.ElectionGet.model_validate(db_election)
+    votes_get = compact.votes_get(
+        int(db_ballot.id), t.cast(bytes, db_ballot.grades), election
+    )
+    return schemas.BallotGet(token=token, votes=votes_get, election=election)
+
+
+async def _vote_ids_of_ballot(
+    db: AsyncSession, payload: t.Mapping[str, t.Any]
+) -> list[int]:
+    """
+    Provide the votes of a token, see crud._vote_ids_of_ballot
+    """
+    if payload["votes"] or payload.get("ballot") is None:
+        return list(set(payload["votes"]))
+
+    vote_ids = await db.scalars(
+        select(models.Vote.id).filter(
+            (models.Vote.ballot_id == payload["ballot"])
+            & (models.Vote.election_ref == payload["election"])
+        )
+    )
+    return list(vote_ids)
+
+
+async def _update_compact_ballot(
+    db: AsyncSession,
+    ballot: schemas.BallotUpdate,
+    token: str,
+    payload: t.Mapping[str, t.Any],
+    db_election: models.Election,
+) -> schemas.BallotGet:
+    election_ref = str(db_election.ref)
+    await _check_items_in_election(
+        db, [v.candidate_id for v in ballot.votes], election_ref, models.Candidate
+    )
+    await _check_items_in_election(
+        db, [v.grade_id for v in ballot.votes], election_ref, models.Grade
+    )
+    election = schemas.ElectionGet.model_validate(db_election)
+    if len(ballot.votes) != len(election.candidates):
+        raise errors.ForbiddenError("Edit all votes at once.")
+    _check_ballot_is_consistent(election, ballot)
+
+    db_ballot = await _get_compact_ballot(db, payload)
+    candidate_ids = [c.id for c in election.candidates]
+    grade_ids = [g.id for g in election.grades]
+    former = compact.unpack(t.cast(bytes, db_ballot.grades), candidate_ids, grade_ids)
+    cast_at = db_ballot.date_modified or db_ballot.date_created
+    packed = compact.pack_ballot(ballot, election)
+    setattr(db_ballot, "grades", packed)
+    ballot_id = int(db_ballot.id)
+    for statement in timeline.uncount(election_ref, t.cast(datetime, cast_at), former):
+        await db.execute(statement)
+    await invalidation_bus.publish_async(db, election_ref)
+    await db.commit()
+    provisional.record(election_ref, _grades_of(ballot), former)
+
+    votes_get = compact.votes_get(ballot_id, packed, election)
+    return schemas.BallotGet(votes=votes_get, token=token, election=election)
+
+
+async def update_ballot(
+    db: AsyncSession, ballot: schemas.BallotUpdate, token: str
+) -> schemas.BallotGet:
+    if ballot.votes == []:
+        raise errors.BadRequestError("The ballot contains no vote")
+
+    payload = jws_verify(token)
+    election_ref = payload["election"]
+
+    db_election = await get_election(db, election_ref)
+
+    _check_election_is_not_archived(db_election)
+    _check_election_is_started(db_election)
+    _check_election_is_not_ended(db_election)
+
+    if db_election.compact_ballots:
+        return await _update_compact_ballot(db, ballot, token, payload, db_election)
+
+    vote_ids = await _vote_ids_of_ballot(db, payload)
+    if len(ballot.votes) != len(vote_ids):
+        raise errors.ForbiddenError("Edit all votes at once.")
+
+    await _check_items_in_election(
+        db, [v.candidate_id for v in ballot.votes], election_ref, models.Candidate
+    )
+    await _check_items_in_election(
+        db, [v.grade_id for v in ballot.votes], election_ref, models.Grade
+    )
+
+    db_votes = (
+        await db.execute(
+            select(models.Vote)
+            .filter(models.Vote.id.in_(vote_ids))
+            .order_by(models.Vote.id)
+        )
+    ).scalars().all()
+
+    if len(db_votes) != len(vote_ids):
+        raise errors.NotFoundError("votes")
+
+    ballot_ids = {int(v.ballot_id) for v in db_votes if v.ballot_id is not None}
+
+    if len(ballot_ids) > 1:
+        raise errors.ForbiddenError("All votes must belong to the same ballot")
+
+    election = schemas.ElectionGet.model_validate(db_election)
+
+    former = [(v.candidate_id, v.grade_id) for v in db_votes]
+    cast_at = db_votes[0].date_modified or db_votes[0].date_created
+    for vote, db_vote in zip(ballot.votes, db_votes):
+        if db_vote.election_ref != election_ref:
+            raise errors.BadRequestError("Wrong election id")
+        setattr(db_vote, "candidate_id", vote.candidate_id)
+        setattr(db_vote, "grade_id", vote.grade_id)
+        # The votes are updated by a single executemany only if they all
+        # update the same columns
+        flag_modified(db_vote, "candidate_id")
+        flag_modified(db_vote, "grade_id")
+    for statement in timeline.uncount(election_ref, t.cast(datetime, cast_at), former):
+        await db.execute(statement)
+    await invalidation_bus.publish_async(db, election_ref)
+    await db.commit()
+    provisional.record(election_ref, _grades_of(ballot), former)
+
+    votes_get = _votes_get(db_votes, election)
+    return schemas.BallotGet(votes=votes_get, token=token, election=election)
+
+
+async def get_ballot(db: AsyncSession, token: str) -> schemas.BallotGet:
+    data = jws_verify(token)
+    election_ref = data["election"]
+
+    if not data["votes"]:
+        db_election = await get_election(db, election_ref)
+        if db_election.compact_ballots:
+            return await _get_compact_ballot_get(db, data, token, db_election)
+
+    vote_ids = await _vote_ids_of_ballot(db, data)
+
+    db_votes = (
+        await db.execute(
+            select(models.Vote).filter(
+                models.Vote.id.in_((vote_ids))
+                & (models.Vote.candidate_id.is_not(None))
+                & (models.Vote.election_ref == election_ref)
+            )
+        )
+    ).scalars().all()
+
+    if len(db_votes) == 0:
+        db_election = await get_election(db, election_ref)
+        _check_election_is_not_archived(db_election)
+        # The election was packed after the token was given
+        if db_election.compact_ballots:
+            return await _get_compact_ballot_get(db, data, token, db_election)
+        raise errors.NotFoundError("votes")
+
+    election = await get_election_get(db, election_ref)
+
+    votes_get = _votes_get(db_votes, election)
+    return schemas.BallotGet(token=token, votes=votes_get, election=election)
+
+
+async def get_results(
+    db: AsyncSession, election_ref: str, token: t.Optional[str]
+) -> schemas.ResultsGet:
+    with tracing.span("load_election"):
+        db_election = await get_election(db, election_ref)
+
+    with tracing.span("validate"):
+        _check_results_are_visible(db_election, election_ref, token)
+
+    async def compute() -> schemas.ResultsGet:
+        db_res: t.Sequence[t.Any]
+        with tracing.span("load_tallies"):
+            if db_election.archived:
+                db_archive = await db.scalar(
+                    select(models.ElectionArchive).filter(
+                        models.ElectionArchive.election_ref == election_ref
+                    )
+                )
+                db_archive = _check_archive_exists(db_archive, election_ref)
+                db_res = t.cast(list[t.Any], db_archive.tallies)
+            elif db_election.compact_ballots:
+                query = compact.tallies_query(election_ref)
+                db_res = (await db.execute(query)).all()
+            else:
+                query = (
+                    select(
+                        models.Vote.candidate_id,
+                        models.Grade.value,
+                        func.count(models.Vote.id),
+                    )
+                    .join(models.Vote.grade)
+                    .join(models.Vote.candidate)
+                    .filter(models.Vote.election_ref == db_election.ref)
+                    .group_by(models.Vote.candidate_id, models.Grade.value)
+                )
+                db_res = (await db.execute(query)).all()
+        return _compute_results(db_election, db_res)
+
+    # The visibility is checked above at each request, on the current election
+    return await _results.get_or_set_async(election_ref, compute)
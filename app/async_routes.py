@@ -0,0 +1,63 @@
+"""
+Asyncio variants of the hot routes, enabled with `settings.async_db`
+"""
+import typing as t
+from fastapi import APIRouter, Depends, Header, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import async_crud, schemas
+from .database import get_async_db, replica_router
+
+router = APIRouter()
+
+
+@router.get("/elections/{election_ref}", response_model=schemas.ElectionGet)
+async def read_election_all_details(
+    election_ref: str, db: AsyncSession = Depends(get_async_db)
+):
+    if election_ref.isnumeric():
+        # Only the refs are evicted by the writes
+        return await async_crud.get_election(db, election_ref)
+    return await async_crud.get_election_get(db, election_ref)
+
+
+@router.post("/ballots", response_model=schemas.BallotGet)
+async def create_ballot(
+    ballot: schemas.BallotCreate,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+):
+    created_ballot = await async_crud.create_ballot(db=db, ballot=ballot)
+    replica_router.mark_written(response)
+    return created_ballot
+
+
+@router.put("/ballots", response_model=schemas.BallotGet)
+async def update_ballot(
+    ballot: schemas.BallotUpdate,
+    response: Response,
+    authorization: str = Header(),
+    db: AsyncSession = Depends(get_async_db),
+):
+    token = authorization.split("Bearer ")[1]
+    updated_ballot = await async_crud.update_ballot(db=db, ballot=ballot, token=token)
+    replica_router.mark_written(response)
+    return updated_ballot
+
+
+@router.get("/ballots", response_model=schemas.BallotGet)
+async def get_ballot(
+    authorization: str = Header(), db: AsyncSession = Depends(get_async_db)
+):
+    token = authorization.split("Bearer ")[1]
+    return await async_crud.get_ballot(db=db, token=token)
+
+
+@router.get("/results/{election_ref}", response_model=schemas.ResultsGet)
+async def get_results(
+    election_ref: str,
+    authorization: t.Optional[str] = Header(default=None),
+    db: AsyncSession = Depends(get_async_db),
+):
+    token = authorization.split("Bearer ")[1] if authorization else None
+    return await async_crud.get_results(db=db, token=token, election_ref=election_ref)
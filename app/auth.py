@@ -2,7 +2,7 @@ import json
 from collections.abc import Mapping
 import typing as t
 from jose import jws, JWSError
-from . import errors
+from . import errors, tracing
 from .settings import settings
 
 
@@ -11,7 +11,8 @@ def jws_verify(token: str) -> Mapping[str, t.Any]:
     Verify the content of a JWS token
     """
     try:
-        data = jws.verify(token, settings.secret, algorithms=["HS256"])
+        with tracing.span("jws_verify"):
+            data = jws.verify(token, settings.secret, algorithms=["HS256"])
     except JWSError:
         raise errors.UnauthorizedError("Can not decode token")
 
@@ -47,3 +48,15 @@ def create_admin_token(
         settings.secret,
         algorithm="HS256",
     )
+
+
+def create_operator_token() -> str:
+    """
+    Token of the operators of the instance, for the /admin routes
+    """
+    return jws.sign({"operator": True}, settings.secret, algorithm="HS256")
+
+
+def verify_operator_token(token: str):
+    if not jws_verify(token).get("operator"):
+        raise errors.ForbiddenError("Only operators can access this resource")
@@ -0,0 +1,352 @@
+"""
+Cache of the elections, results and responses.
+
+With CACHE=True, each worker keeps up to CACHE_MAX_ENTRIES entries in memory,
+the least recently used being evicted first, for CACHE_TTL seconds. With
+CACHE_URL, they are also kept in a store shared by the workers, such as Redis,
+so that a worker gets the entries computed by the others.
+
+The entries are grouped by namespace, whose keys are election refs: the writes
+of an election evict its entries through the invalidation bus (see
+app.database.InvalidationBus), from every worker and from the shared store.
+The keys hold the version of their namespace, to bump when the format of its
+values changes. Concurrent misses of a key are computed once, by the first
+request, while the others wait for its value up to CACHE_WAIT_TIMEOUT seconds.
+"""
+import asyncio
+import logging
+import threading
+import time
+import typing as t
+from collections import OrderedDict
+
+from pydantic import BaseModel
+
+from . import metrics
+from .database import invalidation_bus
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+T = t.TypeVar("T")
+
+
+class _Missing:
+    pass
+
+
+MISSING = _Missing()
+
+
+class MemoryBackend:
+    """
+    Entries of a worker, evicted by least recent use beyond max_entries
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, t.Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> t.Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return MISSING
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: t.Any, ttl: float) -> list[str]:
+        """
+        Store a value, and return the keys evicted to make room for it
+        """
+        evicted = []
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False)[0])
+        return evicted
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SharedBackend:
+    """
+    Entries shared by the workers, through a client with the get, set and
+    delete of redis.Redis, which evicts them itself
+    """
+
+    def __init__(self, client: t.Any):
+        self.client = client
+
+    @classmethod
+    def from_url(cls, url: str) -> "SharedBackend":
+        # Only the deployments with a shared store need the redis package
+        import redis
+
+        return cls(redis.Redis.from_url(url))
+
+    def get(self, key: str) -> bytes | None:
+        return self.client.get(key)
+
+    def set(self, key: str, data: bytes, ttl: float):
+        self.client.set(key, data, px=max(1, int(ttl * 1000)))
+
+    def delete(self, key: str):
+        self.client.delete(key)
+
+
+class _Flight:
+    """
+    Computation of a missing value, which the concurrent requests wait for
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: t.Any = None
+        self.error: BaseException | None = None
+
+
+class Namespace(t.Generic[T]):
+    """
+    Entries of the same kind, keyed by election ref. The values are pydantic
+    models, serialized as JSON in the shared store, or bytes.
+    """
+
+    def __init__(
+        self,
+        cache: "Cache",
+        name: str,
+        model: type[BaseModel] | None = None,
+        version: int = 1,
+    ):
+        self.cache = cache
+        self.name = name
+        self.model = model
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._flights: dict[str, _Flight] = {}
+        # Computations of the asyncio stack, in the event loop of the worker
+        self._async_flights: dict[str, asyncio.Future[T]] = {}
+        self._lock = threading.Lock()
+
+    def key(self, election_ref: str) -> str:
+        return f"{self.name}:v{self.version}:{election_ref}"
+
+    def get(self, election_ref: str) -> T | None:
+        value = self._get(self.key(election_ref))
+        self._count(hit=value is not MISSING)
+        return None if value is MISSING else value
+
+    def set(self, election_ref: str, value: T):
+        key = self.key(election_ref)
+        self.cache.evicted(self.cache.local.set(key, value, settings.cache_ttl))
+        if self.cache.shared is not None:
+            if self.model:
+                data = t.cast(BaseModel, value).model_dump_json().encode()
+            else:
+                data = t.cast(bytes, value)
+            try:
+                self.cache.shared.set(key, data, settings.cache_ttl)
+            except Exception as e:
+                logger.warning("Writing %s to the shared cache failed: %s", key, e)
+
+    def delete(self, election_ref: str):
+        key = self.key(election_ref)
+        self.cache.local.delete(key)
+        if self.cache.shared is not None:
+            try:
+                self.cache.shared.delete(key)
+            except Exception as e:
+                logger.warning("Deleting %s from the shared cache failed: %s", key, e)
+
+    def get_or_set(self, election_ref: str, compute: t.Callable[[], T]) -> T:
+        """
+        Get a value, computing it once for the concurrent requests when missing
+        """
+        if not settings.cache:
+            return compute()
+
+        key = self.key(election_ref)
+        value = self._get(key)
+        if value is not MISSING:
+            self._count(hit=True)
+            return value
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        flight = t.cast(_Flight, flight)
+        if not leader:
+            if not flight.done.wait(settings.cache_wait_timeout):
+                # The leader is stuck: do not pile up behind it
+                self._count(hit=False)
+                return compute()
+            self._count(hit=True)
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        self._count(hit=False)
+        generation = invalidation_bus.generation(election_ref)
+        try:
+            flight.value = compute()
+            # Unless the election was written meanwhile
+            if invalidation_bus.generation(election_ref) == generation:
+                self.set(election_ref, flight.value)
+            return flight.value
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    async def get_or_set_async(
+        self, election_ref: str, compute: t.Callable[[], t.Awaitable[T]]
+    ) -> T:
+        """
+        Variant of get_or_set for the asyncio stack
+        """
+        if not settings.cache:
+            return await compute()
+
+        key = self.key(election_ref)
+        value = await self._run(self._get, key)
+        if value is not MISSING:
+            self._count(hit=True)
+            return value
+
+        flight = self._async_flights.get(key)
+        if flight is not None:
+            try:
+                value = await asyncio.wait_for(
+                    asyncio.shield(flight), settings.cache_wait_timeout
+                )
+            except asyncio.TimeoutError:
+                # The leader is stuck: do not pile up behind it
+                self._count(hit=False)
+                return await compute()
+            except asyncio.CancelledError:
+                if not flight.cancelled():
+                    raise
+                # The request of the leader was cancelled
+                self._count(hit=False)
+                return await compute()
+            self._count(hit=True)
+            return value
+
+        flight = self._async_flights[key] = asyncio.get_running_loop().create_future()
+        self._count(hit=False)
+        generation = invalidation_bus.generation(election_ref)
+        try:
+            value = await compute()
+            # Unless the election was written meanwhile
+            if invalidation_bus.generation(election_ref) == generation:
+                await self._run(self.set, election_ref, value)
+            flight.set_result(value)
+            return value
+        except Exception as e:
+            flight.set_exception(e)
+            # Retrieved, so that asyncio does not log it when nobody waits
+            flight.exception()
+            raise
+        finally:
+            del self._async_flights[key]
+            # Without a value, e.g. when the leader is cancelled, the others
+            # compute it themselves
+            flight.cancel()
+
+    async def _run(self, function: t.Callable[..., t.Any], *args: t.Any) -> t.Any:
+        if self.cache.shared is None:
+            return function(*args)
+        # The client of the shared store blocks
+        return await asyncio.to_thread(function, *args)
+
+    def _get(self, key: str) -> t.Any:
+        value = self.cache.local.get(key)
+        if value is not MISSING or self.cache.shared is None:
+            return value
+        try:
+            data = self.cache.shared.get(key)
+        except Exception as e:
+            logger.warning("Reading %s from the shared cache failed: %s", key, e)
+            return MISSING
+        if data is None:
+            return MISSING
+        value = self.model.model_validate_json(data) if self.model else data
+        self.cache.evicted(self.cache.local.set(key, value, settings.cache_ttl))
+        return value
+
+    def _count(self, hit: bool):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        metrics.record_cache_access(self.name, hit)
+
+
+class Cache:
+    def __init__(self, local: MemoryBackend, shared: SharedBackend | None = None):
+        self.local = local
+        self.shared = shared
+        self.namespaces: dict[str, Namespace[t.Any]] = {}
+
+    def namespace(
+        self, name: str, model: type[BaseModel] | None = None, version: int = 1
+    ) -> Namespace[t.Any]:
+        namespace: Namespace[t.Any] = Namespace(self, name, model, version)
+        self.namespaces[name] = namespace
+        return namespace
+
+    def invalidate(self, election_ref: str | None, version: int | None = None):
+        """
+        Evict the entries of an election, or every local entry
+        """
+        if election_ref is None:
+            self.local.clear()
+            return
+        for namespace in self.namespaces.values():
+            namespace.delete(election_ref)
+
+    def evicted(self, keys: list[str]):
+        for key in keys:
+            namespace = self.namespaces.get(key.split(":", 1)[0])
+            if namespace is not None:
+                namespace.evictions += 1
+                metrics.record_cache_eviction(namespace.name)
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        return {
+            name: {
+                "hits": namespace.hits,
+                "misses": namespace.misses,
+                "evictions": namespace.evictions,
+            }
+            for name, namespace in self.namespaces.items()
+        }
+
+
+cache = Cache(
+    MemoryBackend(settings.cache_max_entries),
+    SharedBackend.from_url(settings.cache_url) if settings.cache_url else None,
+)
+invalidation_bus.subscribe(cache.invalidate)
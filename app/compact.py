@@ -0,0 +1,285 @@
+"""
+Compact storage of the ballots: one row per ballot with a packed grade vector.
+
+In an election with `compact_ballots`, the ballots have no `votes` rows:
+`ballots.grades` holds one byte per candidate, ordered by candidate id, which is
+the 1-based position of its grade among the grades ordered by id, or 0 without
+grade. It is NULL until the voter of an invite votes. A candidate added later
+falls beyond the end of the older ballots, which is read as no grade, as its
+missing votes would be.
+
+This saves the timestamps, the foreign keys and the index entries of one row
+per candidate. The `ballot_votes` view unpacks the ballots into the rows of
+votes, and `pack_election` and `unpack_election` convert an election between
+the two layouts. The tokens of the voters remain valid, since they hold the id
+of their ballot.
+"""
+import typing as t
+from sqlalchemy import Select, bindparam, delete, func, insert, select, update
+from sqlalchemy.orm import Session
+from . import errors, models, schemas
+
+BATCH_SIZE = 10_000
+
+
+def pack(
+    votes: t.Iterable[tuple[int, int | None]],
+    candidate_ids: t.Sequence[int],
+    grade_ids: t.Sequence[int],
+) -> bytes:
+    """
+    Pack the (candidate id, grade id) of a ballot, given the ids of the
+    candidates and grades of its election
+    """
+    candidates = {c: i for i, c in enumerate(sorted(candidate_ids))}
+    grades = {grade_id: i + 1 for i, grade_id in enumerate(sorted(grade_ids))}
+    packed = bytearray(len(candidates))
+    for candidate_id, grade_id in votes:
+        if grade_id is not None:
+            packed[candidates[candidate_id]] = grades[grade_id]
+    return bytes(packed)
+
+
+def unpack(
+    packed: bytes | None, candidate_ids: t.Sequence[int], grade_ids: t.Sequence[int]
+) -> list[tuple[int, int]]:
+    """
+    List the (candidate id, grade id) of the grades of a packed ballot
+    """
+    if packed is None:
+        return []
+    grades = sorted(grade_ids)
+    return [
+        (candidate_id, grades[position - 1])
+        for candidate_id, position in zip(sorted(candidate_ids), packed)
+        if position > 0
+    ]
+
+
+def pack_ballot(
+    ballot: schemas.BallotCreate | schemas.BallotUpdate, election: schemas.ElectionGet
+) -> bytes:
+    return pack(
+        [(v.candidate_id, v.grade_id) for v in ballot.votes],
+        [c.id for c in election.candidates],
+        [g.id for g in election.grades],
+    )
+
+
+def votes_get(
+    ballot_id: int, packed: bytes | None, election: schemas.ElectionGet
+) -> list[schemas.VoteGet]:
+    """
+    Serialize the grades of a ballot as votes, whose id is the one of the ballot
+    """
+    candidates = {c.id: c for c in election.candidates}
+    grades = {g.id: g for g in election.grades}
+    return [
+        schemas.VoteGet(
+            id=ballot_id,
+            election_ref=election.ref,
+            candidate=candidates[candidate_id],
+            grade=grades[grade_id],
+        )
+        for candidate_id, grade_id in unpack(packed, list(candidates), list(grades))
+    ]
+
+
+def tallies_query(election_ref: str) -> Select[tuple[int, int, int]]:
+    """
+    Count the grades of an election by candidate and grade value
+    """
+    view = models.ballot_votes
+    return (
+        select(view.c.candidate_id, models.Grade.value, func.count())
+        .join(models.Grade, models.Grade.id == view.c.grade_id)
+        .filter(view.c.election_ref == election_ref)
+        .group_by(view.c.candidate_id, models.Grade.value)
+    )
+
+
+def progress_query(election_ref: str) -> Select[tuple[int, int]]:
+    """
+    Count the ballots of an election, and those with grades
+    """
+    return select(
+        func.count(models.Ballot.id), func.count(models.Ballot.grades)
+    ).filter(models.Ballot.election_ref == election_ref)
+
+
+def sorted_ids(db_election: models.Election) -> tuple[list[int], list[int]]:
+    """
+    Provide the ids of the candidates and of the grades, in the order of packing
+    """
+    return (
+        sorted(int(c.id) for c in db_election.candidates),
+        sorted(int(g.id) for g in db_election.grades),
+    )
+
+
+def get_hot_election(db: Session, election_ref: str) -> models.Election:
+    """
+    Load an election whose ballots are in the hot tables
+    """
+    db_election = db.scalars(
+        select(models.Election).filter(models.Election.ref == election_ref)
+    ).first()
+    if db_election is None:
+        raise errors.NotFoundError("elections")
+    if db_election.archived:
+        raise errors.ElectionArchivedError(
+            "The ballots of this election have been archived"
+        )
+    return db_election
+
+
+def pack_election(db: Session, election_ref: str) -> int:
+    """
+    Move the votes of an election into the grades of its ballots.
+    Return the number of packed ballots.
+    """
+    db_election = get_hot_election(db, election_ref)
+    if db_election.compact_ballots:
+        raise errors.BadRequestError("The ballots of this election are compact")
+
+    candidate_ids, grade_ids = sorted_ids(db_election)
+    num_orphans = db.scalar(
+        select(func.count(models.Vote.id)).filter(
+            (models.Vote.election_ref == election_ref)
+            & models.Vote.ballot_id.is_(None)
+        )
+    )
+    if num_orphans:
+        raise errors.BadRequestError(
+            "Votes without ballot, from the former API, can not be packed"
+        )
+
+    date_cast = func.coalesce(models.Vote.date_modified, models.Vote.date_created)
+    rows = db.execute(
+        select(
+            models.Vote.ballot_id,
+            models.Vote.candidate_id,
+            models.Vote.grade_id,
+            date_cast,
+        )
+        .filter(models.Vote.election_ref == election_ref)
+        .order_by(models.Vote.ballot_id)
+        .execution_options(yield_per=BATCH_SIZE)
+    )
+    # Ballots are written by executemany, in batches. They keep the date of their
+    # votes, rather than the date of the packing, for the timeline.
+    statement = (
+        update(models.Ballot.__table__)
+        .where(models.Ballot.__table__.c.id == bindparam("ballot_id"))
+        .values(grades=bindparam("packed"), date_modified=bindparam("date_cast"))
+    )
+
+    def flush(batch: list[dict[str, t.Any]]):
+        if batch:
+            db.execute(statement, batch)
+            batch.clear()
+
+    def packed(
+        ballot_id: int, votes: list[tuple[int, int | None]], dates: list[t.Any]
+    ) -> dict[str, t.Any]:
+        return {
+            "ballot_id": ballot_id,
+            "packed": pack(votes, candidate_ids, grade_ids),
+            "date_cast": max(dates),
+        }
+
+    num_ballots = 0
+    batch: list[dict[str, t.Any]] = []
+    current = None
+    votes: list[tuple[int, int | None]] = []
+    dates: list[t.Any] = []
+    try:
+        for ballot_id, candidate_id, grade_id, date in rows:
+            if ballot_id != current:
+                # The invites that did not vote keep NULL grades
+                if current is not None and votes:
+                    batch.append(packed(current, votes, dates))
+                current, votes, dates = ballot_id, [], []
+            if candidate_id is not None and grade_id is not None:
+                votes.append((candidate_id, grade_id))
+                dates.append(date)
+            if len(batch) >= BATCH_SIZE:
+                num_ballots += len(batch)
+                flush(batch)
+        if current is not None and votes:
+            batch.append(packed(current, votes, dates))
+        num_ballots += len(batch)
+        flush(batch)
+
+        db.execute(delete(models.Vote).where(models.Vote.election_ref == election_ref))
+        setattr(db_election, "compact_ballots", True)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise e
+
+    return num_ballots
+
+
+def unpack_election(db: Session, election_ref: str) -> int:
+    """
+    Write the grades of the ballots of an election back as votes.
+    Return the number of created votes.
+    """
+    db_election = get_hot_election(db, election_ref)
+    if not db_election.compact_ballots:
+        raise errors.BadRequestError("The ballots of the election are not compact")
+
+    candidate_ids, grade_ids = sorted_ids(db_election)
+    rows = db.execute(
+        select(
+            models.Ballot.id,
+            models.Ballot.grades,
+            models.Ballot.date_created,
+            models.Ballot.date_modified,
+        )
+        .filter(models.Ballot.election_ref == election_ref)
+        .order_by(models.Ballot.id)
+        .execution_options(yield_per=BATCH_SIZE)
+    )
+
+    num_votes = 0
+    votes: list[dict[str, t.Any]] = []
+    try:
+        for ballot_id, packed, date_created, date_modified in rows:
+            if packed is None:
+                # An invite that did not vote has votes without grades
+                grades = [(None, None)] * len(candidate_ids)
+            else:
+                grades = unpack(packed, candidate_ids, grade_ids)  # type: ignore
+            votes.extend(
+                {
+                    "election_ref": election_ref,
+                    "ballot_id": ballot_id,
+                    "candidate_id": candidate_id,
+                    "grade_id": grade_id,
+                    "date_created": date_created,
+                    "date_modified": date_modified,
+                }
+                for candidate_id, grade_id in grades
+            )
+            if len(votes) >= BATCH_SIZE:
+                db.execute(insert(models.Vote), votes)
+                num_votes += len(votes)
+                votes = []
+        if votes:
+            db.execute(insert(models.Vote), votes)
+            num_votes += len(votes)
+
+        db.execute(
+            update(models.Ballot)
+            .where(models.Ballot.election_ref == election_ref)
+            .values(grades=None)
+        )
+        setattr(db_election, "compact_ballots", False)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise e
+
+    return num_votes
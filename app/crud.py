@@ -3,11 +3,14 @@ import random
 import string
 from collections import defaultdict
 import typing as t
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from majority_judgment import majority_judgment
-from . import models, schemas, errors
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm.attributes import flag_modified
+from sqlalchemy import func, insert
+from . import compact, models, provisional, schemas, errors, timeline, tracing
 from .auth import create_ballot_token, create_admin_token, jws_verify
+from .cache import Namespace, cache
+from .database import invalidation_bus, primary_session
+from .settings import settings
 
 
 def get_election(db: Session, election_ref_or_id: str):
@@ -23,18 +26,62 @@ def get_election(db: Session, election_ref_or_id: str):
             models.Election.ref == election_ref_or_id
         )
 
-    if elections.count() > 1:
+    # A single query tells both whether the election exists and is unique
+    db_elections = elections.limit(2).all()
+
+    if len(db_elections) > 1:
         raise errors.InconsistentDatabaseError(
             "elections",
             f"Several elections have the same primary keys {election_ref_or_id}",
         )
 
-    if elections.count() == 1:
-        return elections.first()
+    if len(db_elections) == 1:
+        return db_elections[0]
 
     raise errors.NotFoundError("elections")
 
 
+_elections: Namespace[schemas.ElectionGet] = cache.namespace(
+    "elections", schemas.ElectionGet
+)
+_results: Namespace[schemas.ResultsGet] = cache.namespace("results", schemas.ResultsGet)
+
+
+T = t.TypeVar("T")
+
+
+def _get_or_set(
+    namespace: Namespace[T],
+    db: Session,
+    election_ref: str,
+    compute: t.Callable[[Session], T],
+) -> T:
+    """
+    Get a value from the cache. A missing value is computed from the primary,
+    since a lagging replica would keep a stale value in the cache.
+    """
+    if not settings.cache:
+        return compute(db)
+
+    def compute_from_primary() -> T:
+        with primary_session(db) as primary_db:
+            return compute(primary_db)
+
+    return namespace.get_or_set(election_ref, compute_from_primary)
+
+
+def get_election_get(db: Session, election_ref: str) -> schemas.ElectionGet:
+    """
+    Serialize an election given its ref, from the cache when possible
+    """
+    return _get_or_set(
+        _elections,
+        db,
+        election_ref,
+        lambda db: schemas.ElectionGet.model_validate(get_election(db, election_ref)),
+    )
+
+
 def get_progress(db: Session, election_ref: str, token: str) -> schemas.Progress:
     """
     Load an election given its ID or its ref
@@ -50,24 +97,46 @@ def get_progress(db: Session, election_ref: str, token: str) -> schemas.Progress
     if not payload.get("admin"):
         raise errors.ForbiddenError("You are not allowed to manage the election")
 
+    db_election = get_election(db, election_ref)
+    if db_election.archived:
+        db_archive = get_archive(db, election_ref)
+        return schemas.Progress(
+            num_voters=int(str(db_archive.num_voters)),
+            num_voters_voted=int(str(db_archive.num_voters_voted)),
+        )
+
+    num_voters, num_voters_voted = count_voters(db, db_election)
+    return schemas.Progress(
+        num_voters=num_voters,
+        num_voters_voted=num_voters_voted,
+    )
+
+
+def count_voters(db: Session, db_election: models.Election) -> tuple[int, int]:
+    """
+    Count the voters of an election, and those who voted
+    """
+    election_ref = str(db_election.ref)
+    if db_election.compact_ballots:
+        num_ballots, num_ballots_voted = db.execute(
+            compact.progress_query(election_ref)
+        ).one()
+        return num_ballots, num_ballots_voted
+
     # Votes are provided for each candidate and each voter
     votes = db.query(models.Vote).filter(models.Vote.election_ref == election_ref)
     candidates = db.query(models.Candidate).filter(
         models.Candidate.election_ref == election_ref
     )
 
-    num_votes = votes.count()
-    num_candidates = candidates.count()
-    num_voters = num_votes // num_candidates
+    num_candidates = max(candidates.count(), 1)
+    num_voters = votes.count() // num_candidates
 
     # Get number of voters who have voted (their grade is not null)
     voters_voted = votes.filter(models.Vote.grade != None)
     num_voters_voted = voters_voted.count() // num_candidates
 
-    return schemas.Progress(
-        num_voters=num_voters,
-        num_voters_voted=num_voters_voted,
-    )
+    return num_voters, num_voters_voted
 
 
 def create_candidate(
@@ -183,7 +252,7 @@ def _create_election_without_candidates_or_grade(
                 "The start date must be before the end date of the election"
             )
 
-    db_election = models.Election(**params)
+    db_election = models.Election(**params, compact_ballots=settings.compact_ballots)
     db.add(db_election)
 
     # Generate a unique ref to the election
@@ -216,37 +285,50 @@ def create_invite_tokens(
     if num_voters <= 0:
         return []
         
-    _check_election_is_not_ended(get_election(db, election_ref))
+    db_election = get_election(db, election_ref)
+    _check_election_is_not_ended(db_election)
     now = datetime.now()
     params = {"date_created": now, "date_modified": now, "election_ref": election_ref}
 
+    # Batched INSERT ... RETURNING: a few statements whatever the number of
+    # voters. The rows are matched by their ballot_id rather than by the order
+    # of the parameters, which SQLite can only keep by inserting row by row.
     try:
-        db_ballots = [models.Ballot(election_ref=election_ref) for _ in range(num_voters)]
-        db.bulk_save_objects(db_ballots, return_defaults=True)
-
-        db_votes = []
+        ballot_ids = list(
+            db.scalars(
+                insert(models.Ballot).returning(models.Ballot.id),
+                [{"election_ref": election_ref} for _ in range(num_voters)],
+            )
+        )
 
-        for ballot in db_ballots:
-            for _ in range(num_candidates):
-                db_votes.append(models.Vote(**params, ballot_id=ballot.id))
-        
-        db.bulk_save_objects(db_votes, return_defaults=True)
+        if db_election.compact_ballots:
+            # The grades of the ballots are NULL until their voter votes
+            db.commit()
+            return [
+                create_ballot_token([], election_ref, ballot_id)
+                for ballot_id in ballot_ids
+            ]
+
+        db_votes = db.execute(
+            insert(models.Vote).returning(models.Vote.ballot_id, models.Vote.id),
+            [
+                {**params, "ballot_id": ballot_id}
+                for ballot_id in ballot_ids
+                for _ in range(num_candidates)
+            ],
+        )
+        vote_ids: dict[int, list[int]] = {ballot_id: [] for ballot_id in ballot_ids}
+        for ballot_id, vote_id in db_votes:
+            vote_ids[ballot_id].append(vote_id)
         db.commit()
     except Exception as e:
         db.rollback()
         raise e
-    
-    tokens = []
-    vote_ids = [int(str(v.id)) for v in db_votes]
-
-    for i, ballot in enumerate(db_ballots):
-        start = i * num_candidates
-        end = start + num_candidates
-        tokens.append(
-            create_ballot_token(vote_ids[start:end], election_ref, int(str(ballot.id)))
-        )
 
-    return tokens
+    return [
+        create_ballot_token(vote_ids[ballot_id], election_ref, ballot_id)
+        for ballot_id in ballot_ids
+    ]
 
 
 def generate_election_ref(length: int = 10):
@@ -260,7 +342,7 @@ def _check_if_ref_exists(db: Session, ref: str):
 
 def create_election(
     db: Session, election: schemas.ElectionCreate
-) -> schemas.ElectionGet:
+) -> schemas.ElectionCreatedGet:
     # We create first the election
     # without candidates and grades
     db_election = _create_election_without_candidates_or_grade(db, election, True)
@@ -316,6 +398,8 @@ def update_election(
     if db_election is None:
         raise errors.NotFoundError("elections")
 
+    _check_election_is_not_archived(db_election)
+
     if election.date_start is not None and election.date_end is None and db_election.date_end is not None:
         if schemas.parse_date(election.date_start) > schemas.parse_date(db_election.date_end):
             raise errors.InvalidDateError(
@@ -342,12 +426,19 @@ def update_election(
             "You can't invite voters on a non-restricted election"
         )
 
-    # Create new candidates (those whose Id is None)
+    # Create new candidates (those whose Id is None). They are committed with
+    # the rest of the update, which is published at once.
     if election.candidates is not None:
-        for candidate in election.candidates:
-            if candidate.id is None:
-                db_candidate = create_candidate(db, candidate, election_ref, True)
-                candidate.id = int(str(db_candidate.id))
+        new_candidates = [
+            (candidate, create_candidate(db, candidate, election_ref))
+            for candidate in election.candidates
+            if candidate.id is None
+        ]
+        if new_candidates:
+            db.flush()
+            db.expire(db_election, ["candidates"])
+        for candidate, db_candidate in new_candidates:
+            candidate.id = int(str(db_candidate.id))
 
         # Check that candidates look fine
         candidate_ids = {c.id for c in election.candidates}
@@ -370,10 +461,7 @@ def update_election(
     # Check if start_date is being changed
     if election.date_start is not None and schemas.parse_date(db_election.date_start) != schemas.parse_date(election.date_start):
         # If so, check if any votes have been cast
-        num_votes_cast = db.query(models.Vote).filter(
-            models.Vote.election_ref == election_ref,
-            models.Vote.grade_id.is_not(None)
-        ).count()
+        _, num_votes_cast = count_voters(db, db_election)
         if num_votes_cast > 0:
             raise errors.ElectionIsActiveError("Cannot change the start date of an election that already has votes.")
 
@@ -391,6 +479,7 @@ def update_election(
         if getattr(db_election, key) != getattr(election, key):
             setattr(db_election, key, getattr(election, key))
 
+    invalidation_bus.publish(db, election_ref)
     db.commit()
     db.refresh(db_election)
 
@@ -404,8 +493,14 @@ def update_election(
     return updated_election
 
 
+def _grades_of(
+    ballot: schemas.BallotCreate | schemas.BallotUpdate,
+) -> list[tuple[int, int]]:
+    return [(v.candidate_id, v.grade_id) for v in ballot.votes]
+
+
 def _check_ballot_is_consistent(
-    election: schemas.ElectionGet, ballot: schemas.BallotCreate
+    election: schemas.ElectionGet, ballot: schemas.BallotCreate | schemas.BallotUpdate
 ):
     votes_by_candidate = {
         c.id: [v for v in ballot.votes if v.candidate_id == c.id]
@@ -419,49 +514,141 @@ def create_ballot(db: Session, ballot: schemas.BallotCreate) -> schemas.BallotGe
     if ballot.votes == []:
         raise errors.ForbiddenError("The ballot contains no vote")
 
-    db_election = _check_public_election(db, ballot.election_ref)
-    election = schemas.ElectionGet.model_validate(db_election)
+    with tracing.span("load_election"):
+        db_election = _check_public_election(db, ballot.election_ref)
+        election = get_election_get(db, str(db_election.ref))
 
-    _check_election_is_started(db_election)
-    _check_election_is_not_ended(db_election)
+    with tracing.span("validate"):
+        _check_election_is_started(db_election)
+        _check_election_is_not_ended(db_election)
 
-    _check_items_in_election(
-        db,
-        [v.candidate_id for v in ballot.votes],
-        ballot.election_ref,
-        models.Candidate,
-    )
-    _check_items_in_election(
-        db, [v.grade_id for v in ballot.votes], ballot.election_ref, models.Grade
-    )
-    _check_ballot_is_consistent(election, ballot)
+        _check_items_in_election(
+            db,
+            [v.candidate_id for v in ballot.votes],
+            ballot.election_ref,
+            models.Candidate,
+        )
+        _check_items_in_election(
+            db, [v.grade_id for v in ballot.votes], ballot.election_ref, models.Grade
+        )
+        _check_ballot_is_consistent(election, ballot)
+
+    if db_election.compact_ballots:
+        return _create_compact_ballot(db, ballot, election)
 
     try:
-        db_ballot = models.Ballot(election_ref=ballot.election_ref)
-        db.add(db_ballot)
-        db.flush()
-
-        # Create votes and associate them with the ballot
-        db_votes = [
-            models.Vote(**v.model_dump(), election_ref=ballot.election_ref, ballot_id=db_ballot.id) 
-            for v in ballot.votes
-        ]
-        db.add_all(db_votes)
-        db.commit()
-        db.refresh(db_ballot)
+        with tracing.span("write", votes=len(ballot.votes)):
+            db_ballot = models.Ballot(election_ref=ballot.election_ref)
+            db.add(db_ballot)
+            db.flush()
+
+            # Create votes and associate them with the ballot
+            db_votes = [
+                models.Vote(**v.model_dump(), election_ref=ballot.election_ref, ballot_id=db_ballot.id) 
+                for v in ballot.votes
+            ]
+            db.add_all(db_votes)
+            db.flush()
+
+        with tracing.span("serialize"):
+            # Serialize before the commit expires the objects: the candidates and
+            # grades are still in the session, instead of one query per vote.
+            votes_get = [schemas.VoteGet.model_validate(v) for v in db_votes]
+            ballot_id = int(db_ballot.id)
+
+        invalidation_bus.publish(db, ballot.election_ref)
+        with tracing.span("commit"):
+            db.commit()
+    except Exception as e:
+        db.rollback()
+        raise e
+    provisional.record(ballot.election_ref, _grades_of(ballot))
 
-        for v in db_votes:
-            db.refresh(v)
+    with tracing.span("sign_token"):
+        vote_ids = [v.id for v in votes_get]
+        token = create_ballot_token(vote_ids, ballot.election_ref, ballot_id)
+    return schemas.BallotGet(votes=votes_get, token=token, election=election)
+
+
+def _create_compact_ballot(
+    db: Session, ballot: schemas.BallotCreate, election: schemas.ElectionGet
+) -> schemas.BallotGet:
+    try:
+        with tracing.span("write", votes=len(ballot.votes)):
+            packed = compact.pack_ballot(ballot, election)
+            db_ballot = models.Ballot(election_ref=ballot.election_ref, grades=packed)
+            db.add(db_ballot)
+            db.flush()
+            ballot_id = int(db_ballot.id)
+
+        invalidation_bus.publish(db, ballot.election_ref)
+        with tracing.span("commit"):
+            db.commit()
     except Exception as e:
         db.rollback()
         raise e
+    provisional.record(ballot.election_ref, _grades_of(ballot))
 
-    votes_get = [schemas.VoteGet.model_validate(v) for v in db_votes]
-    vote_ids = [v.id for v in votes_get]
-    token = create_ballot_token(vote_ids, ballot.election_ref, int(db_ballot.id))
+    with tracing.span("serialize"):
+        votes_get = compact.votes_get(ballot_id, packed, election)
+
+    with tracing.span("sign_token"):
+        token = create_ballot_token([], ballot.election_ref, ballot_id)
     return schemas.BallotGet(votes=votes_get, token=token, election=election)
 
 
+def _get_compact_ballot(
+    db: Session, payload: t.Mapping[str, t.Any]
+) -> models.Ballot:
+    """
+    Load the ballot of a token, in an election with compact ballots
+    """
+    db_ballot = None
+    if payload.get("ballot") is not None:
+        db_ballot = (
+            db.query(models.Ballot)
+            .filter(
+                (models.Ballot.id == payload["ballot"])
+                & (models.Ballot.election_ref == payload["election"])
+            )
+            .first()
+        )
+    if db_ballot is None:
+        raise errors.NotFoundError("ballots")
+    return db_ballot
+
+
+def _get_compact_ballot_get(
+    db: Session,
+    payload: t.Mapping[str, t.Any],
+    token: str,
+    db_election: models.Election,
+) -> schemas.BallotGet:
+    db_ballot = _get_compact_ballot(db, payload)
+    if db_ballot.grades is None:
+        raise errors.NotFoundError("votes")
+    election = get_election_get(db, str(db_election.ref))
+    votes_get = compact.votes_get(
+        int(db_ballot.id), t.cast(bytes, db_ballot.grades), election
+    )
+    return schemas.BallotGet(token=token, votes=votes_get, election=election)
+
+
+def _vote_ids_of_ballot(db: Session, payload: t.Mapping[str, t.Any]) -> list[int]:
+    """
+    Provide the votes of a token. Tokens given in an election with compact
+    ballots only hold the id of their ballot.
+    """
+    if payload["votes"] or payload.get("ballot") is None:
+        return list(set(payload["votes"]))
+
+    vote_ids = db.query(models.Vote.id).filter(
+        (models.Vote.ballot_id == payload["ballot"])
+        & (models.Vote.election_ref == payload["election"])
+    )
+    return [vote_id for vote_id, in vote_ids]
+
+
 def _check_public_election(db: Session, election_ref: str):
     # Check if the election is open
     db_election = get_election(db, election_ref)
@@ -520,7 +707,6 @@ def update_ballot(
 
     payload = jws_verify(token)
     election_ref = payload["election"]
-    vote_ids: list[int] = list(set(payload["votes"]))
 
     # Check if the election exists
     db_election = get_election(db, election_ref)
@@ -528,9 +714,14 @@ def update_ballot(
     if db_election is None:
         raise errors.NotFoundError("elections")
 
+    _check_election_is_not_archived(db_election)
     _check_election_is_started(db_election)
     _check_election_is_not_ended(db_election)
 
+    if db_election.compact_ballots:
+        return _update_compact_ballot(db, ballot, token, payload, db_election)
+
+    vote_ids = _vote_ids_of_ballot(db, payload)
     if len(ballot.votes) != len(vote_ids):
         raise errors.ForbiddenError("Edit all votes at once.")
 
@@ -541,7 +732,6 @@ def update_ballot(
         db, [v.grade_id for v in ballot.votes], election_ref, models.Grade
     )
 
-    # TODO Can we optimize it with a bulk update?
     db_votes = (
         db.query(models.Vote)
         .filter(
@@ -560,46 +750,224 @@ def update_ballot(
         raise errors.ForbiddenError("All votes must belong to the same ballot")
 
     # old API does not contains ballot id in the token
-    election = schemas.ElectionGet.model_validate(db_votes[0].election)
+    election = get_election_get(db, str(db_election.ref))
 
+    former = [(v.candidate_id, v.grade_id) for v in db_votes]
+    cast_at = db_votes[0].date_modified or db_votes[0].date_created
     for vote, db_vote in zip(ballot.votes, db_votes):
         if db_vote.election_ref != election_ref:
             raise errors.BadRequestError("Wrong election id")
         setattr(db_vote, "candidate_id", vote.candidate_id)
         setattr(db_vote, "grade_id", vote.grade_id)
+        # The votes are updated by a single executemany only if they all
+        # update the same columns
+        flag_modified(db_vote, "candidate_id")
+        flag_modified(db_vote, "grade_id")
+    db.flush()
+    for statement in timeline.uncount(election_ref, t.cast(datetime, cast_at), former):
+        db.execute(statement)
+
+    # Serialize before the commit expires the votes, see create_ballot
+    votes_get = [schemas.VoteGet.model_validate(v) for v in db_votes]
+    invalidation_bus.publish(db, election_ref)
     db.commit()
+    provisional.record(election_ref, _grades_of(ballot), former)
 
-    votes_get = [schemas.VoteGet.model_validate(v) for v in db_votes]
+    return schemas.BallotGet(votes=votes_get, token=token, election=election)
+
+
+def _update_compact_ballot(
+    db: Session,
+    ballot: schemas.BallotUpdate,
+    token: str,
+    payload: t.Mapping[str, t.Any],
+    db_election: models.Election,
+) -> schemas.BallotGet:
+    election_ref = str(db_election.ref)
+    _check_items_in_election(
+        db, [v.candidate_id for v in ballot.votes], election_ref, models.Candidate
+    )
+    _check_items_in_election(
+        db, [v.grade_id for v in ballot.votes], election_ref, models.Grade
+    )
+    election = get_election_get(db, election_ref)
+    if len(ballot.votes) != len(election.candidates):
+        raise errors.ForbiddenError("Edit all votes at once.")
+    _check_ballot_is_consistent(election, ballot)
+
+    db_ballot = _get_compact_ballot(db, payload)
+    candidate_ids = [c.id for c in election.candidates]
+    grade_ids = [g.id for g in election.grades]
+    former = compact.unpack(t.cast(bytes, db_ballot.grades), candidate_ids, grade_ids)
+    cast_at = db_ballot.date_modified or db_ballot.date_created
+    packed = compact.pack_ballot(ballot, election)
+    setattr(db_ballot, "grades", packed)
+    ballot_id = int(db_ballot.id)
+    for statement in timeline.uncount(election_ref, t.cast(datetime, cast_at), former):
+        db.execute(statement)
+    invalidation_bus.publish(db, election_ref)
+    db.commit()
+    provisional.record(election_ref, _grades_of(ballot), former)
+
+    votes_get = compact.votes_get(ballot_id, packed, election)
     return schemas.BallotGet(votes=votes_get, token=token, election=election)
 
 
 def get_ballot(db: Session, token: str) -> schemas.BallotGet:
     data = jws_verify(token)
-    vote_ids = data["votes"]
     election_ref = data["election"]
 
-    votes = db.query(models.Vote).filter(
-        models.Vote.id.in_((vote_ids))
-        & (models.Vote.candidate_id.is_not(None))
-        & (models.Vote.election_ref == election_ref)
+    if not data["votes"]:
+        db_election = get_election(db, election_ref)
+        if db_election.compact_ballots:
+            return _get_compact_ballot_get(db, data, token, db_election)
+
+    vote_ids = _vote_ids_of_ballot(db, data)
+
+    votes = (
+        db.query(models.Vote)
+        .options(joinedload(models.Vote.candidate), joinedload(models.Vote.grade))
+        .filter(
+            models.Vote.id.in_((vote_ids))
+            & (models.Vote.candidate_id.is_not(None))
+            & (models.Vote.election_ref == election_ref)
+        )
     )
 
     db_votes = list(votes.all())
 
     if db_votes == []:
+        db_election = get_election(db, election_ref)
+        _check_election_is_not_archived(db_election)
+        # The election was packed after the token was given
+        if db_election.compact_ballots:
+            return _get_compact_ballot_get(db, data, token, db_election)
         raise errors.NotFoundError("votes")
 
-    election = db_votes[0].election
+    election = get_election_get(db, str(db_votes[0].election_ref))
 
-    votes_get = [schemas.VoteGet.model_validate(v) for v in votes.all()]
+    votes_get = [schemas.VoteGet.model_validate(v) for v in db_votes]
     return schemas.BallotGet(token=token, votes=votes_get, election=election)
 
 
 def get_results(db: Session, election_ref: str, token: t.Optional[str]) -> schemas.ResultsGet:
-    db_election = get_election(db, election_ref)
+    with tracing.span("load_election"):
+        db_election = get_election(db, election_ref)
     if db_election is None:
         raise errors.NotFoundError("elections")
 
+    with tracing.span("validate"):
+        _check_results_are_visible(db_election, election_ref, token)
+
+    def compute(compute_db: Session) -> schemas.ResultsGet:
+        # The candidates and grades are read along with the tallies
+        election = db_election
+        if compute_db is not db:
+            election = get_election(compute_db, election_ref)
+        db_res: t.Sequence[t.Any]
+        with tracing.span("load_tallies"):
+            if election.archived:
+                db_archive = get_archive(compute_db, election_ref)
+                db_res = t.cast(list[t.Any], db_archive.tallies)
+            else:
+                db_res = get_tallies(
+                    compute_db, election_ref, bool(election.compact_ballots)
+                )
+        return _compute_results(election, db_res)
+
+    # The visibility is checked above at each request, on the current election
+    return _get_or_set(_results, db, election_ref, compute)
+
+
+def get_provisional_results(
+    db: Session, election_ref: str, token: str
+) -> schemas.ProvisionalResultsGet:
+    """
+    Rank an election from the grades counted by the workers, without the votes
+    """
+    if not settings.provisional_results:
+        raise errors.BadRequestError("The provisional results are disabled")
+
+    payload = jws_verify(token)
+    if payload["election"] != election_ref:
+        raise errors.UnauthorizedError("Wrong election ref")
+    if not payload.get("admin"):
+        raise errors.ForbiddenError("You are not allowed to manage the election")
+
+    db_election = get_election(db, election_ref)
+    rows = db.execute(provisional.tallies_query(election_ref)).all()
+    # Replaced grades may be subtracted before another worker adds them
+    db_res = [row[:3] for row in rows if row[2] > 0]
+    results = _compute_results(db_election, db_res)
+    return schemas.ProvisionalResultsGet(
+        **results.model_dump(),
+        date_checkpoint=max(row[3] for row in rows),
+        checkpoint_interval=settings.provisional_checkpoint_interval,
+    )
+
+
+def get_tallies(
+    db: Session, election_ref: str, compact_ballots: bool = False
+) -> list[tuple[t.Any, ...]]:
+    """
+    Count the votes of an election by candidate and grade value
+    """
+    if compact_ballots:
+        return [tuple(row) for row in db.execute(compact.tallies_query(election_ref))]
+
+    query = db.query(
+        models.Vote.candidate_id, models.Grade.value, func.count(models.Vote.id)
+    )
+    db_res = (
+        query.join(models.Vote.grade)
+        .join(models.Vote.candidate)
+        .filter(models.Vote.election_ref == election_ref)
+        .group_by(models.Vote.candidate_id, models.Grade.value)
+        .all()
+    )
+    return [tuple(row) for row in db_res]
+
+
+def get_archive(db: Session, election_ref: str) -> models.ElectionArchive:
+    db_archive = (
+        db.query(models.ElectionArchive)
+        .filter(models.ElectionArchive.election_ref == election_ref)
+        .first()
+    )
+    return _check_archive_exists(db_archive, election_ref)
+
+
+def _check_archive_exists(
+    db_archive: models.ElectionArchive | None, election_ref: str
+) -> models.ElectionArchive:
+    """
+    Check that an archived election kept its archive.
+    If it did not, raise an error.
+    """
+    if db_archive is None:
+        raise errors.InconsistentDatabaseError(
+            "elections", f"The archive of {election_ref} is missing"
+        )
+    return db_archive
+
+
+def _check_election_is_not_archived(election: models.Election):
+    """
+    Check that the ballots of the election are still in the hot tables.
+    If they are not, raise an error.
+    """
+    if election.archived:
+        raise errors.ElectionArchivedError(
+            "The ballots of this election have been archived"
+        )
+
+
+def _check_results_are_visible(
+    db_election: models.Election, election_ref: str, token: t.Optional[str]
+):
+    """
+    Check that the results of the election can be disclosed to the caller.
+    """
     if db_election.auth_for_result:
         if token is None:
             raise errors.UnauthorizedError("Election require auth for result, you need to set Authentication header")
@@ -616,18 +984,14 @@ def get_results(db: Session, election_ref: str, token: t.Optional[str]) -> schem
     ):
         raise errors.ResultsHiddenError("Results are hidden until the election is closed.")
 
-    query = db.query(
-        models.Vote.candidate_id, models.Grade.value, func.count(models.Vote.id)
-    )
-    db_res = (
-        query.join(models.Vote.grade)
-        .join(models.Vote.candidate)
-        .filter(models.Vote.election_ref == db_election.ref)
-        .group_by(models.Vote.candidate_id, models.Grade.value)
-        .all()
-    )
 
-    if db_res == []:
+def _compute_results(
+    db_election: models.Election, db_res: t.Sequence[t.Any]
+) -> schemas.ResultsGet:
+    """
+    Rank the candidates given the (candidate_id, grade value, count) rows
+    """
+    if len(db_res) == 0:
         raise errors.NoRecordedVotes()
 
     ballots: t.DefaultDict[int, dict[int, int]] = defaultdict(dict)
@@ -644,10 +1008,15 @@ def get_results(db: Session, election_ref: str, token: t.Optional[str]) -> schem
         for c, votes in ballots.items()
     }
 
-    ranking = majority_judgment(merit_profile)  # pyright: ignore
+    # Only the results need it, so workers do not pay for it at startup
+    from majority_judgment import majority_judgment
+
+    with tracing.span("majority_judgment", candidates=len(merit_profile)):
+        ranking = majority_judgment(merit_profile)  # pyright: ignore
     db_election.ranking = ranking
     db_election.merit_profile = merit_profile2
 
-    results = schemas.ResultsGet.model_validate(db_election)
+    with tracing.span("serialize"):
+        results = schemas.ResultsGet.model_validate(db_election)
 
     return results
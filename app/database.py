@@ -1,33 +1,510 @@
 from __future__ import annotations
+import contextlib
+import itertools
+import logging
+import math
+import threading
+import time
+import typing as t
+import zlib
 from urllib.parse import quote
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from fastapi import Request, Response
+from sqlalchemy import (
+    Column,
+    Engine,
+    ForeignKey,
+    Integer,
+    String,
+    Table,
+    create_engine,
+    event,
+    exc,
+    func,
+    select,
+    text,
+)
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
 from .settings import settings
 
+if t.TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+logger = logging.getLogger(__name__)
+
+
+SQLITE_PRAGMAS = (
+    # Readers do not block the writer, and the writer does not block readers
+    "journal_mode = WAL",
+    # In WAL mode, a power loss can only roll back the last transactions
+    "synchronous = NORMAL",
+    "mmap_size = 268435456",
+    # In KiB when negative
+    "cache_size = -65536",
+    "temp_store = MEMORY",
+    # Wait for the lock instead of failing with "database is locked"
+    "busy_timeout = 5000",
+)
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(f"PRAGMA {pragma}")
+    cursor.close()
+
+
+def create_sqlite_engine(url: str, writer: bool = True) -> Engine:
+    """
+    Create an engine tuned for concurrent requests.
+
+    The writer engine holds a single connection: concurrent writes wait for it
+    in the pool instead of competing for the database lock. Readers use their
+    own engine and run in parallel with the writer thanks to the WAL journal.
+    """
+    pool_args = {"pool_size": 1, "max_overflow": 0} if writer else {}
+    engine = create_engine(
+        url, connect_args={"check_same_thread": False}, **pool_args
+    )
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+    return engine
+
 
 if settings.sqlite:
     database_url = "sqlite:///./main.db"
-    engine = create_engine(database_url, connect_args={"check_same_thread": False})
+    async_database_url = "sqlite+aiosqlite:///./main.db"
+    if settings.sqlite_tuned:
+        engine = create_sqlite_engine(database_url)
+        read_engine = create_sqlite_engine(database_url, writer=False)
+    else:
+        engine = create_engine(database_url, connect_args={"check_same_thread": False})
+        read_engine = engine
 
 else:
-    database_url = (
-        "postgresql+psycopg2://"
+    _credentials = (
         f"{settings.postgres_user}:{quote(settings.postgres_password)}"
         f"@{settings.postgres_host}:{settings.postgres_port}"
         f"/{settings.postgres_name}"
     )
+    database_url = f"postgresql+psycopg2://{_credentials}"
+    async_database_url = f"postgresql+asyncpg://{_credentials}"
     engine = create_engine(database_url)
+    read_engine = engine
 
 SessionLocal: sessionmaker = sessionmaker(  # type: ignore
     autocommit=False, autoflush=False, bind=engine
 )
 
+# The async engine is only created on demand, so that asyncpg and aiosqlite
+# remain optional (and unimported) when the threaded stack is used.
+async_engine: AsyncEngine | None = None
+AsyncSessionLocal: async_sessionmaker[AsyncSession] | None = None
+
+if settings.async_db:
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    async_engine = create_async_engine(async_database_url)
+    if settings.sqlite and settings.sqlite_tuned:
+        event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+    # Objects must stay readable after a commit: a lazy refresh
+    # would require an implicit IO outside of an await.
+    AsyncSessionLocal = async_sessionmaker(
+        async_engine, autoflush=False, expire_on_commit=False
+    )
+
 Base = declarative_base()
 
 
+# Time of the last write of a client, given by the write routes and sent back
+# with its reads, as a cookie or as a header for the clients without cookies
+WRITTEN_AT_COOKIE = "mj_written_at"
+WRITTEN_AT_HEADER = "X-Written-At"
+
+
+class ReplicaRouter:
+    """
+    Choose the engine serving a read-only request.
+
+    Replicas are used in a round-robin fashion and skipped while their last
+    health check failed. The checks run in a background thread (see start).
+
+    A client that wrote during the last `stickiness` seconds is read from the
+    primary, so that voters and organizers read their own writes despite the
+    replication lag. The write routes give the time of the write to the client
+    (see mark_written), which sends it back with its reads: the other clients of
+    the election keep reading from the replicas.
+    """
+
+    def __init__(
+        self,
+        primary: Engine,
+        replicas: list[Engine],
+        health_check_interval: float = 10.0,
+        stickiness: float = 10.0,
+    ):
+        self.primary = primary
+        self.replicas = replicas
+        self.health_check_interval = health_check_interval
+        self.stickiness = stickiness
+        self._cycle = itertools.cycle(range(len(replicas)))
+        self._healthy = [True] * len(replicas)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def mark_written(self, response: Response):
+        """
+        Read the next requests of the client from the primary during the next
+        seconds
+        """
+        written_at = f"{time.time():.3f}"
+        response.headers[WRITTEN_AT_HEADER] = written_at
+        response.set_cookie(
+            WRITTEN_AT_COOKIE,
+            written_at,
+            max_age=max(1, math.ceil(self.stickiness)),
+            httponly=True,
+            samesite="lax",
+        )
+
+    def written_at(self, request: Request) -> float | None:
+        value = request.headers.get(WRITTEN_AT_HEADER) or request.cookies.get(
+            WRITTEN_AT_COOKIE
+        )
+        try:
+            return float(value) if value else None
+        except ValueError:
+            return None
+
+    def is_sticky(self, written_at: float | None) -> bool:
+        if written_at is None:
+            return False
+        # The clocks of the machines may differ slightly
+        return abs(time.time() - written_at) < self.stickiness
+
+    def pick(self, written_at: float | None = None) -> Engine:
+        if self.replicas == [] or self.is_sticky(written_at):
+            return self.primary
+
+        for _ in range(len(self.replicas)):
+            with self._lock:
+                index = next(self._cycle)
+            if self._healthy[index]:
+                return self.replicas[index]
+
+        return self.primary
+
+    def check_replicas(self):
+        for index, replica in enumerate(self.replicas):
+            try:
+                with replica.connect() as connection:
+                    connection.execute(text("SELECT 1"))
+                self._healthy[index] = True
+            except exc.SQLAlchemyError as e:
+                if self._healthy[index]:
+                    logger.warning("Replica %d is unhealthy: %s", index, e)
+                self._healthy[index] = False
+
+    def start(self):
+        """
+        Check the replicas every health_check_interval seconds, off the requests
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._check_loop, name="replica-health", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _check_loop(self):
+        self.check_replicas()
+        while not self._stop.wait(self.health_check_interval):
+            self.check_replicas()
+
+
+def _create_replica_engine(url: str) -> Engine:
+    connect_args = {"check_same_thread": False} if url.startswith("sqlite") else {}
+    return create_engine(url, connect_args=connect_args, pool_pre_ping=True)
+
+
+replica_router = ReplicaRouter(
+    read_engine,
+    [_create_replica_engine(url) for url in settings.replica_urls],
+    health_check_interval=settings.replica_health_check_interval,
+    stickiness=settings.replica_stickiness,
+)
+
+
+INVALIDATION_CHANNEL = "mj_invalidations"
+
+# Version of the last write of each election, which the workers poll on SQLite.
+# It is declared here, since the models import this module.
+election_versions = Table(
+    "election_versions",
+    Base.metadata,
+    Column("election_ref", String(20), ForeignKey("elections.ref"), primary_key=True),
+    Column("version", Integer, index=True),
+)
+
+
+class InvalidationBus:
+    """
+    Tell the workers of every machine that an election changed, so that they
+    evict their cached copies of it.
+
+    The writes of an election publish its ref in their transaction. On
+    PostgreSQL, the event is a NOTIFY on INVALIDATION_CHANNEL, which is only
+    delivered when the transaction commits, with the transaction id as version;
+    each worker LISTENs on a dedicated connection. On SQLite, the write bumps the
+    version of the election in `election_versions`, which each worker polls.
+
+    Subscribers are called with the ref and the version from the thread of the
+    bus, or with None when events may have been missed, after a reconnection:
+    everything must then be evicted. `generation` counts the events of an
+    election seen by the worker, including its own writes, which are applied
+    when they commit.
+    """
+
+    # Slots of the generations. Elections sharing a slot change together, which
+    # only evicts more than needed, and the memory does not grow with the
+    # number of elections.
+    NUM_SLOTS = 1 << 16
+
+    def __init__(self, engine: Engine, poll_interval: float = 1.0):
+        self.engine = engine
+        self.poll_interval = poll_interval
+        self._callbacks: list[t.Callable[[str | None, int | None], None]] = []
+        self._generations = [0] * self.NUM_SLOTS
+        self._reset = 0
+        self._last_version = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def is_postgresql(self) -> bool:
+        return self.engine.dialect.name == "postgresql"
+
+    def subscribe(self, callback: t.Callable[[str | None, int | None], None]):
+        self._callbacks.append(callback)
+
+    def generation(self, election_ref: str) -> tuple[int, int]:
+        """
+        Change whenever an election, or everything, must be evicted
+        """
+        return self._reset, self._generations[self._slot(election_ref)]
+
+    def _slot(self, election_ref: str) -> int:
+        return zlib.crc32(election_ref.encode()) % self.NUM_SLOTS
+
+    def statement(self, election_ref: str) -> t.Any:
+        """
+        Statement publishing a change of an election in the current transaction
+        """
+        if self.is_postgresql:
+            return text(
+                "SELECT pg_notify(:channel, :ref || ':' || txid_current())"
+            ).bindparams(channel=INVALIDATION_CHANNEL, ref=election_ref)
+
+        from sqlalchemy.dialects import sqlite
+
+        table = election_versions
+        # SQLite serializes the writes, so that the versions are increasing
+        version = select(func.coalesce(func.max(table.c.version), 0) + 1)
+        return (
+            sqlite.insert(table)
+            .values(election_ref=election_ref, version=version.scalar_subquery())
+            .on_conflict_do_update(
+                index_elements=["election_ref"],
+                set_={"version": version.scalar_subquery()},
+            )
+        )
+
+    def publish(self, db: t.Any, election_ref: str):
+        """
+        Publish a change of an election, before the commit of the session.
+        The worker applies it when the session commits, even without the bus.
+        """
+        if settings.invalidation_bus:
+            db.execute(self.statement(election_ref))
+        self._dispatch_after_commit(db, election_ref)
+
+    async def publish_async(self, db: t.Any, election_ref: str):
+        if settings.invalidation_bus:
+            await db.execute(self.statement(election_ref))
+        self._dispatch_after_commit(db.sync_session, election_ref)
+
+    def _dispatch_after_commit(self, session: t.Any, election_ref: str):
+        # Before the commit, a concurrent request could cache the former state
+        event.listen(
+            session,
+            "after_commit",
+            lambda session: self.dispatch(election_ref, None),
+            once=True,
+        )
+
+    def dispatch(self, election_ref: str | None, version: int | None):
+        with self._lock:
+            if election_ref is None:
+                self._reset += 1
+            else:
+                self._generations[self._slot(election_ref)] += 1
+        for callback in self._callbacks:
+            try:
+                callback(election_ref, version)
+            except Exception as e:
+                logger.warning("Invalidation of %s failed: %s", election_ref, e)
+
+    def start(self):
+        if self.is_postgresql:
+            target = self._listen
+        else:
+            # Only the writes after the start are events
+            self._last_version = self._max_version()
+            target = self._poll
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=target, name="invalidations", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def poll(self) -> int:
+        """
+        Dispatch the versions of the elections written since the last poll.
+        Return the number of events.
+        """
+        table = election_versions
+        with self.engine.connect() as connection:
+            rows = connection.execute(
+                select(table.c.election_ref, table.c.version)
+                .where(table.c.version > self._last_version)
+                .order_by(table.c.version)
+            ).all()
+        for election_ref, version in rows:
+            self.dispatch(election_ref, version)
+            self._last_version = version
+        return len(rows)
+
+    def _max_version(self) -> int:
+        table = election_versions
+        with self.engine.connect() as connection:
+            return connection.scalar(select(func.max(table.c.version))) or 0
+
+    def _poll(self):
+        # The versions stay in the table: nothing is missed while it fails
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.poll()
+            except exc.SQLAlchemyError as e:
+                logger.warning("Polling the invalidations failed: %s", e)
+
+    def _listen(self):
+        while not self._stop.is_set():
+            try:
+                self._listen_once()
+            except Exception as e:
+                logger.warning("Listening to the invalidations failed: %s", e)
+                if self._stop.wait(self.poll_interval):
+                    return
+                # The events of the outage are lost
+                self.dispatch(None, None)
+
+    def _listen_once(self):
+        import select
+
+        connection = self.engine.raw_connection()
+        try:
+            dbapi_connection = t.cast(t.Any, connection.driver_connection)
+            dbapi_connection.autocommit = True
+            with dbapi_connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {INVALIDATION_CHANNEL}")
+            while not self._stop.is_set():
+                if select.select([dbapi_connection], [], [], 1.0) == ([], [], []):
+                    continue
+                dbapi_connection.poll()
+                while dbapi_connection.notifies:
+                    notify = dbapi_connection.notifies.pop(0)
+                    election_ref, _, version = notify.payload.rpartition(":")
+                    self.dispatch(election_ref, int(version))
+        finally:
+            # The connection was left in autocommit, so that it is not reused
+            connection.invalidate()
+
+
+invalidation_bus = InvalidationBus(engine, settings.invalidation_poll_interval)
+
+
+def named_engines() -> dict[str, Engine]:
+    """
+    List the engines used by the application, with a name for monitoring
+    """
+    engines = {"primary": engine}
+    if read_engine is not engine:
+        engines["reader"] = read_engine
+    for index, replica in enumerate(replica_router.replicas):
+        engines[f"replica{index}"] = replica
+    if async_engine is not None:
+        engines["async"] = async_engine.sync_engine
+    return engines
+
+
+def dispose_engines_after_fork():
+    """
+    Let a forked worker open its own connections, without closing the ones of
+    its parent
+    """
+    for db_engine in named_engines().values():
+        db_engine.dispose(close=False)
+
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+def get_read_db(request: Request):
+    """
+    Provide a session for read-only routes, bound to a replica when possible
+    """
+    db = SessionLocal(bind=replica_router.pick(replica_router.written_at(request)))
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@contextlib.contextmanager
+def primary_session(db: Session) -> t.Iterator[Session]:
+    """
+    Provide a session reading the primary: the given one, unless it is bound
+    to a replica
+    """
+    if db.get_bind() not in replica_router.replicas:
+        yield db
+        return
+    primary = SessionLocal(bind=replica_router.primary)
+    try:
+        yield primary
+    finally:
+        primary.close()
+
+
+async def get_async_db():
+    if AsyncSessionLocal is None:
+        raise RuntimeError("The async database is disabled. Set ASYNC_DB=True")
+
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -99,3 +99,12 @@ class ElectionIsActiveError(CustomError):
     error_code = "ELECTION_IS_ACTIVE"
     message = "This election is already active and cannot be modified."
 
+class ElectionArchivedError(CustomError):
+    status_code = 410
+    error_code = "ELECTION_ARCHIVED"
+    message = "The ballots of this election have been archived."
+
+class ExportFormatUnavailableError(CustomError):
+    status_code = 501
+    error_code = "EXPORT_FORMAT_UNAVAILABLE"
+    message = "This export format is not available on this server."
@@ -0,0 +1,250 @@
+"""
+Export of the anonymized raw ballots of an election, for audits.
+
+Each ballot is exported as one row holding the grade value given to each
+candidate, without its id, token or date, as CSV, NDJSON or Parquet.
+
+The votes are read through a server-side cursor in batches of `yield_per`
+rows, and the rows are encoded in chunks of a bounded number of ballots, so
+that the memory stays flat whatever the size of the election. Ballots from
+invites that did not vote are skipped.
+
+The ballots are ordered by a hash of their id salted for each export, rather
+than by id: the ids of a restricted election follow the order of its invites,
+which would link the rows to the voters.
+"""
+import csv
+import hashlib
+import io
+import json
+import secrets
+import typing as t
+from sqlalchemy import Engine, String, cast, func, literal, select
+from sqlalchemy.orm import Session
+from . import compact, crud, errors, models
+from .auth import jws_verify
+
+Format = t.Literal["csv", "ndjson", "parquet"]
+
+MEDIA_TYPES: dict[str, str] = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# Rows fetched from the cursor at once
+YIELD_PER = 10_000
+# Ballots encoded in each chunk of the response
+CHUNK_SIZE = 1_000
+
+
+class Export(t.NamedTuple):
+    election_ref: str
+    candidate_ids: list[int]
+    # Header of each candidate
+    columns: list[str]
+    grade_values: dict[int, int]
+    compact_ballots: bool = False
+
+
+def prepare_export(
+    db: Session, election_ref: str, token: str, format: Format
+) -> Export:
+    """
+    Check the caller manages the election and describe its ballots.
+
+    It runs before the response starts, so that errors get their status code.
+    """
+    payload = jws_verify(token)
+    if payload["election"] != election_ref:
+        raise errors.UnauthorizedError("Wrong election ref")
+    if not payload.get("admin"):
+        raise errors.ForbiddenError("You are not allowed to manage the election")
+
+    if format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise errors.ExportFormatUnavailableError(
+                "The Parquet export requires pyarrow"
+            )
+
+    db_election = crud.get_election(db, election_ref)
+    crud._check_election_is_not_archived(db_election)
+
+    candidates = sorted(db_election.candidates, key=lambda c: int(c.id))
+    names = [str(c.name) for c in candidates]
+    columns = [
+        name if names.count(name) == 1 else f"{name} #{c.id}"
+        for name, c in zip(names, candidates)
+    ]
+    return Export(
+        election_ref=election_ref,
+        candidate_ids=[int(c.id) for c in candidates],
+        columns=columns,
+        grade_values={int(g.id): int(g.value) for g in db_election.grades},
+        compact_ballots=bool(db_election.compact_ballots),
+    )
+
+
+def _md5(text: str) -> str:
+    return hashlib.md5(text.encode()).hexdigest()
+
+
+def _shuffled(db: Session, ballot_id: t.Any, salt: str) -> t.Any:
+    """
+    Order of the ballots, unrelated to their ids
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        # SQLite has no md5 function
+        connection = t.cast(t.Any, db.connection().connection.driver_connection)
+        connection.create_function("md5", 1, _md5, deterministic=True)
+    return func.md5(literal(salt, String) + cast(ballot_id, String))
+
+
+def iter_ballots(
+    engine: Engine, export: Export, yield_per: int = YIELD_PER
+) -> t.Iterator[list[int | None]]:
+    """
+    Yield the grade values of each ballot, ordered as export.candidate_ids
+    """
+    salt = secrets.token_hex(16)
+    if export.compact_ballots:
+        yield from _iter_compact_ballots(engine, export, yield_per, salt)
+        return
+
+    index = {candidate_id: i for i, candidate_id in enumerate(export.candidate_ids)}
+
+    # The session of the request is closed before its body is streamed
+    with Session(engine) as db:
+        order = _shuffled(db, models.Vote.ballot_id, salt)
+        # The votes of a ballot stay together, even if two hashes collide
+        query = (
+            select(
+                models.Vote.ballot_id, models.Vote.candidate_id, models.Vote.grade_id
+            )
+            .filter(
+                (models.Vote.election_ref == export.election_ref)
+                & models.Vote.ballot_id.is_not(None)
+            )
+            .order_by(order, models.Vote.ballot_id)
+        )
+        result = db.execute(query, execution_options={"yield_per": yield_per})
+        current = None
+        grades: list[int | None] = []
+        for ballot_id, candidate_id, grade_id in result:
+            if ballot_id != current:
+                if any(g is not None for g in grades):
+                    yield grades
+                current = ballot_id
+                grades = [None] * len(index)
+            if candidate_id in index and grade_id is not None:
+                grades[index[candidate_id]] = export.grade_values.get(grade_id)
+        if any(g is not None for g in grades):
+            yield grades
+
+
+def _iter_compact_ballots(
+    engine: Engine, export: Export, yield_per: int, salt: str
+) -> t.Iterator[list[int | None]]:
+    # Packed grades are ordered by candidate id, as the columns
+    grade_ids = sorted(export.grade_values)
+    values: list[int | None] = [None] + [export.grade_values[g] for g in grade_ids]
+    num_candidates = len(export.candidate_ids)
+    with Session(engine) as db:
+        query = (
+            select(models.Ballot.grades)
+            .filter(
+                (models.Ballot.election_ref == export.election_ref)
+                & models.Ballot.grades.is_not(None)
+            )
+            .order_by(_shuffled(db, models.Ballot.id, salt))
+        )
+        for packed in db.scalars(query, execution_options={"yield_per": yield_per}):
+            grades = [values[position] for position in packed[:num_candidates]]
+            yield grades + [None] * (num_candidates - len(grades))
+
+
+def _chunks(
+    rows: t.Iterator[list[int | None]], size: int
+) -> t.Iterator[list[list[int | None]]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _encode_csv(export: Export, chunks) -> t.Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(export.columns)
+    for chunk in chunks:
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def _encode_ndjson(export: Export, chunks) -> t.Iterator[bytes]:
+    for chunk in chunks:
+        yield "".join(
+            json.dumps(dict(zip(export.columns, row))) + "\n" for row in chunk
+        ).encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Output of the Parquet writer, emptied after each row group. Its position
+    keeps counting, since the footer refers to the offsets of the row groups.
+    """
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def pop(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _encode_parquet(export: Export, chunks) -> t.Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(column, pa.int32()) for column in export.columns])
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for chunk in chunks:
+            # One row group per chunk
+            columns = [pa.array(grades, pa.int32()) for grades in zip(*chunk)]
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+            yield sink.pop()
+    yield sink.pop()
+
+
+ENCODERS = {"csv": _encode_csv, "ndjson": _encode_ndjson, "parquet": _encode_parquet}
+
+
+def stream_ballots(
+    engine: Engine, export: Export, format: Format, chunk_size: int = CHUNK_SIZE
+) -> t.Iterator[bytes]:
+    chunks = _chunks(iter_ballots(engine, export), chunk_size)
+    return ENCODERS[format](export, chunks)
@@ -1,19 +1,76 @@
 import typing as t
 import json
+from datetime import datetime
+from contextlib import asynccontextmanager
 from fastapi import Depends, FastAPI, HTTPException, Request, Body, Header
-from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.responses import (
+    JSONResponse,
+    PlainTextResponse,
+    Response,
+    StreamingResponse,
+)
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exceptions import RequestValidationError
 from sqlalchemy.orm import Session
 from jose.exceptions import JWEError, JWSError
 
-from . import crud, models, schemas, errors
-from .database import get_db, engine, Base
+from . import (
+    crud,
+    errors,
+    export,
+    metrics,
+    models,
+    provisional,
+    query_budget,
+    schemas,
+    timeline,
+    tracing,
+)
+from .auth import verify_operator_token
+from .cache import Namespace, cache
+from .slow_queries import slow_query_log
+from .database import (
+    WRITTEN_AT_HEADER,
+    get_db,
+    get_read_db,
+    async_engine,
+    engine,
+    invalidation_bus,
+    named_engines,
+    replica_router,
+)
 from .settings import settings
 
-Base.metadata.create_all(bind=engine)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    checkpointer = None
+    if settings.provisional_results:
+        checkpointer = provisional.Checkpointer(
+            engine, settings.provisional_checkpoint_interval
+        )
+        checkpointer.start()
+    if settings.invalidation_bus:
+        invalidation_bus.start()
+    if replica_router.replicas:
+        replica_router.start()
+    yield
+    if replica_router.replicas:
+        replica_router.stop()
+    if settings.invalidation_bus:
+        invalidation_bus.stop()
+    if checkpointer is not None:
+        checkpointer.stop()
+    # Pooled aiosqlite connections live in their own threads
+    # and would otherwise prevent the process from exiting.
+    if async_engine is not None:
+        await async_engine.dispose()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Serialized responses of the routes, by election ref
+_responses: Namespace[bytes] = cache.namespace("responses")
 
 app.add_middleware(
     CORSMiddleware,
@@ -21,8 +78,45 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[WRITTEN_AT_HEADER],
 )
 
+if settings.metrics or settings.query_budget > 0:
+    for name, db_engine in named_engines().items():
+        metrics.instrument_engine(db_engine, name)
+
+if settings.slow_query_ms > 0:
+    for db_engine in named_engines().values():
+        slow_query_log.instrument(db_engine)
+
+if settings.query_budget > 0:
+    app.add_middleware(
+        query_budget.QueryBudgetMiddleware,
+        budget=settings.query_budget,
+        budgets=settings.query_budgets,
+    )
+
+if settings.tracing_export:
+    tracing.configure(settings.tracing_export)
+    app.add_middleware(tracing.TracingMiddleware)
+
+if settings.profiling:
+    from .profiler import ProfilerMiddleware
+
+    app.add_middleware(
+        ProfilerMiddleware,
+        directory=settings.profiling_dir,
+        interval=settings.profiling_interval,
+    )
+
+if settings.metrics:
+    # Added last, so that it measures the whole request
+    app.add_middleware(metrics.MetricsMiddleware)
+
+    @app.get("/metrics", include_in_schema=False)
+    def read_metrics():
+        return metrics.metrics_response()
+
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
     # This overrides FastAPI's default 422 validation error handler
@@ -58,61 +152,165 @@ def read_root():
     return "OK"
 
 
-@app.get("/elections/{election_ref}", response_model=schemas.ElectionGet)
-def read_election_all_details(election_ref: str, db: Session = Depends(get_db)):
-    db_election = crud.get_election(db, election_ref)
-    return db_election
+@app.get("/admin/slow-queries", response_model=list[schemas.SlowQuery])
+def read_slow_queries(limit: int = 10, authorization: str = Header()):
+    token = authorization.split("Bearer ")[1]
+    verify_operator_token(token)
+    # Only the statements run by the worker serving this request
+    return slow_query_log.top(limit)
+
+
+@app.get("/admin/cache", response_model=list[schemas.CacheStats])
+def read_cache_stats(authorization: str = Header()):
+    token = authorization.split("Bearer ")[1]
+    verify_operator_token(token)
+    # Only the entries of the worker serving this request
+    return [
+        schemas.CacheStats(namespace=namespace, **stats)
+        for namespace, stats in cache.stats().items()
+    ]
 
 
 @app.get("/elections/{election_ref}/progress", response_model=schemas.Progress)
 def get_progress(
-    election_ref: str, authorization: str = Header(), db: Session = Depends(get_db)
+    election_ref: str, authorization: str = Header(), db: Session = Depends(get_read_db)
 ):
     token = authorization.split("Bearer ")[1]
     progress = crud.get_progress(db, election_ref, token)
     return progress
 
 
-@app.post("/elections", response_model=schemas.ElectionCreatedGet)
-def create_election(election: schemas.ElectionCreate, db: Session = Depends(get_db)):
-    return crud.create_election(db=db, election=election)
+@app.get(
+    "/elections/{election_ref}/results/provisional",
+    response_model=schemas.ProvisionalResultsGet,
+)
+def get_provisional_results(
+    election_ref: str, authorization: str = Header(), db: Session = Depends(get_db)
+):
+    token = authorization.split("Bearer ")[1]
+    return crud.get_provisional_results(db, election_ref, token)
 
 
-@app.put("/elections", response_model=schemas.ElectionUpdatedGet)
-def update_election(
-    election: schemas.ElectionUpdate,
+@app.get(
+    "/elections/{election_ref}/results/stability", response_model=schemas.Stability
+)
+def get_stability(
+    election_ref: str,
+    samples: int = 1000,
+    time_budget: t.Optional[float] = None,
+    seed: t.Optional[int] = None,
     authorization: str = Header(),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
+):
+    # NumPy is only imported by the workers which serve this route
+    from . import stability
+
+    token = authorization.split("Bearer ")[1]
+    return stability.get_stability(db, election_ref, token, samples, time_budget, seed)
+
+
+@app.get("/elections/{election_ref}/timeline", response_model=schemas.Timeline)
+def get_timeline(
+    election_ref: str,
+    period: timeline.Period = "hour",
+    start: t.Optional[datetime] = None,
+    end: t.Optional[datetime] = None,
+    authorization: str = Header(),
+    db: Session = Depends(get_read_db),
+):
+    token = authorization.split("Bearer ")[1]
+    return timeline.get_timeline(db, election_ref, token, period, start, end)
+
+
+@app.get("/elections/{election_ref}/ballots/export")
+def export_ballots(
+    election_ref: str,
+    format: export.Format = "csv",
+    authorization: str = Header(),
+    db: Session = Depends(get_read_db),
 ):
     token = authorization.split("Bearer ")[1]
-    return crud.update_election(db=db, election=election, token=token)
+    ballots_export = export.prepare_export(db, election_ref, token, format)
+    return StreamingResponse(
+        export.stream_ballots(db.get_bind().engine, ballots_export, format),
+        media_type=export.MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": f'attachment; filename="{election_ref}.{format}"'
+        },
+    )
 
 
-@app.post("/ballots", response_model=schemas.BallotGet)
-def create_ballot(
-    ballot: schemas.BallotCreate,
+@app.post("/elections", response_model=schemas.ElectionCreatedGet)
+def create_election(
+    election: schemas.ElectionCreate,
+    response: Response,
     db: Session = Depends(get_db),
 ):
-    return crud.create_ballot(db=db, ballot=ballot)
+    created_election = crud.create_election(db=db, election=election)
+    replica_router.mark_written(response)
+    return created_election
 
 
-@app.put("/ballots", response_model=schemas.BallotGet)
-def update_ballot(
-    ballot: schemas.BallotUpdate,
+@app.put("/elections", response_model=schemas.ElectionUpdatedGet)
+def update_election(
+    election: schemas.ElectionUpdate,
+    response: Response,
     authorization: str = Header(),
     db: Session = Depends(get_db),
 ):
     token = authorization.split("Bearer ")[1]
-    return crud.update_ballot(db=db, ballot=ballot, token=token)
+    updated_election = crud.update_election(db=db, election=election, token=token)
+    replica_router.mark_written(response)
+    return updated_election
 
 
-@app.get("/ballots", response_model=schemas.BallotGet)
-def get_ballot(authorization: str = Header(), db: Session = Depends(get_db)):
-    token = authorization.split("Bearer ")[1]
-    return crud.get_ballot(db=db, token=token)
+# The hot routes are served either by the asyncio stack or by the thread pool.
+if settings.async_db:
+    from . import async_routes
+
+    app.include_router(async_routes.router)
+
+else:
+
+    @app.get("/elections/{election_ref}", response_model=schemas.ElectionGet)
+    def read_election_all_details(election_ref: str, db: Session = Depends(get_read_db)):
+        if election_ref.isnumeric():
+            # Only the refs are evicted by the writes
+            return crud.get_election(db, election_ref)
+        body = _responses.get_or_set(
+            election_ref,
+            lambda: crud.get_election_get(db, election_ref).model_dump_json().encode(),
+        )
+        return Response(content=body, media_type="application/json")
+
+    @app.post("/ballots", response_model=schemas.BallotGet)
+    def create_ballot(
+        ballot: schemas.BallotCreate,
+        response: Response,
+        db: Session = Depends(get_db),
+    ):
+        created_ballot = crud.create_ballot(db=db, ballot=ballot)
+        replica_router.mark_written(response)
+        return created_ballot
+
+    @app.put("/ballots", response_model=schemas.BallotGet)
+    def update_ballot(
+        ballot: schemas.BallotUpdate,
+        response: Response,
+        authorization: str = Header(),
+        db: Session = Depends(get_db),
+    ):
+        token = authorization.split("Bearer ")[1]
+        updated_ballot = crud.update_ballot(db=db, ballot=ballot, token=token)
+        replica_router.mark_written(response)
+        return updated_ballot
 
+    @app.get("/ballots", response_model=schemas.BallotGet)
+    def get_ballot(authorization: str = Header(), db: Session = Depends(get_read_db)):
+        token = authorization.split("Bearer ")[1]
+        return crud.get_ballot(db=db, token=token)
 
-@app.get("/results/{election_ref}", response_model=schemas.ResultsGet)
-def get_results(election_ref: str, authorization: t.Optional[str] = Header(default=None), db: Session = Depends(get_db)):
-    token = authorization.split("Bearer ")[1] if authorization else None
-    return crud.get_results(db=db, token=token, election_ref=election_ref)
+    @app.get("/results/{election_ref}", response_model=schemas.ResultsGet)
+    def get_results(election_ref: str, authorization: t.Optional[str] = Header(default=None), db: Session = Depends(get_read_db)):
+        token = authorization.split("Bearer ")[1] if authorization else None
+        return crud.get_results(db=db, token=token, election_ref=election_ref)
@@ -0,0 +1,216 @@
+"""
+Prometheus metrics, exposed on /metrics.
+
+Requests are measured by a plain ASGI middleware, labelled by route template
+(e.g. /elections/{election_ref}) so that the number of series stays bounded.
+SQL statements are counted and timed by engine events, and attributed to the
+request running them through a context variable.
+
+With several workers (see app.server), set PROMETHEUS_MULTIPROC_DIR to an
+empty directory so that /metrics aggregates the metrics of all the workers.
+"""
+import contextlib
+import os
+import time
+import typing as t
+from contextvars import ContextVar
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from sqlalchemy import Engine, event
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+REQUEST_DURATION = Histogram(
+    "mj_request_duration_seconds",
+    "Duration of HTTP requests",
+    ["method", "route"],
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "mj_requests_in_progress",
+    "HTTP requests being served",
+    multiprocess_mode="livesum",
+)
+RESPONSES = Counter(
+    "mj_responses_total",
+    "HTTP responses by status code",
+    ["method", "route", "status"],
+)
+REQUEST_SQL_STATEMENTS = Histogram(
+    "mj_request_sql_statements",
+    "SQL statements executed by an HTTP request",
+    ["method", "route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+REQUEST_SQL_DURATION = Histogram(
+    "mj_request_sql_duration_seconds",
+    "Time spent in SQL statements by an HTTP request",
+    ["method", "route"],
+)
+POOL_CHECKED_OUT = Gauge(
+    "mj_db_pool_checked_out",
+    "Connections checked out of the pool",
+    ["engine"],
+    multiprocess_mode="livesum",
+)
+POOL_EXHAUSTED = Counter(
+    "mj_db_pool_exhausted_total",
+    "Checkouts that left the pool without any available connection",
+    ["engine"],
+)
+CACHE_REQUESTS = Counter(
+    "mj_cache_requests_total",
+    "Cache lookups by result (hit or miss)",
+    ["cache", "result"],
+)
+CACHE_EVICTIONS = Counter(
+    "mj_cache_evictions_total",
+    "Cache entries evicted to make room for others",
+    ["cache"],
+)
+
+
+class SqlStats:
+    __slots__ = ("statements", "seconds", "parent")
+
+    def __init__(self, parent: "SqlStats | None" = None):
+        self.statements = 0
+        self.seconds = 0.0
+        self.parent = parent
+
+
+_sql_stats: ContextVar[SqlStats | None] = ContextVar("sql_stats", default=None)
+
+
+@contextlib.contextmanager
+def count_sql() -> t.Iterator[SqlStats]:
+    """
+    Count the SQL statements executed in the block, by instrumented engines.
+    The statements of nested blocks are counted by the enclosing blocks too.
+    """
+    stats = SqlStats(_sql_stats.get())
+    token = _sql_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _sql_stats.reset(token)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context.sql_stats_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _sql_stats.get()
+    elapsed = time.perf_counter() - context.sql_stats_start
+    while stats is not None:
+        stats.statements += 1
+        stats.seconds += elapsed
+        stats = stats.parent
+
+
+def instrument_engine(engine: Engine, name: str):
+    """
+    Time the statements of an engine and monitor its pool
+    """
+    # The statements are left to the dialect, which knows how to run them best
+    # (e.g. the executemany modes of psycopg2)
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+    pool = engine.pool
+    checked_out = POOL_CHECKED_OUT.labels(name)
+    exhausted = POOL_EXHAUSTED.labels(name)
+
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        checked_out.inc()
+        # Only QueuePool has a bounded size
+        max_overflow = getattr(pool, "_max_overflow", -1)
+        if (
+            max_overflow >= 0
+            and pool.checkedin() == 0  # type: ignore
+            and pool.overflow() >= max_overflow  # type: ignore
+        ):
+            exhausted.inc()
+
+    def checkin(dbapi_connection, connection_record):
+        checked_out.dec()
+
+    event.listen(pool, "checkout", checkout)
+    event.listen(pool, "checkin", checkin)
+
+
+def record_cache_access(cache: str, hit: bool):
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def record_cache_eviction(cache: str):
+    CACHE_EVICTIONS.labels(cache).inc()
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        # Labelled children, to skip the lookups of prometheus_client
+        self._children: dict[tuple[str, str], tuple[t.Any, t.Any, t.Any]] = {}
+        self._responses: dict[tuple[str, str, int], t.Any] = {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        REQUESTS_IN_PROGRESS.inc()
+        start = time.perf_counter()
+        try:
+            with count_sql() as stats:
+                await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            REQUESTS_IN_PROGRESS.dec()
+
+            # FastAPI stores the matched route in the scope
+            route = scope.get("route")
+            labels = (scope["method"], getattr(route, "path", "unmatched"))
+            children = self._children.get(labels)
+            if children is None:
+                children = self._children[labels] = (
+                    REQUEST_DURATION.labels(*labels),
+                    REQUEST_SQL_STATEMENTS.labels(*labels),
+                    REQUEST_SQL_DURATION.labels(*labels),
+                )
+            duration, sql_statements, sql_duration = children
+            duration.observe(elapsed)
+            sql_statements.observe(stats.statements)
+            sql_duration.observe(stats.seconds)
+
+            responses = self._responses.get((*labels, status))
+            if responses is None:
+                responses = RESPONSES.labels(*labels, str(status))
+                self._responses[(*labels, status)] = responses
+            responses.inc()
+
+
+def metrics_response() -> Response:
+    registry = REGISTRY
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
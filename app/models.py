@@ -1,5 +1,19 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime
-from sqlalchemy.sql import func
+from sqlalchemy import (
+    DDL,
+    JSON,
+    Boolean,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
+    MetaData,
+    String,
+    Table,
+    event,
+)
+from sqlalchemy.sql import expression, func
 from sqlalchemy.orm import relationship
 from .database import Base
 import uuid  # Pour pouvoir appeler uuid.uuid4()
@@ -21,6 +35,12 @@ class Election(Base):
     restricted = Column(Boolean, default=False)
     force_close = Column(Boolean, default=False)
     auth_for_result = Column(Boolean, default=False)
+    # The votes and ballots were moved to election_archives
+    archived = Column(Boolean, default=False, server_default=expression.false())
+    # The ballots hold their grades, without votes (see app.compact)
+    compact_ballots = Column(
+        Boolean, default=False, server_default=expression.false()
+    )
 
     grades = relationship("Grade", back_populates="election")
     candidates = relationship("Candidate", back_populates="election")
@@ -38,7 +58,7 @@ class Candidate(Base):
     date_created = Column(DateTime, server_default=func.now())
     date_modified = Column(DateTime, onupdate=func.now())
 
-    election_ref = Column(String(20), ForeignKey("elections.ref"))
+    election_ref = Column(String(20), ForeignKey("elections.ref"), index=True)
     election = relationship("Election", back_populates="candidates")
 
     votes = relationship("Vote", back_populates="candidate")
@@ -54,7 +74,7 @@ class Grade(Base):
     date_created = Column(DateTime, server_default=func.now())
     date_modified = Column(DateTime, onupdate=func.now())
 
-    election_ref = Column(String(20), ForeignKey("elections.ref"))
+    election_ref = Column(String(20), ForeignKey("elections.ref"), index=True)
     election = relationship("Election", back_populates="grades")
 
     votes = relationship("Vote", back_populates="grade")
@@ -62,6 +82,16 @@ class Grade(Base):
 
 class Vote(Base):
     __tablename__ = "votes"
+    __table_args__ = (
+        # Serves the results, the progress and the "votes cast" check,
+        # which all filter on the election and group by candidate and grade.
+        Index(
+            "ix_votes_election_ref_candidate_id_grade_id",
+            "election_ref",
+            "candidate_id",
+            "grade_id",
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     date_created = Column(DateTime, server_default=func.now())
@@ -75,7 +105,7 @@ class Vote(Base):
     election_ref = Column(String(20), ForeignKey("elections.ref"))
     election = relationship("Election", back_populates="votes")
 
-    ballot_id = Column(Integer, ForeignKey("ballots.id"), nullable=True) 
+    ballot_id = Column(Integer, ForeignKey("ballots.id"), nullable=True, index=True)
     ballot = relationship("Ballot", back_populates="votes")
 
 
@@ -87,7 +117,173 @@ class Ballot(Base):
     voter_uuid = Column(UUID(as_uuid=True), default=uuid.uuid4, unique=True, index=True)
 
     date_created = Column(DateTime, server_default=func.now())
-    election_ref = Column(String(20), ForeignKey("elections.ref"))
+    date_modified = Column(DateTime, onupdate=func.now())
+    election_ref = Column(String(20), ForeignKey("elections.ref"), index=True)
+    # Packed grades of the elections with compact_ballots (see app.compact)
+    grades = Column(LargeBinary, nullable=True)
 
     election = relationship("Election", back_populates="ballots")
-    votes = relationship("Vote", back_populates="ballot")
\ No newline at end of file
+    votes = relationship("Vote", back_populates="ballot")
+
+
+# Serve the rollups of the timeline, which read the ballots cast since a date
+# (see app.timeline)
+Index("ix_votes_date_cast", func.coalesce(Vote.date_modified, Vote.date_created))
+Index(
+    "ix_ballots_date_cast", func.coalesce(Ballot.date_modified, Ballot.date_created)
+)
+
+
+class ElectionArchive(Base):
+    """
+    Frozen results of a closed election, whose raw votes and ballots were
+    moved out of the hot tables
+    """
+    __tablename__ = "election_archives"
+
+    id = Column(Integer, primary_key=True, index=True)
+    election_ref = Column(String(20), ForeignKey("elections.ref"), unique=True, index=True)
+    date_created = Column(DateTime, server_default=func.now())
+
+    # Rows of (candidate_id, grade value, number of votes)
+    tallies = Column(JSON)
+    num_voters = Column(Integer)
+    num_voters_voted = Column(Integer)
+    # zlib-compressed JSON lines of the ballots and votes
+    data = Column(LargeBinary)
+
+
+class ElectionResults(Base):
+    """
+    Results computed in batch (see app.ranking), for reports and dashboards
+    """
+    __tablename__ = "election_results"
+
+    id = Column(Integer, primary_key=True, index=True)
+    election_ref = Column(String(20), ForeignKey("elections.ref"), unique=True, index=True)
+    date_created = Column(DateTime, server_default=func.now())
+
+    # Number of votes by grade value of each candidate
+    merit_profile = Column(JSON)
+    ranking = Column(JSON)
+
+
+class ProvisionalTally(Base):
+    """
+    Number of grades counted by the workers in provisional mode (see
+    app.provisional), added at each checkpoint
+    """
+    __tablename__ = "provisional_tallies"
+    __table_args__ = (
+        # The checkpoints add their counts to the row of each key
+        Index(
+            "ix_provisional_tallies_election_ref_candidate_id_grade_id",
+            "election_ref",
+            "candidate_id",
+            "grade_id",
+            unique=True,
+        ),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    election_ref = Column(String(20), ForeignKey("elections.ref"))
+    candidate_id = Column(Integer, ForeignKey("candidates.id"))
+    grade_id = Column(Integer, ForeignKey("grades.id"))
+    num_votes = Column(Integer, default=0)
+    date_modified = Column(DateTime, server_default=func.now())
+
+
+class TimelineBucket(Base):
+    """
+    Number of ballots cast in a minute, an hour or a day (see app.timeline)
+    """
+    __tablename__ = "timeline_buckets"
+    __table_args__ = (
+        Index(
+            "ix_timeline_buckets_election_ref_period_bucket_start",
+            "election_ref",
+            "period",
+            "bucket_start",
+            unique=True,
+        ),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    election_ref = Column(String(20), ForeignKey("elections.ref"))
+    period = Column(String(6))
+    bucket_start = Column(DateTime)
+    num_ballots = Column(Integer)
+
+
+class TimelineGrade(Base):
+    """
+    Number of grades given in a bucket of the timeline
+    """
+    __tablename__ = "timeline_grades"
+    __table_args__ = (
+        Index(
+            "ix_timeline_grades_election_ref_period_bucket_start",
+            "election_ref",
+            "period",
+            "bucket_start",
+        ),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    election_ref = Column(String(20), ForeignKey("elections.ref"))
+    period = Column(String(6))
+    bucket_start = Column(DateTime)
+    candidate_id = Column(Integer, ForeignKey("candidates.id"))
+    grade_id = Column(Integer, ForeignKey("grades.id"))
+    num_votes = Column(Integer)
+
+
+# The compact ballots unpacked into the rows of votes, so that the queries on
+# votes also serve them. The n-th byte of ballots.grades is the 1-based position
+# of the grade given to the n-th candidate, both ordered by id, or 0 without grade.
+# create_all runs it on databases which already have the view.
+_BALLOT_VOTES_VIEW = """
+{create} ballot_votes AS
+SELECT b.id AS ballot_id, b.election_ref AS election_ref,
+       c.id AS candidate_id, g.id AS grade_id
+FROM ballots b
+JOIN (
+    SELECT id, election_ref,
+           row_number() OVER (PARTITION BY election_ref ORDER BY id) AS position
+    FROM candidates
+) c ON c.election_ref = b.election_ref AND c.position <= length(b.grades)
+JOIN (
+    SELECT id, election_ref,
+           row_number() OVER (PARTITION BY election_ref ORDER BY id) AS position
+    FROM grades
+) g ON g.election_ref = b.election_ref AND g.position = {grade_position}
+WHERE b.grades IS NOT NULL
+"""
+
+BALLOT_VOTES_VIEWS = {
+    "postgresql": _BALLOT_VOTES_VIEW.format(
+        create="CREATE OR REPLACE VIEW",
+        grade_position="get_byte(b.grades, CAST(c.position - 1 AS integer))",
+    ),
+    # Positions are below 128, so that a byte is read as a single UTF-8 character
+    "sqlite": _BALLOT_VOTES_VIEW.format(
+        create="CREATE VIEW IF NOT EXISTS",
+        grade_position="unicode(substr(b.grades, c.position, 1))",
+    ),
+}
+
+for _dialect, _view in BALLOT_VOTES_VIEWS.items():
+    event.listen(
+        Base.metadata, "after_create", DDL(_view).execute_if(dialect=_dialect)
+    )
+event.listen(Base.metadata, "before_drop", DDL("DROP VIEW IF EXISTS ballot_votes"))
+
+# Not part of Base.metadata, which would create it as a table
+ballot_votes = Table(
+    "ballot_votes",
+    MetaData(),
+    Column("ballot_id", Integer),
+    Column("election_ref", String(20)),
+    Column("candidate_id", Integer),
+    Column("grade_id", Integer),
+)
@@ -0,0 +1,253 @@
+"""
+Hash-partitioned layout of the votes and ballots tables (PostgreSQL only).
+
+Every query on votes and ballots filters on the election, so both tables can be
+partitioned by hash of `election_ref`. The switch happens in three steps:
+
+1. `prepare` creates the partitioned tables next to the current ones, with
+   triggers that mirror every write of the current tables;
+2. `copy_batch` copies the existing rows, by ranges of ids;
+3. `switch` swaps the tables in a single short transaction.
+
+The partitioned tables keep the columns, defaults, sequences, indexes and
+foreign keys of the current ones, with two differences imposed by PostgreSQL:
+primary keys and unique indexes include `election_ref`, and votes.ballot_id
+is not a foreign key anymore (a ballot and its votes are always written in the
+same transaction).
+"""
+import re
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from .models import BALLOT_VOTES_VIEWS
+
+TABLES = ("ballots", "votes")
+SHADOW_SUFFIX = "_partitioned"
+OLD_SUFFIX = "_unpartitioned"
+PARTITION_KEY = "election_ref"
+
+
+def is_partitioned(connection: Connection, table: str) -> bool:
+    return bool(
+        connection.execute(
+            text(
+                "SELECT count(*) FROM pg_partitioned_table p "
+                "JOIN pg_class c ON c.oid = p.partrelid "
+                "WHERE c.relname = :table AND pg_table_is_visible(c.oid)"
+            ),
+            {"table": table},
+        ).scalar()
+    )
+
+
+def _columns(connection: Connection, table: str) -> list[str]:
+    return list(
+        connection.execute(
+            text(
+                "SELECT column_name FROM information_schema.columns "
+                "WHERE table_name = :table AND table_schema = current_schema() "
+                "ORDER BY ordinal_position"
+            ),
+            {"table": table},
+        ).scalars()
+    )
+
+
+def _indexes(connection: Connection, table: str) -> list[tuple[str, str]]:
+    """
+    List the (name, definition) of the indexes of a table, except its primary key
+    """
+    return list(
+        connection.execute(
+            text(
+                "SELECT i.indexname, i.indexdef FROM pg_indexes i "
+                "WHERE i.tablename = :table AND i.schemaname = current_schema() "
+                "AND i.indexname NOT IN ("
+                "  SELECT conname FROM pg_constraint WHERE contype = 'p'"
+                ")"
+            ),
+            {"table": table},
+        ).tuples()
+    )
+
+
+def _foreign_keys(connection: Connection, table: str) -> list[tuple[str, str]]:
+    return list(
+        connection.execute(
+            text(
+                "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+                "WHERE contype = 'f' AND conrelid = CAST(:table AS regclass)"
+            ),
+            {"table": table},
+        ).tuples()
+    )
+
+
+def _shadow_index(table: str, name: str, definition: str) -> str | None:
+    """
+    Adapt the definition of an index to the partitioned table
+    """
+    columns = definition[definition.rindex("(") + 1 : definition.rindex(")")]
+    columns_list = [c.strip() for c in columns.split(",")]
+    if columns_list == ["id"]:
+        # Already served by the primary key (id, election_ref)
+        return None
+
+    shadow = table + SHADOW_SUFFIX
+    definition = definition.replace(f"INDEX {name} ON", f"INDEX {name}{SHADOW_SUFFIX} ON", 1)
+    definition = re.sub(rf"\bON (\w+\.)?{table}\b", rf"ON \g<1>{shadow}", definition, count=1)
+
+    if definition.startswith("CREATE UNIQUE") and PARTITION_KEY not in columns_list:
+        # Unique indexes must contain the partition key
+        definition = definition[: definition.rindex(")")] + f", {PARTITION_KEY})"
+
+    return definition
+
+
+def prepare(connection: Connection, num_partitions: int):
+    """
+    Create the partitioned tables and mirror the writes of the current tables
+    """
+    for table in TABLES:
+        shadow = table + SHADOW_SUFFIX
+        connection.execute(
+            text(
+                f"CREATE TABLE {shadow} "
+                f"(LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+                f"PARTITION BY HASH ({PARTITION_KEY})"
+            )
+        )
+        connection.execute(text(f"ALTER TABLE {shadow} ALTER COLUMN {PARTITION_KEY} SET NOT NULL"))
+        connection.execute(
+            text(f"ALTER TABLE {shadow} ADD PRIMARY KEY (id, {PARTITION_KEY})")
+        )
+        for remainder in range(num_partitions):
+            connection.execute(
+                text(
+                    f"CREATE TABLE {shadow}_{remainder} PARTITION OF {shadow} "
+                    f"FOR VALUES WITH (MODULUS {num_partitions}, REMAINDER {remainder})"
+                )
+            )
+
+        for name, definition in _indexes(connection, table):
+            shadow_definition = _shadow_index(table, name, definition)
+            if shadow_definition is not None:
+                connection.execute(text(shadow_definition))
+
+        for name, definition in _foreign_keys(connection, table):
+            if "REFERENCES ballots" in definition:
+                continue
+            connection.execute(
+                text(f"ALTER TABLE {shadow} ADD CONSTRAINT {name}{SHADOW_SUFFIX} {definition}")
+            )
+
+        columns = _columns(connection, table)
+        assignments = ", ".join(f"{c} = EXCLUDED.{c}" for c in columns)
+        connection.execute(
+            text(
+                f"CREATE OR REPLACE FUNCTION {table}_sync{SHADOW_SUFFIX}() "
+                "RETURNS trigger AS $$\n"
+                "BEGIN\n"
+                "  IF TG_OP = 'DELETE' THEN\n"
+                f"    DELETE FROM {shadow} WHERE id = OLD.id AND {PARTITION_KEY} = OLD.{PARTITION_KEY};\n"
+                "    RETURN OLD;\n"
+                "  END IF;\n"
+                f"  INSERT INTO {shadow} VALUES (NEW.*)\n"
+                f"  ON CONFLICT (id, {PARTITION_KEY}) DO UPDATE SET {assignments};\n"
+                "  RETURN NEW;\n"
+                "END $$ LANGUAGE plpgsql"
+            )
+        )
+        connection.execute(
+            text(
+                f"CREATE TRIGGER {table}_sync{SHADOW_SUFFIX} "
+                f"AFTER INSERT OR UPDATE OR DELETE ON {table} "
+                f"FOR EACH ROW EXECUTE FUNCTION {table}_sync{SHADOW_SUFFIX}()"
+            )
+        )
+
+
+def id_range(connection: Connection, table: str) -> tuple[int, int]:
+    """
+    Provide the smallest and the largest ids of a table
+    """
+    low, high = connection.execute(text(f"SELECT min(id), max(id) FROM {table}")).one()
+    return (low or 0, high or 0)
+
+
+def copy_batch(connection: Connection, table: str, start: int, stop: int) -> int:
+    """
+    Copy the rows whose id is in [start, stop). Rows already mirrored are kept,
+    since the triggers wrote a version at least as recent.
+
+    The source rows are locked until the batch commits: a row deleted after the
+    snapshot of the statement is skipped instead of being copied back, and a
+    later delete waits for the copy so that its trigger removes the copied row.
+    """
+    result = connection.execute(
+        text(
+            f"INSERT INTO {table}{SHADOW_SUFFIX} "
+            f"SELECT * FROM {table} WHERE id >= :start AND id < :stop FOR SHARE "
+            "ON CONFLICT DO NOTHING"
+        ),
+        {"start": start, "stop": stop},
+    )
+    return result.rowcount
+
+
+def switch(connection: Connection):
+    """
+    Swap the current tables with the partitioned ones.
+
+    It must run in its own transaction: the tables are locked until it commits.
+    """
+    connection.execute(
+        text(f"LOCK TABLE {', '.join(TABLES)} IN ACCESS EXCLUSIVE MODE")
+    )
+    # The view of the compact ballots would follow the renamed table
+    has_view = connection.execute(
+        text("SELECT to_regclass('ballot_votes') IS NOT NULL")
+    ).scalar()
+    connection.execute(text("DROP VIEW IF EXISTS ballot_votes"))
+    for table in TABLES:
+        shadow = table + SHADOW_SUFFIX
+        connection.execute(text(f"DROP TRIGGER {table}_sync{SHADOW_SUFFIX} ON {table}"))
+        connection.execute(text(f"DROP FUNCTION {table}_sync{SHADOW_SUFFIX}()"))
+
+        for name, _ in _indexes(connection, table):
+            connection.execute(text(f"ALTER INDEX {name} RENAME TO {name}{OLD_SUFFIX}"))
+        for name, _ in _indexes(connection, shadow):
+            connection.execute(
+                text(f"ALTER INDEX {name} RENAME TO {name.removesuffix(SHADOW_SUFFIX)}")
+            )
+
+        for name, _ in _foreign_keys(connection, table):
+            connection.execute(
+                text(f"ALTER TABLE {table} RENAME CONSTRAINT {name} TO {name}{OLD_SUFFIX}")
+            )
+        for name, _ in _foreign_keys(connection, shadow):
+            connection.execute(
+                text(
+                    f"ALTER TABLE {shadow} RENAME CONSTRAINT {name} "
+                    f"TO {name.removesuffix(SHADOW_SUFFIX)}"
+                )
+            )
+        connection.execute(
+            text(f"ALTER TABLE {table} RENAME CONSTRAINT {table}_pkey TO {table}{OLD_SUFFIX}_pkey")
+        )
+        connection.execute(
+            text(f"ALTER TABLE {shadow} RENAME CONSTRAINT {shadow}_pkey TO {table}_pkey")
+        )
+
+        connection.execute(text(f"ALTER TABLE {table} RENAME TO {table}{OLD_SUFFIX}"))
+        connection.execute(text(f"ALTER TABLE {shadow} RENAME TO {table}"))
+        # The old table must not take the sequence away when it is dropped
+        connection.execute(text(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id"))
+
+    if has_view:
+        connection.execute(text(BALLOT_VOTES_VIEWS["postgresql"]))
+
+
+def drop_old_tables(connection: Connection):
+    # Votes reference ballots, so they go first
+    for table in reversed(TABLES):
+        connection.execute(text(f"DROP TABLE IF EXISTS {table}{OLD_SUFFIX}"))
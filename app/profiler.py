@@ -0,0 +1,134 @@
+"""
+On-demand sampling profiler.
+
+With PROFILING=True, a request carrying an operator token in the X-Profile
+header (see scripts/create_admin_token.py --operator) is profiled: a thread
+samples the stacks of the worker every PROFILING_INTERVAL seconds while it is
+served. The profile is stored in PROFILING_DIR, in the folded format read by
+flamegraph.pl and speedscope, and its file name is returned in the X-Profile
+header of the response.
+
+All the threads of the worker are sampled, since synchronous routes run in a
+thread pool: profile on an otherwise idle worker. The middleware is not even
+installed when profiling is disabled.
+"""
+import os
+import sys
+import threading
+import time
+import typing as t
+from collections import Counter
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from . import errors
+from .auth import verify_operator_token
+
+HEADER = b"x-profile"
+
+# Leaf frames of the threads waiting for work
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+}
+
+
+def _frame_name(code) -> str:
+    return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+
+
+class Sampler:
+    """
+    Count the stacks of the other threads, sampled at regular intervals
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks: Counter[tuple[str, ...]] = Counter()
+        self.num_samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == threading.get_ident():
+                continue
+            code = frame.f_code
+            if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                continue
+
+            stack = []
+            current: t.Any = frame
+            while current is not None:
+                stack.append(_frame_name(current.f_code))
+                current = current.f_back
+            stack.append(names.get(thread_id, str(thread_id)))
+            self.stacks[tuple(reversed(stack))] += 1
+        self.num_samples += 1
+
+    def folded(self) -> str:
+        """
+        One line per stack: the frames from the root, separated by semicolons,
+        and the number of samples
+        """
+        return "".join(
+            f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common()
+        )
+
+
+class ProfilerMiddleware:
+    def __init__(self, app: ASGIApp, directory: str, interval: float = 0.005):
+        self.app = app
+        self.directory = directory
+        self.interval = interval
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        token = None
+        if scope["type"] == "http":
+            token = dict(scope["headers"]).get(HEADER)
+        if token is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            verify_operator_token(token.decode("latin-1"))
+        except errors.CustomError as exc:
+            response = JSONResponse(
+                status_code=exc.status_code,
+                content={"error": exc.error_code, "message": str(exc)},
+            )
+            await response(scope, receive, send)
+            return
+
+        path = scope["path"].strip("/").replace("/", "_") or "root"
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{scope['method']}-{path}.folded"
+
+        async def send_with_profile(message: Message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((HEADER, name.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        sampler = Sampler(self.interval)
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            sampler.stop()
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, name), "w") as fid:
+                fid.write(sampler.folded())
@@ -0,0 +1,186 @@
+"""
+Provisional results of huge elections, from in-memory sketches.
+
+With PROVISIONAL_RESULTS=True, each worker counts the grades written by the
+ballots it serves, by election, candidate and grade, and a background thread
+adds these counts to `provisional_tallies` every
+PROVISIONAL_CHECKPOINT_INTERVAL seconds. The provisional results are ranked
+from this table without reading the votes, so that they cost the same
+whatever the number of ballots; they miss the ballots of the last interval.
+
+The counts start when the mode is enabled: `rebuild` seeds them from the votes
+of an election.
+"""
+import logging
+import threading
+import typing as t
+from collections import Counter
+
+from sqlalchemy import Engine, delete, func, select
+from sqlalchemy.orm import Session
+
+from . import compact, models
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+Votes = t.Iterable[tuple[t.Any, t.Any]]
+
+_lock = threading.Lock()
+# Grades counted since the last checkpoint, by (election ref, candidate, grade)
+_pending: Counter[tuple[str, int, int]] = Counter()
+
+
+def record(election_ref: str, added: Votes = (), removed: Votes = ()) -> None:
+    """
+    Count the (candidate_id, grade_id) written, and those replaced, by a ballot
+    """
+    if not settings.provisional_results:
+        return
+    with _lock:
+        for candidate_id, grade_id in added:
+            if candidate_id is not None and grade_id is not None:
+                _pending[(election_ref, int(candidate_id), int(grade_id))] += 1
+        for candidate_id, grade_id in removed:
+            if candidate_id is not None and grade_id is not None:
+                _pending[(election_ref, int(candidate_id), int(grade_id))] -= 1
+
+
+def checkpoint(engine: Engine) -> int:
+    """
+    Add the pending counts to provisional_tallies.
+    Return the number of written rows.
+    """
+    global _pending
+    with _lock:
+        pending, _pending = _pending, Counter()
+    rows = [
+        {
+            "election_ref": election_ref,
+            "candidate_id": candidate_id,
+            "grade_id": grade_id,
+            "num_votes": num_votes,
+        }
+        for (election_ref, candidate_id, grade_id), num_votes in pending.items()
+        if num_votes != 0
+    ]
+    if not rows:
+        return 0
+
+    from sqlalchemy.dialects import postgresql, sqlite
+
+    table = models.ProvisionalTally.__table__
+    dialect = postgresql if engine.dialect.name == "postgresql" else sqlite
+    statement = dialect.insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=["election_ref", "candidate_id", "grade_id"],
+        set_={
+            "num_votes": table.c.num_votes + statement.excluded.num_votes,
+            "date_modified": func.now(),
+        },
+    )
+    try:
+        with engine.begin() as connection:
+            connection.execute(statement, rows)
+    except Exception as e:
+        # Kept for the next checkpoint
+        with _lock:
+            _pending.update(pending)
+        raise e
+    return len(rows)
+
+
+def rebuild(db: Session, election_ref: str) -> int:
+    """
+    Replace the provisional counts of an election with the counts of its votes.
+    Return the number of written rows.
+    """
+    db_election = compact.get_hot_election(db, election_ref)
+    if db_election.compact_ballots:
+        view = models.ballot_votes
+        query = (
+            select(view.c.candidate_id, view.c.grade_id, func.count())
+            .filter(view.c.election_ref == election_ref)
+            .group_by(view.c.candidate_id, view.c.grade_id)
+        )
+    else:
+        query = (
+            select(models.Vote.candidate_id, models.Vote.grade_id, func.count())
+            .filter(
+                (models.Vote.election_ref == election_ref)
+                & models.Vote.grade_id.is_not(None)
+            )
+            .group_by(models.Vote.candidate_id, models.Vote.grade_id)
+        )
+    rows = [
+        {
+            "election_ref": election_ref,
+            "candidate_id": candidate_id,
+            "grade_id": grade_id,
+            "num_votes": num_votes,
+        }
+        for candidate_id, grade_id, num_votes in db.execute(query)
+    ]
+
+    table = models.ProvisionalTally.__table__
+    try:
+        db.execute(delete(table).where(table.c.election_ref == election_ref))
+        if rows:
+            db.execute(table.insert(), rows)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise e
+    return len(rows)
+
+
+def tallies_query(election_ref: str):
+    """
+    Count the provisional grades of an election by candidate and grade value,
+    with the date of the last checkpoint which changed them
+    """
+    table = models.ProvisionalTally
+    return (
+        select(
+            table.candidate_id,
+            models.Grade.value,
+            func.sum(table.num_votes),
+            func.max(table.date_modified),
+        )
+        .join(models.Grade, models.Grade.id == table.grade_id)
+        .filter(table.election_ref == election_ref)
+        .group_by(table.candidate_id, models.Grade.value)
+    )
+
+
+class Checkpointer:
+    """
+    Thread running the checkpoints of a worker
+    """
+
+    def __init__(self, engine: Engine, interval: float):
+        self.engine = engine
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="provisional-checkpoints", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        # The counts of the last interval
+        self._checkpoint()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._checkpoint()
+
+    def _checkpoint(self) -> None:
+        try:
+            checkpoint(self.engine)
+        except Exception as e:
+            logger.warning("Provisional checkpoint failed: %s", e)
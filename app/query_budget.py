@@ -0,0 +1,71 @@
+"""
+Budget of SQL statements per request, to catch N+1 queries.
+
+The statements issued by each request are counted by the instrumented engines
+(see metrics.count_sql). A warning is logged when a route exceeds its budget:
+settings.query_budgets for its route template, settings.query_budget otherwise.
+The tests record the counts with `recording()`, so that a route whose number
+of statements grows with the number of candidates fails the CI.
+"""
+import contextlib
+import logging
+import typing as t
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from .metrics import count_sql
+
+logger = logging.getLogger(__name__)
+
+
+class RequestStatements(t.NamedTuple):
+    method: str
+    route: str
+    statements: int
+
+
+_recorders: list[list[RequestStatements]] = []
+
+
+@contextlib.contextmanager
+def recording() -> t.Iterator[list[RequestStatements]]:
+    """
+    Collect the number of statements of the requests served in the block
+    """
+    requests: list[RequestStatements] = []
+    _recorders.append(requests)
+    try:
+        yield requests
+    finally:
+        _recorders.remove(requests)
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, app: ASGIApp, budget: int, budgets: dict[str, int] | None = None):
+        self.app = app
+        self.budget = budget
+        self.budgets = budgets or {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            with count_sql() as stats:
+                await self.app(scope, receive, send)
+        finally:
+            # FastAPI stores the matched route in the scope
+            route = getattr(scope.get("route"), "path", "unmatched")
+            budget = self.budgets.get(route, self.budget)
+            if stats.statements > budget:
+                logger.warning(
+                    "%s %s issued %d SQL statements, over its budget of %d",
+                    scope["method"],
+                    route,
+                    stats.statements,
+                    budget,
+                )
+            for recorder in _recorders:
+                recorder.append(
+                    RequestStatements(scope["method"], route, stats.statements)
+                )
@@ -0,0 +1,282 @@
+"""
+Ranking of many elections at once, with NumPy.
+
+`get_results` ranks one election at a time, and expands its merit profile into
+one list holding every grade of each candidate. Here, the tallies of a batch of
+elections are read with one grouped query, and the majority values of all
+their candidates are compared at once, through keys computed from the
+cumulative counts of their grades.
+
+The majority values of a candidate are its grades sorted by repeatedly taking
+the lower median. After the median of an odd number of grades, they come by
+pairs (the next grade below, the next grade above), whose runs of equal pairs
+start where the cumulative counts are crossed, so that a candidate has at most
+2 × grades runs. Comparing the runs, with their length signed by the direction
+of the next run, compares the majority values.
+
+The ranks are then numbered by `majority_judgment` from the order, so that
+they follow the same conventions as the results of the API.
+"""
+import typing as t
+from collections import defaultdict
+
+import numpy as np
+import numpy.typing as npt
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from . import models
+
+# Elections whose tallies are read by one query
+BATCH_SIZE = 1_000
+# Cells of the intermediate arrays when computing the keys of candidates
+BLOCK_CELLS = 1 << 22
+
+MeritProfile = dict[int, dict[int, int]]
+
+
+class Results(t.NamedTuple):
+    merit_profile: MeritProfile
+    ranking: dict[int, int]
+
+
+def majority_keys(
+    counts: npt.NDArray[np.int64], bound: int | None = None
+) -> npt.NDArray[np.int64]:
+    """
+    Compute keys whose lexicographic order is the order of the majority values,
+    given the (candidates × grades) counts of grades ordered by value.
+
+    Only the keys of candidates with the same number of grades compare, and
+    `bound` must exceed the number of grades of every candidate compared.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    rows, num_grades = counts.shape
+    if bound is None:
+        bound = int(counts.sum(axis=1).max(initial=0)) + 1
+
+    keys = np.empty((rows, 1 + 2 * (1 + 2 * num_grades)), dtype=np.int64)
+    block_size = max(1, BLOCK_CELLS // (num_grades * (1 + 2 * num_grades)))
+    for first in range(0, rows, block_size):
+        block = slice(first, first + block_size)
+        keys[block] = _majority_keys(counts[block], bound)
+    return keys
+
+
+def _majority_keys(counts: npt.NDArray[np.int64], bound: int) -> npt.NDArray[np.int64]:
+    rows, num_grades = counts.shape
+    cum = np.cumsum(counts, axis=1)
+    n = cum[:, -1:]
+    # The k-th pair holds the grades at the sorted positions below - k and
+    # above + k, and there are num_pairs pairs after the median
+    below = n // 2 - 1
+    above = n - n // 2
+    num_pairs = n // 2
+
+    def grade(positions: npt.NDArray[np.int64]) -> npt.NDArray[np.int64]:
+        return (cum[:, None, :] <= positions[:, :, None]).sum(axis=2)
+
+    # Runs start with the first pair, and where a cumulative count is crossed
+    starts = np.concatenate([np.zeros_like(n), below - cum + 1, cum - above], axis=1)
+    starts = np.where((starts < 0) | (starts >= num_pairs), num_pairs, starts)
+    starts.sort(axis=1)
+    duplicates = np.zeros(starts.shape, dtype=bool)
+    duplicates[:, 1:] = starts[:, 1:] == starts[:, :-1]
+    starts = np.where(duplicates, num_pairs, starts)
+    starts.sort(axis=1)
+    valid = starts < num_pairs
+
+    ends = np.concatenate([starts[:, 1:], num_pairs], axis=1)
+    pairs = grade(below - starts) * (num_grades + 1) + grade(above + starts)
+    pairs = np.where(valid, pairs, -1)
+    # A longer run is better when the next one is lower, or when it ends
+    following = np.concatenate([pairs[:, 1:], np.full((rows, 1), -1)], axis=1)
+    lengths = ends - starts
+    lengths = np.where(following > pairs, 2 * bound - lengths, lengths)
+
+    keys = np.empty((rows, 1 + 2 * starts.shape[1]), dtype=np.int64)
+    keys[:, :1] = np.where(n % 2 == 1, grade((n - 1) // 2), -1)
+    keys[:, 1::2] = pairs
+    keys[:, 2::2] = np.where(valid, lengths, 0)
+    return keys
+
+
+def order_groups(
+    groups: npt.NDArray[np.int64], keys: npt.NDArray[np.int64]
+) -> npt.NDArray[np.int64]:
+    """
+    Score the rows within each group, from 0 for the lowest keys, equal keys
+    having the same score
+    """
+    order = np.lexsort([*keys.T[::-1], groups])
+    sorted_groups = groups[order]
+    sorted_keys = keys[order]
+
+    new_group = np.ones(len(order), dtype=bool)
+    new_group[1:] = sorted_groups[1:] != sorted_groups[:-1]
+    changed = new_group.copy()
+    changed[1:] |= (sorted_keys[1:] != sorted_keys[:-1]).any(axis=1)
+    changed[new_group] = False
+    steps = np.cumsum(changed)
+    first = np.maximum.accumulate(np.where(new_group, np.arange(len(order)), 0))
+
+    scores = np.empty(len(order), dtype=np.int64)
+    scores[order] = steps - steps[first]
+    return scores
+
+
+def read_tallies(
+    db: Session, election_refs: t.Sequence[str]
+) -> dict[str, list[tuple[int, int, int]]]:
+    """
+    Read the (candidate_id, grade value, count) tallies of elections, with one
+    query by layout
+    """
+    elections = db.execute(
+        select(
+            models.Election.ref,
+            models.Election.archived,
+            models.Election.compact_ballots,
+        ).filter(models.Election.ref.in_(election_refs))
+    ).all()
+    archived = [ref for ref, is_archived, _ in elections if is_archived]
+    compacts = [ref for ref, is_archived, c in elections if c and not is_archived]
+    others = [ref for ref, is_archived, c in elections if not c and not is_archived]
+
+    tallies: dict[str, list[tuple[int, int, int]]] = defaultdict(list)
+    if others:
+        query = (
+            select(
+                models.Vote.election_ref,
+                models.Vote.candidate_id,
+                models.Grade.value,
+                func.count(models.Vote.id),
+            )
+            .join(models.Vote.grade)
+            .join(models.Vote.candidate)
+            .filter(models.Vote.election_ref.in_(others))
+            .group_by(
+                models.Vote.election_ref, models.Vote.candidate_id, models.Grade.value
+            )
+        )
+        for ref, candidate_id, value, count in db.execute(query):
+            tallies[ref].append((candidate_id, value, count))
+
+    if compacts:
+        view = models.ballot_votes
+        query = (
+            select(
+                view.c.election_ref,
+                view.c.candidate_id,
+                models.Grade.value,
+                func.count(),
+            )
+            .join(models.Grade, models.Grade.id == view.c.grade_id)
+            .filter(view.c.election_ref.in_(compacts))
+            .group_by(view.c.election_ref, view.c.candidate_id, models.Grade.value)
+        )
+        for ref, candidate_id, value, count in db.execute(query):
+            tallies[ref].append((candidate_id, value, count))
+
+    if archived:
+        query = select(
+            models.ElectionArchive.election_ref, models.ElectionArchive.tallies
+        ).filter(models.ElectionArchive.election_ref.in_(archived))
+        for ref, rows in db.execute(query):
+            tallies[ref].extend(tuple(row) for row in rows)
+
+    return tallies
+
+
+def rank_tallies(
+    tallies: t.Mapping[str, t.Sequence[tuple[int, int, int]]],
+) -> dict[str, Results]:
+    """
+    Rank elections given their (candidate_id, grade value, count) tallies.
+    Elections without votes are left out.
+    """
+    from majority_judgment import majority_judgment
+
+    profiles: dict[str, MeritProfile] = {}
+    for ref, rows in tallies.items():
+        profile: MeritProfile = defaultdict(dict)
+        for candidate_id, value, count in rows:
+            profile[candidate_id][value] = count
+        if profile:
+            profiles[ref] = dict(profile)
+
+    refs: list[str] = []
+    candidates: list[int] = []
+    groups: list[int] = []
+    counts: list[list[int]] = []
+    num_grades = max((len(_values(p)) for p in profiles.values()), default=1)
+    results: dict[str, Results] = {}
+    for ref, profile in profiles.items():
+        values = _values(profile)
+        count_rows = [[p.get(value, 0) for value in values] for p in profile.values()]
+        if len({sum(row) for row in count_rows}) > 1:
+            # Majority values of different lengths do not compare by their keys
+            votes = {
+                c: sorted(v for v, count in p.items() for _ in range(count))
+                for c, p in profile.items()
+            }
+            results[ref] = Results(profile, majority_judgment(votes))  # pyright: ignore
+            continue
+        padding = [0] * (num_grades - len(values))
+        groups.extend([len(refs)] * len(count_rows))
+        refs.append(ref)
+        candidates.extend(profile)
+        counts.extend(row + padding for row in count_rows)
+
+    if not refs:
+        return results
+
+    keys = majority_keys(np.array(counts, dtype=np.int64).reshape(-1, num_grades))
+    scores = order_groups(np.array(groups), keys)
+
+    by_group: list[dict[int, list[int]]] = [{} for _ in refs]
+    for group, candidate_id, score in zip(groups, candidates, scores):
+        by_group[group][candidate_id] = [int(score)]
+    for ref, group_votes in zip(refs, by_group):
+        # One grade per candidate, which carries its order
+        ranking = majority_judgment(group_votes)  # pyright: ignore
+        results[ref] = Results(profiles[ref], ranking)
+    return results
+
+
+def _values(profile: MeritProfile) -> list[int]:
+    return sorted({value for grades in profile.values() for value in grades})
+
+
+def rank_elections(db: Session, election_refs: t.Sequence[str]) -> dict[str, Results]:
+    results: dict[str, Results] = {}
+    for first in range(0, len(election_refs), BATCH_SIZE):
+        batch = election_refs[first : first + BATCH_SIZE]
+        results.update(rank_tallies(read_tallies(db, batch)))
+    return results
+
+
+def save_results(db: Session, results: t.Mapping[str, Results]) -> None:
+    """
+    Replace the stored results of elections, with one statement of each kind
+    """
+    if not results:
+        return
+    table = models.ElectionResults.__table__
+    try:
+        db.execute(delete(table).where(table.c.election_ref.in_(list(results))))
+        db.execute(
+            insert(table),
+            [
+                {
+                    "election_ref": ref,
+                    "merit_profile": r.merit_profile,
+                    "ranking": r.ranking,
+                }
+                for ref, r in results.items()
+            ],
+        )
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise e
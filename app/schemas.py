@@ -1,7 +1,6 @@
 import typing as t
 from typing_extensions import Self
 from datetime import datetime, timedelta, timezone
-import dateutil.parser
 from pydantic import BaseModel, Field, field_validator, ValidationInfo, model_validator
 from pydantic_settings import SettingsConfigDict
 from .settings import settings
@@ -92,6 +91,8 @@ def parse_date(value:datetime | int | str | None):
     elif isinstance(value, int):
         value_as_datetime = datetime.fromtimestamp(value)
     else:
+        import dateutil.parser
+
         try:
             value_as_datetime = dateutil.parser.parse(value)
         except dateutil.parser.ParserError:
@@ -151,6 +152,13 @@ class ResultsGet(ElectionGet):
     ranking: dict[int, int] = {}
 
 
+class ProvisionalResultsGet(ResultsGet):
+    # Last checkpoint of the counts: the ballots of the checkpoint_interval
+    # seconds before it may be missing
+    date_checkpoint: datetime
+    checkpoint_interval: float
+
+
 class ElectionCreatedGet(ElectionGet):
     invites: list[str] = []
     admin: str = ""
@@ -308,3 +316,39 @@ class BallotUpdate(BaseModel):
 class Progress(BaseModel):
     num_voters: int | None
     num_voters_voted: int
+
+
+class Stability(BaseModel):
+    num_samples: int
+    # Seconds spent resampling
+    duration: float
+    # Share of the resamples giving each rank to each candidate, from the first
+    ranks: dict[int, list[float]]
+
+
+class TimelineBucket(BaseModel):
+    date_start: datetime
+    num_ballots: int
+    # Number of votes by grade value of each candidate
+    grades: dict[int, dict[int, int]]
+
+
+class Timeline(BaseModel):
+    period: str
+    buckets: list[TimelineBucket]
+
+
+class CacheStats(BaseModel):
+    namespace: str
+    hits: int
+    misses: int
+    evictions: int
+
+
+class SlowQuery(BaseModel):
+    statement: str
+    count: int
+    total_ms: float
+    max_ms: float
+    parameters: t.Any = None
+    plan: str | None = None
@@ -0,0 +1,101 @@
+"""
+Production server: gunicorn managing uvicorn workers.
+
+    python -m app.server
+
+The application is imported once by the master (preload), then the workers are
+forked from it. They start in milliseconds and share the memory pages of the
+imported code. Workers are recycled after a number of requests, with a jitter
+so that they do not restart all at once, and they finish the requests in
+flight when they stop.
+
+Everything a worker inherits from the master is reset after the fork: database
+connection pools are dropped and the random generator is reseeded. Set
+PROMETHEUS_MULTIPROC_DIR so that /metrics aggregates the metrics of all the
+workers.
+"""
+import os
+import random
+import typing as t
+from gunicorn.app.base import BaseApplication
+from .settings import settings
+
+
+def num_workers() -> int:
+    """
+    Count the CPUs available to the process, which may be less than the CPUs
+    of the machine (e.g. in a container)
+    """
+    if settings.workers > 0:
+        return settings.workers
+    try:
+        num_cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        num_cpus = os.cpu_count() or 1
+    # Sync routes run in a thread pool, so a worker is mostly bound by one CPU
+    return num_cpus + 1
+
+
+def post_fork(server, worker):
+    from .database import dispose_engines_after_fork
+
+    dispose_engines_after_fork()
+    # Otherwise all the workers would generate the same election refs
+    random.seed()
+
+
+def child_exit(server, worker):
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
+
+
+class Server(BaseApplication):
+    def __init__(self, options: dict[str, t.Any]):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from .main import app
+
+        return app
+
+
+def options() -> dict[str, t.Any]:
+    return {
+        "bind": settings.bind,
+        "workers": num_workers(),
+        "worker_class": "uvicorn.workers.UvicornWorker",
+        "preload_app": True,
+        "max_requests": settings.max_requests,
+        "max_requests_jitter": settings.max_requests_jitter,
+        "graceful_timeout": settings.graceful_timeout,
+        "post_fork": post_fork,
+        "child_exit": child_exit,
+        # Requests arrive through traefik
+        "forwarded_allow_ips": "*",
+        "accesslog": "-",
+    }
+
+
+def clear_metrics():
+    """
+    Remove the metrics left by the workers of a previous run
+    """
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if directory is None:
+        return
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name.endswith(".db"):
+            os.remove(os.path.join(directory, name))
+
+
+if __name__ == "__main__":
+    clear_metrics()
+    Server(options()).run()
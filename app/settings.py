@@ -6,6 +6,10 @@ class Settings(BaseSettings):
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")	
 
     sqlite: bool = False
+    # With sqlite, enable WAL and performance pragmas, and write through a single connection
+    sqlite_tuned: bool = True
+    # Serve the hot routes with an asyncio driver (asyncpg, or aiosqlite with sqlite)
+    async_db: bool = False
 
     secret: str = ""
     aes_key: bytes = b""
@@ -16,6 +20,90 @@ class Settings(BaseSettings):
     postgres_host: str = "mj_db"
     postgres_port: int = 5432
 
+    # Read-only routes can be served by replicas, given as SQLAlchemy URLs
+    replica_urls: list[str] = []
+    # Seconds between two health checks of a replica
+    replica_health_check_interval: float = 10.0
+    # Seconds during which a client that just wrote is read from the primary
+    replica_stickiness: float = 10.0
+
+    # New elections store each ballot as one row with packed grades (see app.compact)
+    compact_ballots: bool = False
+
+    # Memory-mapped snapshots of the grades of elections (see app.snapshots)
+    snapshots_dir: str = "snapshots"
+
+    # Bootstrap of the rankings (see app.stability): largest number of samples,
+    # and seconds after which the resampling stops
+    stability_max_samples: int = 100_000
+    stability_time_budget: float = 5.0
+
+    # Count the grades of the ballots in memory, for the provisional results of
+    # the admins (see app.provisional), and save them every interval in seconds
+    provisional_results: bool = False
+    provisional_checkpoint_interval: float = 10.0
+
+    # Largest number of buckets returned by the timeline (see app.timeline)
+    timeline_max_buckets: int = 10_000
+
+    # Cache of the elections, results and responses (see app.cache): entries
+    # kept by each worker, seconds before they expire, and URL of a store shared
+    # by the workers, e.g. redis://localhost:6379/0 (requires the redis package)
+    cache: bool = False
+    cache_max_entries: int = 10_000
+    cache_ttl: float = 60.0
+    cache_url: str = ""
+    # Seconds a request waits for the value computed by a concurrent request,
+    # before computing it itself
+    cache_wait_timeout: float = 10.0
+
+    # Tell the other workers when an election is written, so that they evict
+    # their cached copies (see app.database.InvalidationBus). On SQLite, the
+    # workers poll the writes every interval in seconds.
+    invalidation_bus: bool = False
+    invalidation_poll_interval: float = 1.0
+
+    # Days after their closing before the ballots of elections are archived
+    archive_retention_days: int = 365
+
+    # Expose Prometheus metrics on /metrics. The route is not authenticated:
+    # keep it out of reach of the public when it is enabled.
+    metrics: bool = False
+
+    # Warn when a request issues more SQL statements (0 disables the check)
+    query_budget: int = 20
+    # Budgets of specific routes, by route template, e.g. {"/elections": 30}
+    query_budgets: dict[str, int] = {}
+
+    # Log the SQL statements slower than this, in milliseconds, e.g. 500
+    # (0 disables it)
+    slow_query_ms: float = 0
+    # Rotating log of the slow statements and their plan
+    slow_query_log: str = "slow_queries.log"
+    slow_query_log_max_bytes: int = 10_000_000
+    slow_query_log_backups: int = 5
+
+    # Profile the requests carrying an operator token in the X-Profile header
+    profiling: bool = False
+    # Seconds between two samples of the stacks
+    profiling_interval: float = 0.005
+    # Profiles are stored in the folded format of flamegraph.pl and speedscope
+    profiling_dir: str = "profiles"
+
+    # Export the spans of the requests as OTLP-JSON to this file, or to stdout
+    # with "-" (empty disables the tracing)
+    tracing_export: str = ""
+
+    # Production server (python -m app.server)
+    bind: str = "0.0.0.0:8877"
+    # 0 derives the number of workers from the number of CPUs
+    workers: int = 0
+    # Recycle a worker after this number of requests (plus a random jitter)
+    max_requests: int = 10_000
+    max_requests_jitter: int = 1_000
+    # Seconds given to the requests in flight when a worker stops
+    graceful_timeout: int = 30
+
     max_grades: int = 100
     max_candidates: int = 1000
     max_voters: int = 1_000_000
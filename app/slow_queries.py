@@ -0,0 +1,176 @@
+"""
+Log of the slow SQL statements, with their plan.
+
+Statements slower than settings.slow_query_ms are written as JSON lines to a
+rotating log file, with their parameters (tokens redacted) and the plan given
+by EXPLAIN (the statement is not executed a second time). Each worker also
+aggregates them by statement, so that operators can list the statements that
+took the most time with GET /admin/slow-queries.
+"""
+import json
+import logging
+import re
+import threading
+import time
+import typing as t
+from logging.handlers import RotatingFileHandler
+from sqlalchemy import Engine, event
+
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Signed tokens, such as ballot and admin tokens
+TOKEN_PATTERN = re.compile(r"^[\w-]+\.[\w-]+\.[\w-]+$")
+SENSITIVE_KEYS = ("token", "password", "secret")
+REDACTED = "<redacted>"
+
+# Lists of placeholders, whose length depends on the parameters (IN clauses)
+PLACEHOLDER_LIST = re.compile(
+    r"\(\s*(?:\?|%\(\w+\)s|\$\d+)(?:\s*,\s*(?:\?|%\(\w+\)s|\$\d+))+\s*\)"
+)
+EXPLAINABLE = ("select", "insert", "update", "delete", "with")
+
+
+def redact(parameters: t.Any, key: str = "") -> t.Any:
+    """
+    Hide the tokens and secrets among the parameters of a statement
+    """
+    if isinstance(parameters, dict):
+        return {k: redact(v, str(k)) for k, v in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [redact(v, key) for v in parameters]
+    if isinstance(parameters, str) and (
+        TOKEN_PATTERN.match(parameters) or any(s in key.lower() for s in SENSITIVE_KEYS)
+    ):
+        return REDACTED
+    if parameters is None or isinstance(parameters, (bool, int, float, str)):
+        return parameters
+    return str(parameters)
+
+
+def normalize(statement: str) -> str:
+    return PLACEHOLDER_LIST.sub("(...)", " ".join(statement.split()))
+
+
+class SlowQueryLog:
+    def __init__(
+        self,
+        threshold_ms: float,
+        path: str | None = None,
+        max_bytes: int = 10_000_000,
+        backup_count: int = 5,
+    ):
+        self.threshold = threshold_ms / 1000
+        # The file is only created by the first slow statement
+        self._handler = (
+            RotatingFileHandler(
+                path, maxBytes=max_bytes, backupCount=backup_count, delay=True
+            )
+            if path
+            else None
+        )
+        self._lock = threading.Lock()
+        self._stats: dict[str, dict[str, t.Any]] = {}
+
+    def instrument(self, engine: Engine):
+        def before(conn, cursor, statement, parameters, context, executemany):
+            context.slow_query_start = time.perf_counter()
+
+        def after(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - context.slow_query_start
+            if elapsed >= self.threshold:
+                if executemany:
+                    parameters = parameters[0] if parameters else None
+                plan = self.explain(conn, statement, parameters)
+                self.record(statement, parameters, elapsed, plan, executemany)
+
+        event.listen(engine, "before_cursor_execute", before)
+        event.listen(engine, "after_cursor_execute", after)
+
+    def explain(self, conn, statement: str, parameters: t.Any) -> str | None:
+        """
+        Plan a statement on the connection that ran it, without running it again
+        """
+        if not statement.lstrip().lower().startswith(EXPLAINABLE):
+            return None
+
+        dialect = conn.dialect.name
+        prefix = "EXPLAIN QUERY PLAN " if dialect == "sqlite" else "EXPLAIN (ANALYZE off) "
+        # On PostgreSQL, a failure would abort the transaction of the request
+        savepoint = dialect == "postgresql"
+        cursor = conn.connection.cursor()
+        try:
+            if savepoint:
+                cursor.execute("SAVEPOINT slow_query_explain")
+            try:
+                if parameters:
+                    cursor.execute(prefix + statement, parameters)
+                else:
+                    cursor.execute(prefix + statement)
+                rows = cursor.fetchall()
+            except Exception as e:
+                if savepoint:
+                    cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+                logger.warning("Can not explain a slow statement: %s", e)
+                return None
+            if savepoint:
+                cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+        finally:
+            cursor.close()
+
+        # PostgreSQL gives a line of text per row, SQLite (id, parent, _, detail)
+        return "\n".join(str(row[-1]) for row in rows)
+
+    def record(
+        self,
+        statement: str,
+        parameters: t.Any,
+        elapsed: float,
+        plan: str | None = None,
+        executemany: bool = False,
+    ):
+        entry = {
+            "time": time.time(),
+            "duration_ms": 1000 * elapsed,
+            "statement": statement,
+            "parameters": redact(parameters),
+            "executemany": executemany,
+            "plan": plan,
+        }
+        key = normalize(statement)
+
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = {
+                    "statement": key,
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                }
+            stats["count"] += 1
+            stats["total_ms"] += entry["duration_ms"]
+            stats["max_ms"] = max(stats["max_ms"], entry["duration_ms"])
+            stats["parameters"] = entry["parameters"]
+            stats["plan"] = plan
+
+        if self._handler is not None:
+            self._handler.handle(logging.makeLogRecord({"msg": json.dumps(entry)}))
+
+    def top(self, limit: int = 10) -> list[dict[str, t.Any]]:
+        """
+        Provide the slow statements that took the most time in total
+        """
+        with self._lock:
+            stats = [dict(s) for s in self._stats.values()]
+        stats.sort(key=lambda s: s["total_ms"], reverse=True)
+        return stats[:limit]
+
+
+slow_query_log = SlowQueryLog(
+    settings.slow_query_ms,
+    settings.slow_query_log,
+    settings.slow_query_log_max_bytes,
+    settings.slow_query_log_backups,
+)
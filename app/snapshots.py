@@ -0,0 +1,357 @@
+"""
+Columnar snapshots of the grades of an election, for analytics.
+
+A snapshot is a directory named after the election, holding:
+- grades.npy, a (ballots × candidates) uint8 matrix: the position of the grade
+  given to each candidate among the grades ordered by value (1 is the lowest),
+  or 0 without grade. The candidates are ordered by id;
+- dates.npy, the creation date of each ballot;
+- meta.json, the candidates and grades of the election.
+
+The arrays are opened as read-only memory maps: the worker processes of a
+machine share their pages in the page cache, and what-if computations (without
+some candidates, or within a time window) no longer query the database.
+"""
+import json
+import os
+import shutil
+import typing as t
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import numpy.typing as npt
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from . import compact, errors, models
+from .settings import settings
+
+# Rows fetched from the cursor at once
+YIELD_PER = 10_000
+# Cells processed at once when counting the grades
+BLOCK_CELLS = 1 << 20
+# Snapshots kept open by each process
+MAX_OPEN_SNAPSHOTS = 32
+
+
+def _directory(directory: str | os.PathLike[str] | None) -> Path:
+    return Path(settings.snapshots_dir if directory is None else directory)
+
+
+def write_snapshot(
+    db: Session, election_ref: str, directory: str | os.PathLike[str] | None = None
+) -> Path:
+    """
+    Write the snapshot of the ballots of an election, replacing the former one.
+    Return its path.
+    """
+    db_election = compact.get_hot_election(db, election_ref)
+    candidate_ids, grade_ids = compact.sorted_ids(db_election)
+    grades = sorted(db_election.grades, key=lambda g: (int(g.value), int(g.id)))
+    # Position of each grade id in the order of the values
+    positions = {int(g.id): i + 1 for i, g in enumerate(grades)}
+
+    if db_election.compact_ballots:
+        num_ballots = db.scalar(
+            select(func.count(models.Ballot.grades)).filter(
+                models.Ballot.election_ref == election_ref
+            )
+        )
+        rows = _iter_compact_rows(db, election_ref, candidate_ids, grade_ids, positions)
+    else:
+        num_ballots = db.scalar(
+            select(func.count(func.distinct(models.Vote.ballot_id))).filter(
+                (models.Vote.election_ref == election_ref)
+                & models.Vote.ballot_id.is_not(None)
+                & models.Vote.grade_id.is_not(None)
+            )
+        )
+        rows = _iter_vote_rows(db, election_ref, candidate_ids, positions)
+
+    if not num_ballots:
+        raise errors.NoRecordedVotes()
+
+    root = _directory(directory)
+    root.mkdir(parents=True, exist_ok=True)
+    path = root / election_ref
+    tmp = root / f".{election_ref}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir()
+    try:
+        capacity = int(num_ballots)
+        matrix = np.lib.format.open_memmap(
+            tmp / "grades.npy",
+            mode="w+",
+            dtype=np.uint8,
+            shape=(capacity, len(candidate_ids)),
+        )
+        dates = np.lib.format.open_memmap(
+            tmp / "dates.npy", mode="w+", dtype="datetime64[s]", shape=(capacity,)
+        )
+        # Ballots cast after the count are left out, and the ballots deleted
+        # since are cut off by num_ballots
+        filled = 0
+        for block, block_dates in rows:
+            size = min(len(block), capacity - filled)
+            matrix[filled : filled + size] = block[:size]
+            dates[filled : filled + size] = block_dates[:size]
+            filled += size
+            if filled == capacity:
+                break
+        matrix.flush()
+        dates.flush()
+        del matrix, dates
+
+        meta = {
+            "election_ref": election_ref,
+            "num_ballots": filled,
+            "candidate_ids": candidate_ids,
+            "grade_ids": [int(g.id) for g in grades],
+            "grade_values": [int(g.value) for g in grades],
+            "date_created": datetime.now().isoformat(),
+        }
+        with open(tmp / "meta.json", "w") as fid:
+            json.dump(meta, fid)
+
+        # Processes which mapped the former snapshot keep reading its files
+        former = root / f".{election_ref}.{os.getpid()}.old"
+        if path.exists():
+            os.rename(path, former)
+        os.rename(tmp, path)
+        shutil.rmtree(former, ignore_errors=True)
+    except Exception as e:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise e
+
+    return path
+
+
+def _iter_vote_rows(
+    db: Session, election_ref: str, candidate_ids: list[int], positions: dict[int, int]
+) -> t.Iterator[tuple[npt.NDArray[np.uint8], npt.NDArray[np.datetime64]]]:
+    index = {candidate_id: i for i, candidate_id in enumerate(candidate_ids)}
+    query = (
+        select(
+            models.Vote.ballot_id,
+            models.Vote.candidate_id,
+            models.Vote.grade_id,
+            models.Ballot.date_created,
+        )
+        .join(models.Ballot, models.Ballot.id == models.Vote.ballot_id)
+        .filter(models.Vote.election_ref == election_ref)
+        .order_by(models.Vote.ballot_id)
+    )
+    block_size = max(1, BLOCK_CELLS // max(1, len(index)))
+    block: list[list[int]] = []
+    dates: list[datetime | None] = []
+
+    current = None
+    row: list[int] = []
+    date = None
+    for ballot_id, candidate_id, grade_id, date_created in db.execute(
+        query, execution_options={"yield_per": YIELD_PER}
+    ):
+        if ballot_id != current:
+            # The invites that did not vote are skipped
+            if any(row):
+                block.append(row)
+                dates.append(date)
+            if len(block) >= block_size:
+                yield _block(block, dates)
+                block, dates = [], []
+            current, row, date = ballot_id, [0] * len(index), date_created
+        if candidate_id in index and grade_id is not None:
+            row[index[candidate_id]] = positions[grade_id]
+    if any(row):
+        block.append(row)
+        dates.append(date)
+    if block:
+        yield _block(block, dates)
+
+
+def _iter_compact_rows(
+    db: Session,
+    election_ref: str,
+    candidate_ids: list[int],
+    grade_ids: list[int],
+    positions: dict[int, int],
+) -> t.Iterator[tuple[npt.NDArray[np.uint8], npt.NDArray[np.datetime64]]]:
+    # Packed grades are positions among the grades ordered by id
+    lookup = np.zeros(256, dtype=np.uint8)
+    for i, grade_id in enumerate(grade_ids):
+        lookup[i + 1] = positions[grade_id]
+
+    num_candidates = len(candidate_ids)
+    query = (
+        select(models.Ballot.grades, models.Ballot.date_created)
+        .filter(
+            (models.Ballot.election_ref == election_ref)
+            & models.Ballot.grades.is_not(None)
+        )
+        .order_by(models.Ballot.id)
+    )
+    block_size = max(1, BLOCK_CELLS // max(1, num_candidates))
+    packed: list[bytes] = []
+    dates: list[datetime | None] = []
+    for grades, date_created in db.execute(
+        query, execution_options={"yield_per": YIELD_PER}
+    ):
+        # Candidates added after the ballot was cast have no grade
+        packed.append(bytes(grades[:num_candidates]).ljust(num_candidates, b"\0"))
+        dates.append(date_created)
+        if len(packed) >= block_size:
+            yield _compact_block(packed, dates, lookup, num_candidates)
+            packed, dates = [], []
+    if packed:
+        yield _compact_block(packed, dates, lookup, num_candidates)
+
+
+def _block(
+    rows: list[list[int]], dates: list[datetime | None]
+) -> tuple[npt.NDArray[np.uint8], npt.NDArray[np.datetime64]]:
+    return np.array(rows, dtype=np.uint8), np.array(dates, dtype="datetime64[s]")
+
+
+def _compact_block(
+    packed: list[bytes],
+    dates: list[datetime | None],
+    lookup: npt.NDArray[np.uint8],
+    num_candidates: int,
+) -> tuple[npt.NDArray[np.uint8], npt.NDArray[np.datetime64]]:
+    matrix = np.frombuffer(b"".join(packed), dtype=np.uint8)
+    matrix = lookup[matrix].reshape(len(packed), num_candidates)
+    return matrix, np.array(dates, dtype="datetime64[s]")
+
+
+class Snapshot:
+    """
+    Read-only view on the snapshot of an election
+    """
+
+    def __init__(self, path: str | os.PathLike[str]):
+        self.path = Path(path)
+        with open(self.path / "meta.json") as fid:
+            meta = json.load(fid)
+        self.election_ref: str = meta["election_ref"]
+        self.candidate_ids: list[int] = meta["candidate_ids"]
+        self.grade_ids: list[int] = meta["grade_ids"]
+        self.grade_values: list[int] = meta["grade_values"]
+        self.date_created = datetime.fromisoformat(meta["date_created"])
+
+        num_ballots = meta["num_ballots"]
+        self.grades: npt.NDArray[np.uint8] = np.load(
+            self.path / "grades.npy", mmap_mode="r"
+        )
+        self.grades = self.grades[:num_ballots]
+        self.dates: npt.NDArray[np.datetime64] = np.load(
+            self.path / "dates.npy", mmap_mode="r"
+        )
+        self.dates = self.dates[:num_ballots]
+        self._counts: dict[tuple[t.Any, t.Any], npt.NDArray[np.int64]] = {}
+
+    @property
+    def num_ballots(self) -> int:
+        return len(self.grades)
+
+    def counts(
+        self, start: datetime | None = None, end: datetime | None = None
+    ) -> npt.NDArray[np.int64]:
+        """
+        Count the grades of each candidate, as a (candidates × grades) array,
+        from the ballots cast in [start, end)
+        """
+        key = (start, end)
+        if key not in self._counts:
+            self._counts[key] = self._count(start, end)
+        return self._counts[key]
+
+    def _count(
+        self, start: datetime | None, end: datetime | None
+    ) -> npt.NDArray[np.int64]:
+        num_candidates = len(self.candidate_ids)
+        width = len(self.grade_ids) + 1
+        # Shift the grades of each candidate to its own range of bins, to count
+        # a whole block of ballots with a single bincount
+        offsets = np.arange(num_candidates, dtype=np.intp) * width
+        counts = np.zeros(num_candidates * width, dtype=np.int64)
+        block_size = max(1, BLOCK_CELLS // max(1, num_candidates))
+        for first in range(0, self.num_ballots, block_size):
+            block = self.grades[first : first + block_size]
+            if start is not None or end is not None:
+                dates = self.dates[first : first + block_size]
+                mask = np.ones(len(dates), dtype=bool)
+                if start is not None:
+                    mask &= dates >= np.datetime64(start, "s")
+                if end is not None:
+                    mask &= dates < np.datetime64(end, "s")
+                block = block[mask]
+            counts += np.bincount((block + offsets).ravel(), minlength=len(counts))
+        # Drop the bins of the missing grades
+        return counts.reshape(num_candidates, width)[:, 1:]
+
+    def merit_profile(
+        self,
+        exclude: t.Iterable[int] = (),
+        start: datetime | None = None,
+        end: datetime | None = None,
+    ) -> dict[int, dict[int, int]]:
+        """
+        Number of votes by grade value of each candidate, as in the results
+        """
+        excluded = set(exclude)
+        counts = self.counts(start, end)
+        return {
+            candidate_id: {
+                value: int(count)
+                for value, count in zip(self.grade_values, counts[i])
+                if count > 0
+            }
+            for i, candidate_id in enumerate(self.candidate_ids)
+            if candidate_id not in excluded and counts[i].any()
+        }
+
+    def ranking(
+        self,
+        exclude: t.Iterable[int] = (),
+        start: datetime | None = None,
+        end: datetime | None = None,
+    ) -> dict[int, int]:
+        """
+        Rank the candidates as the results do, given the same ballots
+        """
+        from majority_judgment import majority_judgment
+
+        merit_profile = self.merit_profile(exclude, start, end)
+        if not merit_profile:
+            raise errors.NoRecordedVotes()
+        votes = {
+            candidate_id: np.repeat(list(profile), list(profile.values())).tolist()
+            for candidate_id, profile in merit_profile.items()
+        }
+        return majority_judgment(votes)  # pyright: ignore
+
+
+def load_snapshot(
+    election_ref: str, directory: str | os.PathLike[str] | None = None
+) -> Snapshot:
+    """
+    Open the snapshot of an election, once per process until it is rewritten
+    """
+    path = _directory(directory) / election_ref
+    try:
+        mtime = (path / "meta.json").stat().st_mtime_ns
+    except FileNotFoundError:
+        raise errors.NotFoundError("snapshots")
+
+    cached = _snapshots.get(str(path))
+    if cached is None or cached[0] != mtime:
+        if len(_snapshots) >= MAX_OPEN_SNAPSHOTS:
+            _snapshots.pop(next(iter(_snapshots)))
+        cached = (mtime, Snapshot(path))
+        _snapshots[str(path)] = cached
+    return cached[1]
+
+
+# Snapshots opened by this process, by path, with the mtime of their metadata
+_snapshots: dict[str, tuple[int, Snapshot]] = {}
@@ -0,0 +1,130 @@
+"""
+Stability of the ranking of an election, by bootstrap.
+
+The grades of each candidate are redrawn from its merit profile, with one
+multinomial draw per candidate and resample, and every resample is ranked, to
+tell how often each candidate gets each rank. Only the tallies are read: the
+grades of the candidates are redrawn independently, since the ballots are not.
+
+The resamples are drawn and ranked by batches of arrays, with the keys of
+app.ranking, until the number of samples or the time budget is reached.
+"""
+import time
+import typing as t
+
+import numpy as np
+import numpy.typing as npt
+from sqlalchemy.orm import Session
+
+from . import crud, errors, ranking, schemas
+from .auth import jws_verify
+from .settings import settings
+
+# Cells of the resampled counts of a batch
+BATCH_CELLS = 1 << 20
+
+
+class Resamples(t.NamedTuple):
+    # Number of resamples giving each rank (columns, the first place first)
+    # to each candidate (rows)
+    ranks: npt.NDArray[np.int64]
+    num_samples: int
+
+
+def resample_ranks(
+    counts: npt.NDArray[np.int64],
+    samples: int,
+    time_budget: float | None = None,
+    seed: int | None = None,
+) -> Resamples:
+    """
+    Rank resamples of the (candidates × grades) counts of grades ordered by
+    value. Tied candidates share the best of their ranks.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    num_candidates, num_grades = counts.shape
+    totals = counts.sum(axis=1)
+    if (totals == 0).any():
+        raise ValueError("Every candidate needs grades")
+    # A candidate added late is redrawn with as many grades as the others
+    num_votes = int(totals.max())
+    probabilities = counts / totals[:, None]
+
+    rng = np.random.default_rng(seed)
+    batch_size = max(1, BATCH_CELLS // (num_candidates * num_grades))
+    deadline = None if time_budget is None else time.monotonic() + time_budget
+    ranks = np.zeros((num_candidates, num_candidates), dtype=np.int64)
+    num_samples = 0
+    while num_samples < samples:
+        size = min(batch_size, samples - num_samples)
+        shape = (size, num_candidates)
+        draws = rng.multinomial(num_votes, probabilities, size=shape)
+        keys = ranking.majority_keys(draws.reshape(-1, num_grades), num_votes + 1)
+        groups = np.repeat(np.arange(size), num_candidates)
+        scores = ranking.order_groups(groups, keys).reshape(size, num_candidates)
+
+        # The rank is the number of candidates with a higher score
+        flat = (scores + num_candidates * np.arange(size)[:, None]).ravel()
+        histograms = np.bincount(flat, minlength=size * num_candidates)
+        at_most = np.cumsum(histograms.reshape(size, num_candidates), axis=1)
+        higher = num_candidates - np.take_along_axis(at_most, scores, axis=1)
+        for candidate in range(num_candidates):
+            ranks[candidate] += np.bincount(
+                higher[:, candidate], minlength=num_candidates
+            )
+
+        num_samples += size
+        if deadline is not None and time.monotonic() > deadline:
+            break
+
+    return Resamples(ranks, num_samples)
+
+
+def get_stability(
+    db: Session,
+    election_ref: str,
+    token: str,
+    samples: int,
+    time_budget: float | None = None,
+    seed: int | None = None,
+) -> schemas.Stability:
+    payload = jws_verify(token)
+    if payload["election"] != election_ref:
+        raise errors.UnauthorizedError("Wrong election ref")
+    if not payload.get("admin"):
+        raise errors.ForbiddenError("You are not allowed to manage the election")
+    max_samples = settings.stability_max_samples
+    if not 0 < samples <= max_samples:
+        raise errors.BadRequestError(
+            f"The number of samples must be between 1 and {max_samples}"
+        )
+    budget = settings.stability_time_budget
+    if time_budget is not None:
+        budget = min(budget, time_budget)
+
+    db_election = crud.get_election(db, election_ref)
+    # The shares of the ranks disclose the ranking
+    crud._check_results_are_visible(db_election, election_ref, token)
+    if db_election.archived:
+        tallies = t.cast(list[t.Any], crud.get_archive(db, election_ref).tallies)
+    else:
+        tallies = crud.get_tallies(db, election_ref, bool(db_election.compact_ballots))
+    if not tallies:
+        raise errors.NoRecordedVotes()
+
+    candidate_ids = sorted({int(row[0]) for row in tallies})
+    values = sorted({int(row[1]) for row in tallies})
+    counts = np.zeros((len(candidate_ids), len(values)), dtype=np.int64)
+    rows = {candidate_id: i for i, candidate_id in enumerate(candidate_ids)}
+    columns = {value: i for i, value in enumerate(values)}
+    for candidate_id, value, count in tallies:
+        counts[rows[int(candidate_id)], columns[int(value)]] = count
+
+    tic = time.monotonic()
+    resamples = resample_ranks(counts, samples, budget, seed)
+    shares = resamples.ranks / resamples.num_samples
+    return schemas.Stability(
+        num_samples=resamples.num_samples,
+        duration=time.monotonic() - tic,
+        ranks={c: shares[i].tolist() for i, c in enumerate(candidate_ids)},
+    )
@@ -0,0 +1,78 @@
+"""
+Fixtures and helpers shared by the tests that run on their own database
+"""
+import typing as t
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from ..database import Base
+from .. import crud, schemas
+
+
+@pytest.fixture
+def engine(tmp_path) -> t.Iterator[Engine]:
+    """
+    Provide an empty SQLite database to each test
+    """
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False}
+    )
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db(engine: Engine) -> t.Iterator[Session]:
+    db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def async_url(engine: Engine) -> str:
+    """
+    Provide the URL of the database of a test for the asyncio driver
+    """
+    return engine.url.set(drivername="sqlite+aiosqlite").render_as_string()
+
+
+def create_election(
+    db: Session,
+    num_voters: int,
+    num_candidates: int = 3,
+    grade_values: t.Sequence[int] = range(4),
+) -> schemas.ElectionCreatedGet:
+    """
+    Create a restricted election, whose results are not hidden
+    """
+    return crud.create_election(
+        db,
+        schemas.ElectionCreate(
+            name="Foo",
+            hide_results=False,
+            restricted=True,
+            num_voters=num_voters,
+            date_start=None,
+            candidates=[{"name": f"candidate {i}"} for i in range(num_candidates)],  # type: ignore
+            grades=[{"name": f"grade {i}", "value": v} for i, v in enumerate(grade_values)],  # type: ignore
+        ),
+    )
+
+
+def vote(
+    db: Session, election: schemas.ElectionCreatedGet, token: str, grades: list[int]
+) -> schemas.BallotGet:
+    """
+    Give to each candidate the grade at the same position in `grades`
+    """
+    ballot = schemas.BallotUpdate(
+        votes=[
+            schemas.VoteCreate(candidate_id=c.id, grade_id=election.grades[g].id)
+            for c, g in zip(election.candidates, grades)
+        ]
+    )
+    return crud.update_ballot(db, ballot, token)
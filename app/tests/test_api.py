@@ -4,14 +4,17 @@ from datetime import datetime, timedelta
 import typing as t
 
 import random
+import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 from app.auth import jws_verify
-from ..database import Base, get_db
-from .. import schemas
+from ..database import Base, get_async_db, get_db, get_read_db
+from .. import metrics, query_budget, schemas
 from ..main import app
+from ..settings import settings
 
 test_database_url = "sqlite:///./test.db"
 test_engine = create_engine(
@@ -31,10 +34,36 @@ def override_get_db():
         db.close()
 
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_read_db] = override_get_db
+
+# Used by the hot routes when the suite runs with ASYNC_DB=True
+test_async_engine = create_async_engine("sqlite+aiosqlite:///./test.db")
+TestingAsyncSessionLocal = async_sessionmaker(
+    test_async_engine, autoflush=False, expire_on_commit=False
+)
+
+async def override_get_async_db():
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
+app.dependency_overrides[get_async_db] = override_get_async_db
+
+# Count the statements of the test engines too, to assert the query budgets
+metrics.instrument_engine(test_engine, "test")
+metrics.instrument_engine(test_async_engine.sync_engine, "test_async")
 
 client = TestClient(app)
 
 
+@pytest.fixture
+def sql_statements():
+    """
+    Number of SQL statements of the requests served during the test
+    """
+    with query_budget.recording() as requests:
+        yield requests
+
+
 def check_error_response(response, expected_status_code: int, expected_error_code: str):
     """
     Helper function to assert a standardized error response from the API.
@@ -943,3 +972,79 @@ def test_progress():
     assert progress_rep.status_code == 200, progress_data
     assert progress_data["num_voters"] == 10
     assert progress_data["num_voters_voted"] == 1
+
+
+def _statements_by_route(
+    num_candidates: int, sql_statements: list[query_budget.RequestStatements]
+) -> dict[str, int]:
+    """
+    Go through the life of an election and count the statements of each route
+    """
+    sql_statements.clear()
+
+    body = _random_election(num_candidates, 5)
+    data = client.post("/elections", json=body).json()
+    ref = data["ref"]
+    admin = {"Authorization": f"Bearer {data['admin']}"}
+    client.get(f"/elections/{ref}")
+
+    votes = [
+        {"candidate_id": c["id"], "grade_id": data["grades"][i % 5]["id"]}
+        for i, c in enumerate(data["candidates"])
+    ]
+    response = client.post("/ballots", json={"votes": votes, "election_ref": ref})
+    assert response.status_code == 200, response.text
+    ballot = {"Authorization": f"Bearer {response.json()['token']}"}
+    client.get("/ballots", headers=ballot)
+    response = client.put("/ballots", json={"votes": votes[::-1]}, headers=ballot)
+    assert response.status_code == 200, response.text
+
+    client.get(f"/results/{ref}")
+    client.get(f"/elections/{ref}/progress", headers=admin)
+    data["name"] += "MODIFIED"
+    response = client.put("/elections", json=data, headers=admin)
+    assert response.status_code == 200, response.text
+
+    return {f"{r.method} {r.route}": r.statements for r in sql_statements}
+
+
+# SQLite can not match the rows of a batched INSERT ... RETURNING with their
+# parameters, so SQLAlchemy inserts the candidates and the votes one by one.
+ROW_BY_ROW_INSERTS = {"POST /elections": 1, "POST /ballots": 1}
+
+
+def test_statements_do_not_grow_with_candidates(sql_statements):
+    small = _statements_by_route(2, sql_statements)
+    large = _statements_by_route(12, sql_statements)
+
+    assert small.keys() == large.keys()
+    for route in small:
+        growth = ROW_BY_ROW_INSERTS.get(route, 0) * (12 - 2)
+        assert large[route] - small[route] == growth, route
+
+
+def test_statements_are_within_budget(sql_statements):
+    for route, statements in _statements_by_route(3, sql_statements).items():
+        assert statements <= settings.query_budget, route
+
+
+def test_invites_are_inserted_in_batches(sql_statements):
+    statements = []
+    for num_voters in (5, 50):
+        sql_statements.clear()
+        body = {**_random_election(3, 5), "restricted": True, "num_voters": num_voters}
+        data = client.post("/elections", json=body).json()
+        assert len(data["invites"]) == num_voters
+        statements.append(sql_statements[-1].statements)
+
+        # The tokens hold the votes of their own ballot
+        votes = [
+            {"candidate_id": c["id"], "grade_id": data["grades"][0]["id"]}
+            for c in data["candidates"]
+        ]
+        headers = {"Authorization": f"Bearer {data['invites'][-1]}"}
+        response = client.put("/ballots", json={"votes": votes}, headers=headers)
+        assert response.status_code == 200, response.text
+
+    assert statements[0] == statements[1]
+    assert statements[0] <= settings.query_budget
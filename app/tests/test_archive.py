@@ -0,0 +1,104 @@
+import asyncio
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from .. import archive, async_crud, crud, errors, models, schemas
+from ..auth import create_admin_token
+from .conftest import async_url, create_election, vote
+
+
+def _create_closed_election(db, num_voters: int = 3, days_ago: int = 400) -> schemas.ElectionCreatedGet:
+    election = create_election(db, num_voters)
+    # Only the first voters vote
+    for i, token in enumerate(election.invites[:-1]):
+        vote(db, election, token, [i, i, i])
+
+    db_election = crud.get_election(db, election.ref)
+    setattr(db_election, "date_start", datetime.now() - timedelta(days=days_ago + 1))
+    setattr(db_election, "date_end", datetime.now() - timedelta(days=days_ago))
+    db.commit()
+    return election
+
+
+def test_archive_and_restore(db):
+    election = _create_closed_election(db)
+    admin = create_admin_token(election.ref)
+    results = crud.get_results(db, election.ref, None)
+    progress = crud.get_progress(db, election.ref, admin)
+
+    db_archive = archive.archive_election(db, election.ref)
+    assert db_archive.data is not None
+
+    # The hot tables do not hold the election anymore...
+    for model in (models.Vote, models.Ballot):
+        assert db.query(model).filter(model.election_ref == election.ref).count() == 0
+
+    # ... but its results and progress are still served
+    assert crud.get_results(db, election.ref, None) == results
+    assert crud.get_progress(db, election.ref, admin) == progress
+
+    with pytest.raises(errors.ElectionArchivedError):
+        crud.get_ballot(db, election.invites[0])
+    with pytest.raises(errors.ElectionArchivedError):
+        archive.archive_election(db, election.ref)
+
+    num_rows = archive.restore_election(db, election.ref)
+    assert num_rows == 3 + 3 * 3
+
+    ballot = crud.get_ballot(db, election.invites[0])
+    assert {v.grade.id for v in ballot.votes if v.grade} == {election.grades[0].id}
+    assert crud.get_results(db, election.ref, None) == results
+    assert crud.get_progress(db, election.ref, admin) == progress
+
+    with pytest.raises(errors.BadRequestError):
+        archive.restore_election(db, election.ref)
+
+
+def test_find_archivable(db):
+    old = _create_closed_election(db, days_ago=400)
+    recent = _create_closed_election(db, days_ago=10)
+
+    refs = archive.find_archivable(db, retention_days=365)
+    assert old.ref in refs
+    assert recent.ref not in refs
+
+    archive.archive_election(db, old.ref)
+    assert old.ref not in archive.find_archivable(db, retention_days=365)
+
+
+def test_async_results_of_archived_election(db, engine):
+    election = _create_closed_election(db)
+    results = crud.get_results(db, election.ref, None)
+    archive.archive_election(db, election.ref)
+
+    async def get_results():
+        async_engine = create_async_engine(async_url(engine))
+        try:
+            async with async_sessionmaker(async_engine)() as async_db:
+                return await async_crud.get_results(async_db, election.ref, None)
+        finally:
+            await async_engine.dispose()
+
+    assert asyncio.run(get_results()) == results
+
+
+def test_results_of_archived_election_without_archive(db, engine):
+    election = _create_closed_election(db)
+    db_election = crud.get_election(db, election.ref)
+    setattr(db_election, "archived", True)
+    db.commit()
+
+    with pytest.raises(errors.InconsistentDatabaseError):
+        crud.get_results(db, election.ref, None)
+
+    async def get_results():
+        async_engine = create_async_engine(async_url(engine))
+        try:
+            async with async_sessionmaker(async_engine)() as async_db:
+                return await async_crud.get_results(async_db, election.ref, None)
+        finally:
+            await async_engine.dispose()
+
+    with pytest.raises(errors.InconsistentDatabaseError):
+        asyncio.run(get_results())
@@ -0,0 +1,102 @@
+import asyncio
+import typing as t
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from ..database import Base
+from .. import async_crud, crud, errors, schemas
+
+test_database_url = "sqlite:///./test_async.db"
+test_engine = create_engine(
+    test_database_url, connect_args={"check_same_thread": False}
+)
+TestingSessionLocal: sessionmaker = sessionmaker(  # type: ignore
+    autocommit=False, autoflush=False, bind=test_engine
+)
+Base.metadata.create_all(bind=test_engine)
+
+
+def _run(coroutine: t.Callable[[AsyncSession], t.Awaitable[t.Any]]) -> t.Any:
+    """
+    Run a coroutine with a fresh async session
+    """
+
+    async def wrapper():
+        async_engine = create_async_engine("sqlite+aiosqlite:///./test_async.db")
+        factory = async_sessionmaker(async_engine, expire_on_commit=False)
+        try:
+            async with factory() as db:
+                return await coroutine(db)
+        finally:
+            await async_engine.dispose()
+
+    return asyncio.run(wrapper())
+
+
+def _create_election(**kwargs) -> schemas.ElectionCreatedGet:
+    election = schemas.ElectionCreate(
+        name="Foo",
+        hide_results=False,
+        date_start=None,
+        candidates=[{"name": f"candidate {i}"} for i in range(3)],  # type: ignore
+        grades=[{"name": f"grade {i}", "value": i} for i in range(4)],  # type: ignore
+        **kwargs,
+    )
+    db = TestingSessionLocal()
+    try:
+        return crud.create_election(db, election)
+    finally:
+        db.close()
+
+
+def test_get_election():
+    election = _create_election()
+    db_election = _run(lambda db: async_crud.get_election(db, election.ref))
+    assert db_election.ref == election.ref
+    assert {c.id for c in db_election.candidates} == {c.id for c in election.candidates}
+
+    with pytest.raises(errors.NotFoundError):
+        _run(lambda db: async_crud.get_election(db, "missingref"))
+
+
+def test_create_and_get_ballot():
+    election = _create_election()
+    grade = election.grades[-1]
+    ballot = schemas.BallotCreate(
+        election_ref=election.ref,
+        votes=[
+            schemas.VoteCreate(candidate_id=c.id, grade_id=grade.id)
+            for c in election.candidates
+        ],
+    )
+    created = _run(lambda db: async_crud.create_ballot(db, ballot))
+    assert [v.grade.id for v in created.votes] == [grade.id] * 3
+
+    fetched = _run(lambda db: async_crud.get_ballot(db, created.token))
+    assert [v.id for v in fetched.votes] == [v.id for v in created.votes]
+
+    results = _run(lambda db: async_crud.get_results(db, election.ref, None))
+    assert results.merit_profile == {c.id: {grade.value: 1} for c in election.candidates}
+
+
+def test_update_ballot():
+    election = _create_election(restricted=True, num_voters=1)
+    grade = election.grades[0]
+    ballot = schemas.BallotUpdate(
+        votes=[
+            schemas.VoteCreate(candidate_id=c.id, grade_id=grade.id)
+            for c in election.candidates
+        ]
+    )
+    updated = _run(lambda db: async_crud.update_ballot(db, ballot, election.invites[0]))
+    assert {v.grade.id for v in updated.votes} == {grade.id}
+
+    # Restricted elections can not receive new ballots
+    with pytest.raises(errors.ElectionRestrictedError):
+        _run(
+            lambda db: async_crud.create_ballot(
+                db, schemas.BallotCreate(election_ref=election.ref, votes=ballot.votes)
+            )
+        )
@@ -0,0 +1,332 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from ..cache import MISSING, Cache, MemoryBackend, SharedBackend
+from ..database import Base, invalidation_bus, replica_router
+from .. import async_crud, crud, errors, schemas
+from ..settings import settings
+from .conftest import async_url, create_election
+
+
+@pytest.fixture
+def enabled(monkeypatch):
+    monkeypatch.setattr(settings, "cache", True)
+
+
+class LocalStore:
+    """
+    Stand-in for a Redis client
+    """
+
+    def __init__(self):
+        self.data: dict[str, tuple[float, bytes]] = {}
+
+    def get(self, key: str) -> bytes | None:
+        expires, value = self.data.get(key, (0.0, b""))
+        return value if expires > time.monotonic() else None
+
+    def set(self, key: str, value: bytes, px: int):
+        self.data[key] = (time.monotonic() + px / 1000, value)
+
+    def delete(self, key: str):
+        self.data.pop(key, None)
+
+
+def test_memory_backend():
+    backend = MemoryBackend(max_entries=2)
+    assert backend.set("a", 1, ttl=60) == []
+    assert backend.set("b", 2, ttl=60) == []
+    assert backend.get("a") == 1
+    # "b" is the least recently used
+    assert backend.set("c", 3, ttl=60) == ["b"]
+    assert backend.get("b") is MISSING
+    backend.set("a", 4, ttl=-1)
+    assert backend.get("a") is MISSING
+
+
+def test_get_or_set_and_stats(enabled, monkeypatch):
+    monkeypatch.setattr(settings, "cache_max_entries", 1)
+    cache = Cache(MemoryBackend(max_entries=1))
+    namespace = cache.namespace("things")
+
+    assert namespace.get_or_set("a", lambda: b"1") == b"1"
+    assert namespace.get_or_set("a", lambda: b"2") == b"1"
+    namespace.get_or_set("b", lambda: b"3")
+    assert namespace.get("a") is None
+    assert cache.stats() == {"things": {"hits": 1, "misses": 3, "evictions": 1}}
+
+    cache.invalidate("b")
+    assert namespace.get_or_set("b", lambda: b"4") == b"4"
+
+
+def test_disabled_cache_always_computes(monkeypatch):
+    monkeypatch.setattr(settings, "cache", False)
+    namespace = Cache(MemoryBackend(max_entries=10)).namespace("things")
+    assert namespace.get_or_set("a", lambda: b"1") == b"1"
+    assert namespace.get_or_set("a", lambda: b"2") == b"2"
+
+
+def test_concurrent_misses_are_computed_once(enabled):
+    namespace = Cache(MemoryBackend(max_entries=10)).namespace("things")
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def compute() -> bytes:
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return b"value"
+
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(namespace.get_or_set("a", compute))
+        )
+        for _ in range(5)
+    ]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert calls == [1]
+    assert results == [b"value"] * 5
+
+
+def test_stuck_computations_are_not_waited_for(enabled, monkeypatch):
+    monkeypatch.setattr(settings, "cache_wait_timeout", 0.05)
+    namespace = Cache(MemoryBackend(max_entries=10)).namespace("things")
+    started, release = threading.Event(), threading.Event()
+
+    def stuck() -> bytes:
+        started.set()
+        release.wait(5)
+        return b"late"
+
+    leader = threading.Thread(target=lambda: namespace.get_or_set("a", stuck))
+    leader.start()
+    started.wait(5)
+    try:
+        assert namespace.get_or_set("a", lambda: b"value") == b"value"
+    finally:
+        release.set()
+        leader.join()
+    # The value of the leader is kept
+    assert namespace.get("a") == b"late"
+
+
+def test_concurrent_async_misses_are_computed_once(enabled, monkeypatch):
+    monkeypatch.setattr(settings, "cache_wait_timeout", 0.2)
+    namespace = Cache(MemoryBackend(max_entries=10)).namespace("things")
+    calls = []
+
+    async def compute() -> bytes:
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return b"value"
+
+    async def stuck() -> bytes:
+        await asyncio.sleep(5)
+        return b"late"
+
+    async def get_all() -> list[bytes]:
+        values = [namespace.get_or_set_async("a", compute) for _ in range(5)]
+        return await asyncio.gather(*values)
+
+    async def get_past_a_stuck_leader() -> bytes:
+        leader = asyncio.create_task(namespace.get_or_set_async("b", stuck))
+        await asyncio.sleep(0)
+        try:
+            return await namespace.get_or_set_async("b", compute)
+        finally:
+            leader.cancel()
+
+    assert asyncio.run(get_all()) == [b"value"] * 5
+    assert calls == [1]
+    assert namespace.get("a") == b"value"
+
+    assert asyncio.run(get_past_a_stuck_leader()) == b"value"
+    assert namespace.get("b") is None
+
+
+def test_async_routes_read_the_cached_election(db, engine, enabled):
+    election = create_election(db, 1)
+
+    async def get_election_twice() -> list[schemas.ElectionGet]:
+        async_engine = create_async_engine(async_url(engine))
+        try:
+            async with async_sessionmaker(async_engine)() as async_db:
+                return [
+                    await async_crud.get_election_get(async_db, election.ref)
+                    for _ in range(2)
+                ]
+        finally:
+            await async_engine.dispose()
+
+    hits = crud._elections.hits
+    assert [e.name for e in asyncio.run(get_election_twice())] == ["Foo"] * 2
+    assert crud._elections.hits == hits + 1
+
+
+def test_values_computed_during_a_write_are_not_kept(enabled):
+    namespace = Cache(MemoryBackend(max_entries=10)).namespace("things")
+
+    def compute() -> bytes:
+        invalidation_bus.dispatch("a", None)
+        return b"former"
+
+    assert namespace.get_or_set("a", compute) == b"former"
+    assert namespace.get("a") is None
+
+
+def test_shared_backend(enabled):
+    store = LocalStore()
+    workers = [
+        Cache(MemoryBackend(max_entries=10), SharedBackend(store)) for _ in range(2)
+    ]
+    namespaces = [w.namespace("grades", schemas.GradeGet) for w in workers]
+    grade = schemas.GradeGet(id=1, election_ref="ref", name="Good", value=2)
+
+    namespaces[0].set("ref", grade)
+    assert namespaces[1].get("ref") == grade
+    # The worker writing an election evicts it from the shared store
+    workers[0].invalidate("ref")
+    workers[1].local.clear()
+    assert namespaces[1].get("ref") is None
+
+
+def test_writes_evict_the_results(db, enabled):
+    election = crud.create_election(
+        db,
+        schemas.ElectionCreate(
+            name="Foo",
+            hide_results=False,
+            restricted=True,
+            num_voters=1,
+            candidates=[{"name": "a"}, {"name": "b"}],  # type: ignore
+            grades=[{"name": "g0", "value": 0}, {"name": "g1", "value": 1}],  # type: ignore
+        ),
+    )
+
+    def vote(grades: list[int]):
+        ballot = schemas.BallotUpdate(
+            votes=[
+                schemas.VoteCreate(candidate_id=c.id, grade_id=election.grades[g].id)
+                for c, g in zip(election.candidates, grades)
+            ]
+        )
+        crud.update_ballot(db, ballot, election.invites[0])
+
+    a, b = (c.id for c in election.candidates)
+    vote([1, 0])
+    assert crud.get_results(db, election.ref, None).ranking == {a: 1, b: 2}
+    vote([0, 1])
+    assert crud.get_results(db, election.ref, None).ranking == {a: 2, b: 1}
+
+    assert crud.get_election_get(db, election.ref).name == "Foo"
+    crud.update_election(
+        db, schemas.ElectionUpdate(ref=election.ref, name="Bar"), election.admin
+    )
+    assert crud.get_election_get(db, election.ref).name == "Bar"
+
+
+def test_rejected_updates_are_not_committed(db, enabled):
+    election = crud.create_election(
+        db,
+        schemas.ElectionCreate(
+            name="Foo",
+            hide_results=False,
+            candidates=[{"name": "a"}, {"name": "b"}],  # type: ignore
+            grades=[{"name": "g0", "value": 0}, {"name": "g1", "value": 1}],  # type: ignore
+        ),
+    )
+    assert len(crud.get_election_get(db, election.ref).candidates) == 2
+
+    def candidates() -> list[schemas.CandidateUpdate]:
+        # The ids of the new candidates are set by the update
+        return [
+            *(
+                schemas.CandidateUpdate(id=c.id, name=c.name)
+                for c in election.candidates
+            ),
+            schemas.CandidateUpdate(name="c"),
+        ]
+
+    grades = [
+        schemas.GradeUpdate(id=g.id, name=g.name, value=g.value)
+        for g in election.grades
+    ]
+    update = schemas.ElectionUpdate(
+        ref=election.ref,
+        candidates=candidates(),
+        grades=[*grades[:-1], grades[-1].model_copy(update={"id": 0})],
+    )
+    with pytest.raises(errors.ImmutableIdsError):
+        crud.update_election(db, update, election.admin)
+    db.rollback()
+    # The new candidate was rolled back with the rest of the update
+    assert len(crud.get_election(db, election.ref).candidates) == 2
+
+    update = schemas.ElectionUpdate(ref=election.ref, candidates=candidates())
+    crud.update_election(db, update, election.admin)
+    assert len(crud.get_election_get(db, election.ref).candidates) == 3
+
+
+def test_ballots_read_the_cached_election(db, enabled):
+    election = crud.create_election(
+        db,
+        schemas.ElectionCreate(
+            name="Foo",
+            hide_results=False,
+            restricted=True,
+            num_voters=1,
+            candidates=[{"name": "a"}, {"name": "b"}],  # type: ignore
+            grades=[{"name": "g0", "value": 0}, {"name": "g1", "value": 1}],  # type: ignore
+        ),
+    )
+    ballot = schemas.BallotUpdate(
+        votes=[
+            schemas.VoteCreate(candidate_id=c.id, grade_id=election.grades[0].id)
+            for c in election.candidates
+        ]
+    )
+    crud.update_ballot(db, ballot, election.invites[0])
+
+    hits = crud._elections.hits
+    for _ in range(2):
+        assert crud.get_ballot(db, election.invites[0]).election.name == "Foo"
+    assert crud._elections.hits == hits + 1
+
+
+def test_misses_are_computed_from_the_primary(
+    db, engine, enabled, monkeypatch, tmp_path
+):
+    # A replica which did not receive the election yet
+    replica = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    Base.metadata.create_all(bind=replica)
+    monkeypatch.setattr(replica_router, "primary", engine)
+    monkeypatch.setattr(replica_router, "replicas", [replica])
+
+    election = create_election(db, 1)
+    replica_db = sessionmaker(bind=replica)()
+    try:
+        assert crud.get_election_get(replica_db, election.ref).name == "Foo"
+    finally:
+        replica_db.close()
+
+    # Without the cache, the session reads its own database
+    monkeypatch.setattr(settings, "cache", False)
+    replica_db = sessionmaker(bind=replica)()
+    try:
+        with pytest.raises(errors.NotFoundError):
+            crud.get_election_get(replica_db, election.ref)
+    finally:
+        replica_db.close()
@@ -0,0 +1,122 @@
+import pytest
+from sqlalchemy import select
+
+from .. import archive, compact, crud, errors, models, schemas
+from ..auth import create_admin_token
+from ..settings import settings
+from .conftest import create_election, vote
+
+
+@pytest.fixture
+def compact_ballots(monkeypatch):
+    monkeypatch.setattr(settings, "compact_ballots", True)
+
+
+def _create_election(db, num_voters: int = 3) -> schemas.ElectionCreatedGet:
+    """
+    Create a restricted election where all the voters but the last one vote
+    """
+    election = create_election(db, num_voters)
+    for i, token in enumerate(election.invites[:-1]):
+        vote(db, election, token, [i + j for j in range(3)])
+    return election
+
+
+def test_pack_and_unpack():
+    packed = compact.pack([(12, 7), (10, 5), (11, None)], [10, 11, 12], [5, 6, 7])
+    assert packed == bytes([1, 0, 3])
+    assert compact.unpack(packed, [10, 11, 12], [5, 6, 7]) == [(10, 5), (12, 7)]
+    # A candidate added after the ballot was cast has no grade
+    assert compact.unpack(packed, [10, 11, 12, 13], [5, 6, 7]) == [(10, 5), (12, 7)]
+    assert compact.unpack(None, [10, 11, 12], [5, 6, 7]) == []
+
+
+def test_compact_election_without_votes(db, compact_ballots):
+    election = _create_election(db)
+    votes = db.query(models.Vote).filter(models.Vote.election_ref == election.ref)
+    assert votes.count() == 0
+
+    db_ballots = db.scalars(
+        select(models.Ballot).filter(models.Ballot.election_ref == election.ref)
+    ).all()
+    assert [b.grades for b in db_ballots] == [bytes([1, 2, 3]), bytes([2, 3, 4]), None]
+
+    progress = crud.get_progress(db, election.ref, create_admin_token(election.ref))
+    assert (progress.num_voters, progress.num_voters_voted) == (3, 2)
+
+    ballot = crud.get_ballot(db, election.invites[1])
+    assert [(v.candidate.id, v.grade.id) for v in ballot.votes] == [  # type: ignore
+        (c.id, election.grades[1 + j].id) for j, c in enumerate(election.candidates)
+    ]
+    with pytest.raises(errors.NotFoundError):
+        crud.get_ballot(db, election.invites[2])
+
+
+def test_compact_public_ballot(db, compact_ballots):
+    election = _create_election(db)
+    db_election = crud.get_election(db, election.ref)
+    setattr(db_election, "restricted", False)
+    db.commit()
+
+    ballot = schemas.BallotCreate(
+        election_ref=election.ref,
+        votes=[
+            schemas.VoteCreate(candidate_id=c.id, grade_id=election.grades[0].id)
+            for c in election.candidates
+        ],
+    )
+    created = crud.create_ballot(db, ballot)
+    assert crud.get_ballot(db, created.token).votes == created.votes
+
+
+def test_results_are_the_same_in_both_layouts(db, monkeypatch):
+    election = _create_election(db)
+    admin = create_admin_token(election.ref)
+    results = crud.get_results(db, election.ref, None)
+    progress = crud.get_progress(db, election.ref, admin)
+
+    monkeypatch.setattr(settings, "compact_ballots", True)
+    compact_election = _create_election(db)
+    compact_results = crud.get_results(db, compact_election.ref, None)
+    for c, other in zip(election.candidates, compact_election.candidates):
+        assert compact_results.merit_profile[other.id] == results.merit_profile[c.id]
+        assert compact_results.ranking[other.id] == results.ranking[c.id]
+
+    assert compact.pack_election(db, election.ref) == 2
+    assert crud.get_results(db, election.ref, None) == results
+    assert crud.get_progress(db, election.ref, admin) == progress
+    with pytest.raises(errors.BadRequestError):
+        compact.pack_election(db, election.ref)
+
+    # The tokens remain valid in both layouts
+    ballot = crud.get_ballot(db, election.invites[0])
+    assert {v.grade.value for v in ballot.votes} == {0, 1, 2}  # type: ignore
+    assert compact.unpack_election(db, compact_election.ref) == 2 * 3 + 3
+    ballot = crud.get_ballot(db, compact_election.invites[0])
+    assert {v.grade.value for v in ballot.votes} == {0, 1, 2}  # type: ignore
+    grade_id = compact_election.grades[3].id
+    updated = crud.update_ballot(
+        db,
+        schemas.BallotUpdate(
+            votes=[
+                schemas.VoteCreate(candidate_id=c.id, grade_id=grade_id)
+                for c in compact_election.candidates
+            ]
+        ),
+        compact_election.invites[2],
+    )
+    assert {v.grade.value for v in updated.votes} == {3}  # type: ignore
+
+
+def test_archive_compact_election(db, compact_ballots):
+    election = _create_election(db)
+    admin = create_admin_token(election.ref)
+    results = crud.get_results(db, election.ref, None)
+    progress = crud.get_progress(db, election.ref, admin)
+
+    archive.archive_election(db, election.ref)
+    assert crud.get_progress(db, election.ref, admin) == progress
+
+    archive.restore_election(db, election.ref)
+    assert crud.get_results(db, election.ref, None) == results
+    assert crud.get_progress(db, election.ref, admin) == progress
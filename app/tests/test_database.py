@@ -0,0 +1,145 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine, text
+from fastapi import Request, Response
+from ..database import (
+    WRITTEN_AT_COOKIE,
+    WRITTEN_AT_HEADER,
+    ReplicaRouter,
+    create_sqlite_engine,
+)
+
+
+def _sqlite_engine(path: str):
+    return create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+
+
+def test_replica_router_round_robin(tmp_path):
+    """
+    Reads are spread over the replicas
+    """
+    primary = _sqlite_engine(tmp_path / "primary.db")
+    replicas = [_sqlite_engine(tmp_path / f"replica{i}.db") for i in range(2)]
+    router = ReplicaRouter(primary, replicas)
+
+    picked = [router.pick() for _ in range(4)]
+    assert picked == replicas + replicas
+
+
+def test_replica_router_without_replicas(tmp_path):
+    primary = _sqlite_engine(tmp_path / "primary.db")
+    router = ReplicaRouter(primary, [])
+    assert router.pick(time.time()) is primary
+
+
+def test_replica_router_read_your_writes(tmp_path):
+    """
+    A client that just wrote is read from the primary
+    """
+    primary = _sqlite_engine(tmp_path / "primary.db")
+    replica = _sqlite_engine(tmp_path / "replica.db")
+    router = ReplicaRouter(primary, [replica], stickiness=0.2)
+
+    written_at = time.time()
+    assert router.pick(written_at) is primary
+    assert router.pick() is replica
+
+    time.sleep(0.3)
+    assert router.pick(written_at) is replica
+
+
+def test_replica_router_gives_the_time_of_the_writes(tmp_path):
+    primary = _sqlite_engine(tmp_path / "primary.db")
+    replica = _sqlite_engine(tmp_path / "replica.db")
+    router = ReplicaRouter(primary, [replica])
+    response = Response()
+    router.mark_written(response)
+    written_at = response.headers[WRITTEN_AT_HEADER]
+    assert f"{WRITTEN_AT_COOKIE}={written_at}" in response.headers["set-cookie"]
+
+    def request(headers: list[tuple[bytes, bytes]]) -> Request:
+        return Request({"type": "http", "headers": headers})
+
+    cookie = f"{WRITTEN_AT_COOKIE}={written_at}".encode()
+    for headers in (
+        [(WRITTEN_AT_HEADER.lower().encode(), written_at.encode())],
+        [(b"cookie", cookie)],
+    ):
+        assert router.pick(router.written_at(request(headers))) is primary
+    assert router.written_at(request([])) is None
+    assert router.written_at(request([(b"cookie", b"mj_written_at=foo")])) is None
+
+
+def test_replica_router_skips_unhealthy_replicas(tmp_path):
+    primary = _sqlite_engine(tmp_path / "primary.db")
+    healthy = _sqlite_engine(tmp_path / "replica.db")
+    # SQLite can not create a file in a missing directory
+    broken = _sqlite_engine(tmp_path / "missing" / "replica.db")
+
+    router = ReplicaRouter(primary, [broken, healthy])
+    router.check_replicas()
+    assert [router.pick() for _ in range(3)] == [healthy] * 3
+
+    router = ReplicaRouter(primary, [broken], health_check_interval=0.01)
+    router.start()
+    try:
+        time.sleep(0.1)
+        assert router.pick() is primary
+    finally:
+        router.stop()
+
+
+def test_replica_router_serves_the_replica_data(tmp_path):
+    """
+    Sessions are bound to the picked engine
+    """
+    primary = _sqlite_engine(tmp_path / "primary.db")
+    replica = _sqlite_engine(tmp_path / "replica.db")
+    for engine, name in ((primary, "primary"), (replica, "replica")):
+        with engine.begin() as connection:
+            connection.execute(text("CREATE TABLE origin (name TEXT)"))
+            connection.execute(text("INSERT INTO origin VALUES (:name)"), {"name": name})
+
+    router = ReplicaRouter(primary, [replica])
+    with router.pick().connect() as connection:
+        assert connection.execute(text("SELECT name FROM origin")).scalar() == "replica"
+
+    with router.pick(time.time()).connect() as connection:
+        assert connection.execute(text("SELECT name FROM origin")).scalar() == "primary"
+
+
+def test_sqlite_engine_pragmas(tmp_path):
+    engine = create_sqlite_engine(f"sqlite:///{tmp_path / 'main.db'}")
+    with engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        # NORMAL
+        assert connection.execute(text("PRAGMA synchronous")).scalar() == 1
+        assert connection.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+
+
+def test_sqlite_engine_concurrent_writes(tmp_path):
+    """
+    Concurrent writes queue for the writer connection while readers keep reading
+    """
+    url = f"sqlite:///{tmp_path / 'main.db'}"
+    writer = create_sqlite_engine(url)
+    reader = create_sqlite_engine(url, writer=False)
+    with writer.begin() as connection:
+        connection.execute(text("CREATE TABLE ballots (id INTEGER PRIMARY KEY, value INTEGER)"))
+
+    def write(index: int):
+        for i in range(20):
+            with writer.begin() as connection:
+                connection.execute(text("INSERT INTO ballots (value) VALUES (:i)"), {"i": i})
+
+    def read(index: int):
+        with reader.connect() as connection:
+            return connection.execute(text("SELECT count(*) FROM ballots")).scalar()
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        writes = [executor.submit(write, i) for i in range(8)]
+        reads = [executor.submit(read, i) for i in range(8)]
+        for future in writes + reads:
+            future.result()
+
+    assert read(0) == 8 * 20
@@ -0,0 +1,114 @@
+"""
+Raw ballot export on /elections/{election_ref}/ballots/export
+"""
+import csv
+import io
+import json
+import typing as t
+import pytest
+
+from .. import export
+from ..settings import settings
+from .test_api import _random_election, check_error_response, client, test_engine
+
+
+def _restricted_election(num_voters: int, num_voted: int) -> dict[str, t.Any]:
+    """
+    Create a restricted election where the first voters give their i-th grade
+    to every candidate
+    """
+    body = _random_election(3, 4)
+    body["restricted"] = True
+    body["num_voters"] = num_voters
+    data = client.post("/elections", json=body).json()
+    for i, token in enumerate(data["invites"][:num_voted]):
+        votes = [
+            {"candidate_id": c["id"], "grade_id": data["grades"][i % 4]["id"]}
+            for c in data["candidates"]
+        ]
+        response = client.put(
+            "/ballots",
+            json={"votes": votes},
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        assert response.status_code == 200, response.text
+    return data
+
+
+def _export(data: dict[str, t.Any], format: str):
+    return client.get(
+        f"/elections/{data['ref']}/ballots/export",
+        params={"format": format},
+        headers={"Authorization": f"Bearer {data['admin']}"},
+    )
+
+
+def test_export_csv():
+    data = _restricted_election(num_voters=4, num_voted=3)
+    response = _export(data, "csv")
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"].startswith("text/csv")
+
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert rows[0] == [c["name"] for c in data["candidates"]]
+    # The invite that did not vote is skipped
+    assert sorted(rows[1:]) == [[str(i)] * 3 for i in range(3)]
+
+
+def test_export_ndjson():
+    data = _restricted_election(num_voters=2, num_voted=2)
+    response = _export(data, "ndjson")
+    assert response.status_code == 200, response.text
+
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    names = [c["name"] for c in data["candidates"]]
+    rows.sort(key=lambda row: row[names[0]])
+    assert rows == [{name: i for name in names} for i in range(2)]
+
+
+def test_export_parquet():
+    pq = pytest.importorskip("pyarrow.parquet")
+    data = _restricted_election(num_voters=3, num_voted=3)
+    response = _export(data, "parquet")
+    assert response.status_code == 200, response.text
+
+    table = pq.read_table(io.BytesIO(response.content))
+    assert table.column_names == [c["name"] for c in data["candidates"]]
+    assert {c["name"]: 2 for c in data["candidates"]} in table.to_pylist()
+
+
+def test_export_is_chunked():
+    data = _restricted_election(num_voters=5, num_voted=5)
+    ballots_export = export.Export(
+        election_ref=data["ref"],
+        candidate_ids=[c["id"] for c in data["candidates"]],
+        columns=["a", "b", "c"],
+        grade_values={g["id"]: g["value"] for g in data["grades"]},
+    )
+    chunks = list(
+        export.stream_ballots(test_engine, ballots_export, "ndjson", chunk_size=2)
+    )
+    assert [chunk.count(b"\n") for chunk in chunks] == [2, 2, 1]
+
+
+@pytest.mark.parametrize("compact_ballots", [False, True])
+def test_export_does_not_follow_the_invites(monkeypatch, compact_ballots):
+    monkeypatch.setattr(settings, "compact_ballots", compact_ballots)
+    data = _restricted_election(num_voters=20, num_voted=20)
+
+    exports = [_export(data, "csv").text.splitlines()[1:] for _ in range(2)]
+    invites = [",".join([str(i % 4)] * 3) for i in range(20)]
+    for rows in exports:
+        assert sorted(rows) == sorted(invites)
+        assert rows != invites
+    # Each export has its own order
+    assert exports[0] != exports[1]
+
+
+def test_export_requires_the_admin_token():
+    data = _restricted_election(num_voters=1, num_voted=1)
+    response = client.get(
+        f"/elections/{data['ref']}/ballots/export",
+        headers={"Authorization": f"Bearer {data['invites'][0]}"},
+    )
+    check_error_response(response, 403, "FORBIDDEN")
@@ -0,0 +1,51 @@
+"""
+The synthetic elections of scripts/generate_data.py are read by the crud
+functions as if they were created through the API.
+"""
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session
+
+from scripts.generate_data import Arguments, main
+from .. import crud, models
+from ..auth import create_admin_token
+
+
+def test_generated_elections_are_consistent(tmp_path):
+    url = f"sqlite:///{tmp_path}/generated.db"
+    args = Arguments().parse_args(
+        [
+            "--database_url", url,
+            "--create_tables",
+            "--elections", "6",
+            "--ballots", "40",
+            "--ballots_distribution", "fixed",
+            "--restricted", "0.5",
+            "--fill_rate", "0.5",
+            "--batch_size", "50",
+        ]
+    )
+    main(args)
+
+    engine = create_engine(url)
+    with Session(engine) as db:
+        elections = db.scalars(select(models.Election)).all()
+        assert len(elections) == 6
+        for election in elections:
+            ref = str(election.ref)
+            num_ballots = db.scalar(
+                select(func.count(models.Ballot.id)).filter(
+                    models.Ballot.election_ref == ref
+                )
+            )
+            assert num_ballots == 40
+
+            progress = crud.get_progress(db, ref, create_admin_token(ref))
+            assert progress.num_voters == 40
+            if election.restricted:
+                assert progress.num_voters_voted < 40
+            else:
+                assert progress.num_voters_voted == 40
+
+            results = crud.get_results(db, ref, None)
+            assert len(results.ranking) == len(results.candidates)
+    engine.dispose()
@@ -0,0 +1,88 @@
+import threading
+
+import pytest
+from sqlalchemy import text
+
+from ..database import InvalidationBus, invalidation_bus
+from .. import crud, schemas
+from ..settings import settings
+from .conftest import create_election, vote
+
+
+@pytest.fixture
+def bus(monkeypatch):
+    monkeypatch.setattr(settings, "invalidation_bus", True)
+
+
+@pytest.mark.parametrize("compact_ballots", [False, True])
+def test_writes_reach_the_other_workers(db, engine, bus, monkeypatch, compact_ballots):
+    monkeypatch.setattr(settings, "compact_ballots", compact_ballots)
+    election = create_election(db, 2, 2, range(2))
+    other = InvalidationBus(engine)
+    other._last_version = other._max_version()
+    events: list[str | None] = []
+    other.subscribe(lambda ref, version: events.append(ref))
+
+    generation = invalidation_bus.generation(election.ref)
+    vote(db, election, election.invites[0], [0, 0])
+    # The writes of a worker are applied to its own cache when they commit
+    assert invalidation_bus.generation(election.ref) != generation
+
+    crud.update_election(
+        db, schemas.ElectionUpdate(ref=election.ref, name="Bar"), election.admin
+    )
+    vote(db, election, election.invites[1], [0, 0])
+    # The events of an election are coalesced between two polls
+    assert other.poll() == 1
+    assert events == [election.ref]
+    assert other.poll() == 0
+
+
+def test_rolled_back_writes_are_not_published(db, engine, bus):
+    election = create_election(db, 2, 2, range(2))
+    other = InvalidationBus(engine)
+    other._last_version = other._max_version()
+
+    invalidation_bus.publish(db, election.ref)
+    db.rollback()
+    assert other.poll() == 0
+
+
+def test_polling_thread(db, engine, bus):
+    election = create_election(db, 2, 2, range(2))
+    other = InvalidationBus(engine, poll_interval=0.01)
+    received = threading.Event()
+
+    def receive(ref: str | None, version: int | None):
+        if ref == election.ref:
+            received.set()
+
+    other.subscribe(receive)
+    other.start()
+    try:
+        vote(db, election, election.invites[0], [0, 0])
+        assert received.wait(5)
+    finally:
+        other.stop()
+
+
+def test_disabled_bus_publishes_nothing(db, monkeypatch):
+    monkeypatch.setattr(settings, "invalidation_bus", False)
+    election = create_election(db, 2, 2, range(2))
+    vote(db, election, election.invites[0], [0, 0])
+    num_versions = db.execute(
+        text("SELECT count(*) FROM election_versions WHERE election_ref = :ref"),
+        {"ref": election.ref},
+    ).scalar()
+    assert num_versions == 0
+
+
+def test_generations_do_not_grow_with_the_elections(engine):
+    bus = InvalidationBus(engine)
+    before = bus.generation("foo")
+    for i in range(10_000):
+        bus.dispatch(f"election {i}", None)
+    assert len(bus._generations) == InvalidationBus.NUM_SLOTS
+    assert bus.generation("election 0") != (0, 0)
+    bus.dispatch("foo", None)
+    assert bus.generation("foo") != before
@@ -0,0 +1,39 @@
+"""
+The load harness of benchmarks/load.py runs the flows of k6/index.js.
+"""
+import asyncio
+import typing as t
+import httpx
+
+from benchmarks.load import Arguments, run_load
+from ..main import app
+from . import test_api  # noqa: F401 (the API uses the test database)
+
+
+def _run(*argv: str) -> dict[str, t.Any]:
+    args = Arguments().parse_args(
+        ["--duration", "0.5", "--ramp_up", "0.1", "--poll_interval", "0.1", *argv]
+    )
+    return asyncio.run(run_load(args, httpx.ASGITransport(app=app)))
+
+
+def test_restricted_election_flow():
+    report = _run("--users", "3")
+    assert report["errors"] == 0, report
+    assert set(report["steps"]) == {
+        "GET /elections/{ref}",
+        "GET /ballots",
+        "PUT /ballots",
+        "GET /results/{ref}",
+        "GET /elections/{ref}/progress",
+    }
+    assert report["steps"]["PUT /ballots"]["requests"] > 0
+
+
+def test_public_election_flow():
+    report = _run("--users", "2", "--public", "--progress_pollers", "0")
+    assert report["errors"] == 0, report
+    assert "POST /ballots" in report["steps"]
+    assert "GET /ballots" not in report["steps"]
+    stats = report["steps"]["POST /ballots"]
+    assert stats["latency_p50_ms"] <= stats["latency_p99_ms"] <= stats["latency_max_ms"]
@@ -0,0 +1,84 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine, text
+
+from .. import metrics
+
+# The metrics are disabled by default in the application
+app = FastAPI()
+app.add_middleware(metrics.MetricsMiddleware)
+
+
+@app.get("/liveness")
+def read_liveness():
+    return "OK"
+
+
+@app.get("/metrics")
+def read_metrics():
+    return metrics.metrics_response()
+
+
+client = TestClient(app)
+
+
+def _sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_requests_are_labelled_by_route_template():
+    before = _sample("mj_responses_total", method="GET", route="/liveness", status="200")
+    client.get("/liveness")
+    after = _sample("mj_responses_total", method="GET", route="/liveness", status="200")
+    assert after == before + 1
+
+    # Unknown paths do not create new series
+    client.get("/missing/123")
+    assert _sample("mj_responses_total", method="GET", route="unmatched", status="404") > 0
+    assert _sample("mj_requests_in_progress") == 0
+
+
+def test_metrics_endpoint():
+    client.get("/liveness")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert 'mj_request_duration_seconds_count{method="GET",route="/liveness"}' in response.text
+
+
+def test_sql_statements_are_counted(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'metrics.db'}")
+    metrics.instrument_engine(engine, "test")
+
+    with metrics.count_sql() as stats:
+        with engine.connect() as connection:
+            connection.execute(text("CREATE TABLE things (id INTEGER)"))
+            # The statements sent with executemany are counted once
+            connection.execute(
+                text("INSERT INTO things VALUES (:id)"), [{"id": 1}, {"id": 2}]
+            )
+            assert connection.execute(text("SELECT count(*) FROM things")).scalar() == 2
+            assert _sample("mj_db_pool_checked_out", engine="test") == 1
+
+    assert stats.statements == 3
+    assert stats.seconds > 0
+    assert _sample("mj_db_pool_checked_out", engine="test") == 0
+
+
+def test_pool_exhaustion_is_counted(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'metrics.db'}", pool_size=1, max_overflow=0
+    )
+    metrics.instrument_engine(engine, "exhausted")
+
+    with engine.connect():
+        pass
+    assert _sample("mj_db_pool_exhausted_total", engine="exhausted") == 1
+
+
+def test_cache_accesses():
+    metrics.record_cache_access("test", hit=True)
+    metrics.record_cache_access("test", hit=False)
+    metrics.record_cache_access("test", hit=True)
+    assert _sample("mj_cache_requests_total", cache="test", result="hit") == 2
+    assert _sample("mj_cache_requests_total", cache="test", result="miss") == 1
@@ -0,0 +1,27 @@
+from ..partitioning import _shadow_index
+
+
+def test_shadow_index_renames_the_index_and_the_table():
+    definition = (
+        "CREATE INDEX ix_votes_ballot_id ON public.votes USING btree (ballot_id)"
+    )
+    assert _shadow_index("votes", "ix_votes_ballot_id", definition) == (
+        "CREATE INDEX ix_votes_ballot_id_partitioned "
+        "ON public.votes_partitioned USING btree (ballot_id)"
+    )
+
+
+def test_shadow_index_adds_the_partition_key_to_unique_indexes():
+    definition = (
+        "CREATE UNIQUE INDEX ix_ballots_voter_uuid ON public.ballots "
+        "USING btree (voter_uuid)"
+    )
+    assert _shadow_index("ballots", "ix_ballots_voter_uuid", definition) == (
+        "CREATE UNIQUE INDEX ix_ballots_voter_uuid_partitioned ON public.ballots_partitioned "
+        "USING btree (voter_uuid, election_ref)"
+    )
+
+
+def test_shadow_index_skips_indexes_served_by_the_primary_key():
+    definition = "CREATE INDEX ix_votes_id ON public.votes USING btree (id)"
+    assert _shadow_index("votes", "ix_votes_id", definition) is None
@@ -0,0 +1,75 @@
+import threading
+import time
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from ..auth import create_admin_token, create_operator_token
+from ..main import app as main_app
+from ..profiler import ProfilerMiddleware, Sampler
+
+
+def _busy_loop(seconds: float):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def _client(directory) -> TestClient:
+    app = FastAPI()
+    app.add_middleware(ProfilerMiddleware, directory=str(directory), interval=0.001)
+
+    @app.get("/elections/{election_ref}")
+    def slow_route(election_ref: str):
+        _busy_loop(0.1)
+        return "OK"
+
+    return TestClient(app)
+
+
+def test_sampler_counts_the_stacks_of_other_threads():
+    thread = threading.Thread(target=_busy_loop, args=(0.1,), name="busy")
+    sampler = Sampler(interval=0.001)
+    sampler.start()
+    thread.start()
+    thread.join()
+    sampler.stop()
+
+    assert sampler.num_samples > 0
+    busy = [line for line in sampler.folded().splitlines() if line.startswith("busy;")]
+    assert busy
+    assert all("_busy_loop (" in line for line in busy)
+    # Stacks of the threads waiting for work are skipped
+    assert "profiler;" not in sampler.folded()
+
+
+def test_requests_with_an_operator_token_are_profiled(tmp_path):
+    client = _client(tmp_path)
+    response = client.get(
+        "/elections/abc", headers={"X-Profile": create_operator_token()}
+    )
+    assert response.status_code == 200, response.text
+
+    name = response.headers["X-Profile"]
+    assert name.endswith("-GET-elections_abc.folded")
+    profile = (tmp_path / name).read_text()
+    assert "slow_route (" in profile
+    count = int(profile.splitlines()[0].rsplit(" ", 1)[1])
+    assert count > 0
+
+
+def test_other_requests_are_not_profiled(tmp_path):
+    client = _client(tmp_path)
+    response = client.get("/elections/abc")
+    assert response.status_code == 200
+    assert "X-Profile" not in response.headers
+
+    response = client.get(
+        "/elections/abc", headers={"X-Profile": create_admin_token("abc")}
+    )
+    assert response.status_code == 403
+    assert response.json()["error"] == "FORBIDDEN"
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_profiling_is_disabled_by_default():
+    assert ProfilerMiddleware not in [m.cls for m in main_app.user_middleware]
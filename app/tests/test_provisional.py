@@ -0,0 +1,59 @@
+from collections import Counter
+
+import pytest
+
+from .. import crud, errors, provisional, schemas
+from ..settings import settings
+from .conftest import create_election, vote
+
+
+@pytest.fixture
+def provisional_results(monkeypatch):
+    monkeypatch.setattr(settings, "provisional_results", True)
+    monkeypatch.setattr(provisional, "_pending", Counter())
+
+
+def _create_election(db) -> schemas.ElectionCreatedGet:
+    election = create_election(db, 4)
+    for token, grades in zip(election.invites, [[0, 1, 2], [3, 2, 1], [1, 1, 3]]):
+        vote(db, election, token, grades)
+    return election
+
+
+@pytest.mark.parametrize("compact_ballots", [False, True])
+def test_provisional_results_match_the_results(
+    db, engine, provisional_results, monkeypatch, compact_ballots
+):
+    monkeypatch.setattr(settings, "compact_ballots", compact_ballots)
+    election = _create_election(db)
+    # The grades replaced by an update are subtracted
+    vote(db, election, election.invites[0], [2, 2, 0])
+
+    with pytest.raises(errors.NoRecordedVotes):
+        crud.get_provisional_results(db, election.ref, election.admin)
+
+    assert provisional.checkpoint(engine) > 0
+    assert provisional.checkpoint(engine) == 0
+    results = crud.get_provisional_results(db, election.ref, election.admin)
+    expected = crud.get_results(db, election.ref, None)
+    assert results.merit_profile == expected.merit_profile
+    assert results.ranking == expected.ranking
+    assert results.date_checkpoint is not None
+
+    # The counts of an election are replaced, not added
+    assert provisional.rebuild(db, election.ref) > 0
+    results = crud.get_provisional_results(db, election.ref, election.admin)
+    assert results.merit_profile == expected.merit_profile
+
+
+def test_provisional_results_need_the_admin_token(db, provisional_results):
+    election = _create_election(db)
+    with pytest.raises(errors.ForbiddenError):
+        crud.get_provisional_results(db, election.ref, election.invites[0])
+
+
+def test_provisional_results_disabled(db):
+    election = _create_election(db)
+    assert not provisional._pending
+    with pytest.raises(errors.BadRequestError):
+        crud.get_provisional_results(db, election.ref, election.admin)
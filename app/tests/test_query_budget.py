@@ -0,0 +1,60 @@
+import asyncio
+import logging
+from sqlalchemy import create_engine, text
+
+from .. import metrics, query_budget
+
+
+def _app(engine, num_statements: int):
+    class Route:
+        path = "/elections/{election_ref}"
+
+    async def app(scope, receive, send):
+        scope["route"] = Route
+        with engine.connect() as connection:
+            for i in range(num_statements):
+                connection.execute(text(f"SELECT {i}"))
+
+    return app
+
+
+def _serve(app):
+    asyncio.run(app({"type": "http", "method": "GET"}, None, None))
+
+
+def test_requests_over_budget_are_logged(tmp_path, caplog):
+    engine = create_engine(f"sqlite:///{tmp_path / 'budget.db'}")
+    metrics.instrument_engine(engine, "budget")
+
+    with caplog.at_level(logging.WARNING, logger="app.query_budget"):
+        _serve(query_budget.QueryBudgetMiddleware(_app(engine, 3), budget=3))
+        assert caplog.records == []
+
+        _serve(query_budget.QueryBudgetMiddleware(_app(engine, 4), budget=3))
+        assert "GET /elections/{election_ref} issued 4 SQL statements" in caplog.text
+
+
+def test_budgets_by_route(tmp_path, caplog):
+    engine = create_engine(f"sqlite:///{tmp_path / 'budget.db'}")
+    metrics.instrument_engine(engine, "budget")
+    middleware = query_budget.QueryBudgetMiddleware(
+        _app(engine, 4), budget=3, budgets={"/elections/{election_ref}": 5}
+    )
+
+    with query_budget.recording() as requests:
+        with caplog.at_level(logging.WARNING, logger="app.query_budget"):
+            _serve(middleware)
+    assert caplog.records == []
+    assert requests == [("GET", "/elections/{election_ref}", 4)]
+
+
+def test_nested_counts():
+    engine = create_engine("sqlite://")
+    metrics.instrument_engine(engine, "nested")
+
+    with metrics.count_sql() as outer:
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+            with metrics.count_sql() as inner:
+                connection.execute(text("SELECT 2"))
+    assert (outer.statements, inner.statements) == (2, 1)
@@ -0,0 +1,170 @@
+"""
+Query-plan regression tests.
+
+We record the statements issued by the hot crud functions on a seeded database,
+then EXPLAIN each of them and fail if one scans a whole table.
+
+They run on SQLite by default. Set QUERY_PLANS_DATABASE_URL to a (disposable)
+PostgreSQL database to check the plans of the production planner.
+"""
+import os
+import re
+import typing as t
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import sessionmaker
+
+from ..database import Base
+from .. import crud, errors, schemas
+
+database_url = os.getenv("QUERY_PLANS_DATABASE_URL", "sqlite:///./test_plans.db")
+plans_engine = create_engine(database_url)
+PlansSessionLocal: sessionmaker = sessionmaker(  # type: ignore
+    autocommit=False, autoflush=False, bind=plans_engine
+)
+
+NUM_ELECTIONS = 10
+NUM_VOTERS = 50
+TABLES = ("elections", "candidates", "grades", "votes", "ballots")
+
+
+def _seed() -> list[schemas.ElectionCreatedGet]:
+    Base.metadata.drop_all(bind=plans_engine)
+    Base.metadata.create_all(bind=plans_engine)
+
+    db = PlansSessionLocal()
+    elections = []
+    try:
+        for _ in range(NUM_ELECTIONS):
+            election = schemas.ElectionCreate(
+                name="Seed",
+                hide_results=False,
+                restricted=True,
+                date_start=None,
+                num_voters=NUM_VOTERS,
+                candidates=[{"name": f"candidate {i}"} for i in range(5)],  # type: ignore
+                grades=[{"name": f"grade {i}", "value": i} for i in range(4)],  # type: ignore
+            )
+            elections.append(crud.create_election(db, election))
+    finally:
+        db.close()
+
+    with plans_engine.begin() as connection:
+        connection.execute(text("ANALYZE"))
+
+    return elections
+
+
+def _record_statements(
+    engine: Engine, func: t.Callable[[], t.Any]
+) -> list[tuple[str, t.Any]]:
+    """
+    Collect the statements executed while calling func
+    """
+    statements: list[tuple[str, t.Any]] = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(
+            ("SELECT", "UPDATE", "DELETE")
+        ):
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        func()
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+    return statements
+
+
+def _full_scans(connection: Connection, statement: str, parameters: t.Any) -> list[str]:
+    """
+    List the tables scanned without an index by a statement
+    """
+    if connection.dialect.name == "postgresql":
+        # Sequential scans stay possible, but only when no index can be used.
+        connection.exec_driver_sql("SET enable_seqscan = off")
+        plan = connection.exec_driver_sql(
+            f"EXPLAIN (FORMAT JSON) {statement}", parameters
+        ).scalar_one()
+
+        def walk(node: dict[str, t.Any]) -> t.Iterator[str]:
+            if node["Node Type"] == "Seq Scan":
+                yield node["Relation Name"]
+            for child in node.get("Plans", []):
+                yield from walk(child)
+
+        return list(walk(plan[0]["Plan"]))
+
+    rows = connection.exec_driver_sql(
+        f"EXPLAIN QUERY PLAN {statement}", parameters
+    ).all()
+    pattern = re.compile(rf"^SCAN ({'|'.join(TABLES)})\b")
+    return [row[3] for row in rows if pattern.match(row[3])]
+
+
+@pytest.fixture(scope="module")
+def elections() -> list[schemas.ElectionCreatedGet]:
+    return _seed()
+
+
+def _check_plans(func: t.Callable[[], t.Any]):
+    statements = _record_statements(plans_engine, func)
+    assert statements != []
+
+    with plans_engine.connect() as connection:
+        for statement, parameters in statements:
+            scans = _full_scans(connection, statement, parameters)
+            assert scans == [], f"Full scan {scans} in:\n{statement}"
+
+
+def _vote(db, election: schemas.ElectionCreatedGet, token: str):
+    grade_id = election.grades[0].id
+    ballot = schemas.BallotUpdate(
+        votes=[
+            schemas.VoteCreate(candidate_id=c.id, grade_id=grade_id)
+            for c in election.candidates
+        ]
+    )
+    return crud.update_ballot(db, ballot, token)
+
+
+def test_ballot_queries_use_indexes(elections):
+    election = elections[0]
+    db = PlansSessionLocal()
+    try:
+        _check_plans(lambda: _vote(db, election, election.invites[0]))
+        _check_plans(lambda: crud.get_ballot(db, election.invites[0]))
+    finally:
+        db.close()
+
+
+def test_results_and_progress_queries_use_indexes(elections):
+    election = elections[1]
+    db = PlansSessionLocal()
+    try:
+        _vote(db, election, election.invites[0])
+        _check_plans(lambda: crud.get_results(db, election.ref, None))
+        _check_plans(lambda: crud.get_progress(db, election.ref, election.admin))
+    finally:
+        db.close()
+
+
+def test_votes_cast_check_uses_indexes(elections):
+    election = elections[2]
+    db = PlansSessionLocal()
+    try:
+        _vote(db, election, election.invites[0])
+        date_start = datetime.now() - timedelta(days=1)
+        update = schemas.ElectionUpdate(ref=election.ref, date_start=date_start)
+
+        def update_election():
+            with pytest.raises(errors.ElectionIsActiveError):
+                crud.update_election(db, update, election.admin)
+
+        _check_plans(update_election)
+    finally:
+        db.close()
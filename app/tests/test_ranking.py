@@ -0,0 +1,98 @@
+import itertools
+import random
+
+import numpy as np
+import pytest
+from sqlalchemy import select
+
+from .. import archive, crud, models, ranking, schemas
+from ..settings import settings
+from .conftest import create_election, vote
+
+
+def majority_values(grades: list[int]) -> list[int]:
+    grades = sorted(grades)
+    return [grades.pop((len(grades) - 1) // 2) for _ in range(len(grades))]
+
+
+def test_keys_compare_as_majority_values():
+    rng = random.Random(0)
+    for _ in range(500):
+        num_grades = rng.randint(2, 7)
+        num_votes = rng.randint(1, 40)
+        profiles: list[list[int]] = []
+        for _ in range(rng.randint(2, 6)):
+            if profiles and rng.random() < 0.3:
+                # Ties and near ties
+                profiles.append(sorted(profiles[-1])[::-1])
+                continue
+            weights = [rng.random() ** 3 for _ in range(num_grades)]
+            population = range(num_grades)
+            profiles.append(rng.choices(population, weights, k=num_votes))
+
+        counts = [[p.count(g) for g in range(num_grades)] for p in profiles]
+        keys = [tuple(k) for k in ranking.majority_keys(np.array(counts))]
+        for i, j in itertools.combinations(range(len(profiles)), 2):
+            mi, mj = majority_values(profiles[i]), majority_values(profiles[j])
+            assert (keys[i] > keys[j]) == (mi > mj)
+            assert (keys[i] == keys[j]) == (mi == mj)
+
+
+def test_order_groups():
+    groups = np.array([1, 0, 1, 0, 1])
+    keys = np.array([[3, 1], [5, 0], [3, 1], [2, 2], [0, 9]])
+    assert ranking.order_groups(groups, keys).tolist() == [1, 1, 1, 0, 0]
+
+
+def _create_election(db, grades: list[list[int]]) -> schemas.ElectionCreatedGet:
+    """
+    Create an election where each voter gives the grades of a row
+    """
+    election = create_election(db, len(grades), len(grades[0]), range(5))
+    for token, row in zip(election.invites, grades):
+        vote(db, election, token, row)
+    return election
+
+
+def test_batch_results_match_the_results(db, monkeypatch):
+    rng = random.Random(1)
+    refs = []
+    for i in range(6):
+        monkeypatch.setattr(settings, "compact_ballots", i % 2 == 1)
+        num_candidates = rng.randint(2, 5)
+        grades = [
+            [rng.randint(0, 4) for _ in range(num_candidates)]
+            for _ in range(rng.randint(1, 9))
+        ]
+        refs.append(_create_election(db, grades).ref)
+    archive.archive_election(db, refs[0])
+    expected = {ref: crud.get_results(db, ref, None) for ref in refs}
+
+    results = ranking.rank_elections(db, refs)
+    assert set(results) == set(refs)
+    for ref, r in results.items():
+        assert r.merit_profile == expected[ref].merit_profile
+        assert r.ranking == expected[ref].ranking
+
+    ranking.save_results(db, results)
+    ranking.save_results(db, results)
+    stored = db.scalars(
+        select(models.ElectionResults).filter(
+            models.ElectionResults.election_ref.in_(refs)
+        )
+    ).all()
+    assert len(stored) == len(refs)
+
+
+def test_elections_without_votes_are_left_out(db):
+    election = _create_election(db, [[0, 1]])
+    empty = crud.create_election(
+        db,
+        schemas.ElectionCreate(
+            name="Bar",
+            candidates=[{"name": "a"}, {"name": "b"}],  # type: ignore
+            grades=[{"name": "g0", "value": 0}, {"name": "g1", "value": 1}],  # type: ignore
+        ),
+    )
+    results = ranking.rank_elections(db, [election.ref, empty.ref])
+    assert list(results) == [election.ref]
@@ -0,0 +1,27 @@
+import random
+from .. import server
+from ..settings import settings
+
+
+def test_num_workers(monkeypatch):
+    assert server.num_workers() >= 2
+
+    monkeypatch.setattr(settings, "workers", 3)
+    assert server.num_workers() == 3
+
+
+def test_options():
+    options = server.options()
+    assert options["preload_app"]
+    assert options["worker_class"] == "uvicorn.workers.UvicornWorker"
+    assert options["max_requests_jitter"] > 0
+
+
+def test_post_fork_reseeds_the_random_generator():
+    random.seed(0)
+    server.post_fork(None, None)
+    first = random.random()
+
+    random.seed(0)
+    server.post_fork(None, None)
+    assert random.random() != first
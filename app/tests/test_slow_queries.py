@@ -0,0 +1,81 @@
+import json
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from ..auth import create_admin_token, create_operator_token
+from ..main import app
+from ..slow_queries import REDACTED, SlowQueryLog, redact
+
+client = TestClient(app)
+
+
+def test_slow_statements_are_logged_with_their_plan(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'slow.db'}")
+    log = SlowQueryLog(0, str(tmp_path / "slow.log"))
+    log.instrument(engine)
+
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE tokens (id INTEGER PRIMARY KEY, token TEXT)"))
+        connection.execute(
+            text("INSERT INTO tokens (token) VALUES (:token)"), {"token": "aaa.bbb.ccc"}
+        )
+        connection.execute(text("SELECT * FROM tokens WHERE id = :id"), {"id": 1})
+
+    entries = [json.loads(line) for line in open(tmp_path / "slow.log")]
+    assert len(entries) == 3
+    select = entries[-1]
+    assert select["parameters"] == [1]
+    assert "SCAN" in select["plan"] or "SEARCH" in select["plan"]
+    assert entries[1]["parameters"] == [REDACTED]
+    # Nothing to plan for DDL
+    assert entries[0]["plan"] is None
+
+
+def test_fast_statements_are_not_logged(tmp_path):
+    engine = create_engine("sqlite://")
+    log = SlowQueryLog(10_000, str(tmp_path / "slow.log"))
+    log.instrument(engine)
+
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+
+    assert log.top() == []
+    assert not (tmp_path / "slow.log").exists()
+
+
+def test_top_statements_by_total_time():
+    log = SlowQueryLog(0)
+    log.record("SELECT * FROM votes WHERE id IN (?, ?)", [1, 2], 0.3)
+    log.record("SELECT * FROM votes WHERE id IN (?, ?, ?)", [1, 2, 3], 0.3)
+    log.record("SELECT * FROM elections", [], 0.5)
+
+    top = log.top(limit=1)
+    assert top[0]["statement"] == "SELECT * FROM votes WHERE id IN (...)"
+    assert top[0]["count"] == 2
+    assert round(top[0]["total_ms"]) == 600
+    assert round(top[0]["max_ms"]) == 300
+
+
+def test_redact():
+    token = create_admin_token("abc")
+    assert redact({"ref": "abc", "token": "xyz", "admin": token}) == {
+        "ref": "abc",
+        "token": REDACTED,
+        "admin": REDACTED,
+    }
+    assert redact([[1, token], [2, "abc"]]) == [[1, REDACTED], [2, "abc"]]
+
+
+def test_slow_queries_endpoint_requires_an_operator_token():
+    response = client.get(
+        "/admin/slow-queries",
+        headers={"Authorization": f"Bearer {create_admin_token('abc')}"},
+    )
+    assert response.status_code == 403, response.text
+
+    response = client.get(
+        "/admin/slow-queries",
+        headers={"Authorization": f"Bearer {create_operator_token()}"},
+    )
+    assert response.status_code == 200, response.text
+    assert isinstance(response.json(), list)
@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from .. import crud, errors, schemas, snapshots
+from ..settings import settings
+from .conftest import create_election, vote
+
+
+def _create_election(db) -> schemas.ElectionCreatedGet:
+    """
+    Create a restricted election with 4 voters, the last one not voting.
+    The values of the grades are not in the order of their ids.
+    """
+    election = create_election(db, 4, grade_values=[(2 * i) % 5 for i in range(5)])
+    for i, token in enumerate(election.invites[:-1]):
+        vote(db, election, token, [(i + j) % 5 for j in range(3)])
+    return election
+
+
+@pytest.mark.parametrize("compact_ballots", [False, True])
+def test_snapshot_matches_the_results(db, tmp_path, monkeypatch, compact_ballots):
+    monkeypatch.setattr(settings, "compact_ballots", compact_ballots)
+    election = _create_election(db)
+    results = crud.get_results(db, election.ref, None)
+
+    snapshots.write_snapshot(db, election.ref, tmp_path)
+    snapshot = snapshots.load_snapshot(election.ref, tmp_path)
+    assert snapshot.num_ballots == 3
+    assert snapshot.grades.dtype == np.uint8
+    assert isinstance(snapshot.grades, np.memmap)
+    assert snapshot.merit_profile() == results.merit_profile
+    assert snapshot.ranking() == results.ranking
+    assert snapshots.load_snapshot(election.ref, tmp_path) is snapshot
+
+
+def test_what_if(db, tmp_path):
+    election = _create_election(db)
+    snapshots.write_snapshot(db, election.ref, tmp_path)
+    snapshot = snapshots.load_snapshot(election.ref, tmp_path)
+    first, *others = [c.id for c in election.candidates]
+
+    ranking = snapshot.ranking(exclude=[first])
+    assert set(ranking) == set(others)
+    assert first not in snapshot.merit_profile(exclude=[first])
+
+    now = datetime.now()
+    tomorrow = now + timedelta(days=1)
+    assert snapshot.merit_profile(end=tomorrow) == snapshot.merit_profile()
+    assert snapshot.merit_profile(start=tomorrow) == {}
+    with pytest.raises(errors.NoRecordedVotes):
+        snapshot.ranking(start=tomorrow)
+
+
+def test_snapshot_is_replaced(db, tmp_path):
+    election = _create_election(db)
+    snapshots.write_snapshot(db, election.ref, tmp_path)
+    former = snapshots.load_snapshot(election.ref, tmp_path)
+
+    db_election = crud.get_election(db, election.ref)
+    setattr(db_election, "restricted", False)
+    db.commit()
+    crud.create_ballot(
+        db,
+        schemas.BallotCreate(
+            election_ref=election.ref,
+            votes=[
+                schemas.VoteCreate(candidate_id=c.id, grade_id=election.grades[0].id)
+                for c in election.candidates
+            ],
+        ),
+    )
+    snapshots.write_snapshot(db, election.ref, tmp_path)
+    snapshot = snapshots.load_snapshot(election.ref, tmp_path)
+    assert snapshot.num_ballots == 4
+    # The former snapshot remains readable by the processes which mapped it
+    assert former.num_ballots == 3
+    assert former.counts().sum() == 9
+
+
+def test_missing_snapshot(tmp_path):
+    with pytest.raises(errors.NotFoundError):
+        snapshots.load_snapshot("missing", tmp_path)
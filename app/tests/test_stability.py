@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+
+from .. import crud, errors, schemas, stability
+from ..auth import create_admin_token, create_ballot_token
+from ..settings import settings
+
+
+def test_clear_winner_always_wins():
+    counts = np.array([[0, 1, 99], [99, 1, 0], [50, 0, 50]])
+    resamples = stability.resample_ranks(counts, 500, seed=0)
+    assert resamples.num_samples == 500
+    assert resamples.ranks[0].tolist() == [500, 0, 0]
+    assert resamples.ranks[1].tolist() == [0, 0, 500]
+    assert (resamples.ranks.sum(axis=1) == 500).all()
+
+
+def test_close_candidates_share_the_first_place():
+    counts = np.array([[10, 11, 10], [10, 11, 10], [30, 1, 0]])
+    ranks = stability.resample_ranks(counts, 2000, seed=0).ranks
+    assert 500 < ranks[0, 0] < 2000
+    assert 500 < ranks[1, 0] < 2000
+    # Tied candidates share the first place
+    assert ranks[0, 0] + ranks[1, 0] >= 2000
+    assert ranks[2, 2] == 2000
+
+
+def test_time_budget_stops_the_resampling():
+    counts = np.array([[1, 2, 3], [3, 2, 1]])
+    resamples = stability.resample_ranks(counts, 10**9, time_budget=0, seed=0)
+    assert 0 < resamples.num_samples < 10**9
+    assert resamples.ranks.sum() == 2 * resamples.num_samples
+
+
+def test_stability_of_an_election(db):
+    election = crud.create_election(
+        db,
+        schemas.ElectionCreate(
+            name="Foo",
+            hide_results=False,
+            restricted=True,
+            num_voters=3,
+            candidates=[{"name": "a"}, {"name": "b"}],  # type: ignore
+            grades=[{"name": f"g{i}", "value": i} for i in range(3)],  # type: ignore
+        ),
+    )
+    for token in election.invites:
+        ballot = schemas.BallotUpdate(
+            votes=[
+                schemas.VoteCreate(candidate_id=c.id, grade_id=g.id)
+                for c, g in zip(election.candidates, election.grades[1:])
+            ]
+        )
+        crud.update_ballot(db, ballot, token)
+
+    admin = create_admin_token(election.ref)
+    result = stability.get_stability(db, election.ref, admin, 100, seed=0)
+    assert result.num_samples == 100
+    first, second = [c.id for c in election.candidates]
+    assert result.ranks == {first: [0.0, 1.0], second: [1.0, 0.0]}
+
+    with pytest.raises(errors.BadRequestError):
+        stability.get_stability(
+            db, election.ref, admin, settings.stability_max_samples + 1
+        )
+    with pytest.raises(errors.ForbiddenError):
+        token = create_ballot_token([], election.ref, 0)
+        stability.get_stability(db, election.ref, token, 100)
+
+
+def test_stability_of_hidden_results(db):
+    election = crud.create_election(
+        db,
+        schemas.ElectionCreate(
+            name="Foo",
+            hide_results=True,
+            date_start=datetime.now(),
+            date_end=datetime.now() + timedelta(days=1),
+            candidates=[{"name": "a"}, {"name": "b"}],  # type: ignore
+            grades=[{"name": f"g{i}", "value": i} for i in range(3)],  # type: ignore
+        ),
+    )
+    admin = create_admin_token(election.ref)
+    with pytest.raises(errors.ResultsHiddenError):
+        stability.get_stability(db, election.ref, admin, 100)
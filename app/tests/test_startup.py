@@ -0,0 +1,41 @@
+"""
+Workers must boot quickly: importing the application neither touches the
+database nor imports modules that only some requests need.
+"""
+import os
+from benchmarks.startup import import_times
+
+# Generous, since CI machines are slow and noisy
+BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "1500"))
+
+LAZY_MODULES = (
+    "dateutil",
+    "majority_judgment",
+    "numpy",
+    "sqlalchemy.ext.asyncio",
+    "aiosqlite",
+    "asyncpg",
+    "app.async_routes",
+    "app.profiler",
+)
+
+
+def test_import_does_not_touch_the_database(tmp_path):
+    import_times("app.main", cwd=str(tmp_path), env={"SQLITE": "True", "ASYNC_DB": "False"})
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_heavy_modules_are_imported_lazily(tmp_path):
+    times = import_times("app.main", cwd=str(tmp_path), env={"SQLITE": "True", "ASYNC_DB": "False"})
+    assert "app.main" in times
+    assert [m for m in LAZY_MODULES if m in times] == []
+
+
+def test_import_time_budget(tmp_path):
+    env = {"SQLITE": "True", "ASYNC_DB": "False"}
+    # The fastest run is the least disturbed by the machine load
+    import_ms = min(
+        import_times("app.main", cwd=str(tmp_path), env=env)["app.main"][1] / 1000
+        for _ in range(3)
+    )
+    assert import_ms < BUDGET_MS
@@ -0,0 +1,102 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import update
+
+from .. import crud, errors, models, schemas, timeline
+from ..settings import settings
+from .conftest import create_election, vote
+
+
+DATES = [
+    datetime(2024, 1, 1, 10, 0, 30),
+    datetime(2024, 1, 1, 10, 0, 50),
+    datetime(2024, 1, 1, 11, 30),
+]
+
+
+def _create_election(db) -> schemas.ElectionCreatedGet:
+    """
+    Create a restricted election where the voters vote at DATES
+    """
+    election = create_election(db, len(DATES) + 1)
+    for i, (token, date) in enumerate(zip(election.invites, DATES)):
+        ballot_get = vote(db, election, token, [(i + j) % 4 for j in range(3)])
+        vote_ids = [v.id for v in ballot_get.votes]
+        if settings.compact_ballots:
+            table = models.Ballot
+            condition = table.id == vote_ids[0]
+        else:
+            table = models.Vote
+            condition = table.id.in_(vote_ids)
+        db.execute(update(table).where(condition).values(date_modified=date))
+    db.commit()
+    return election
+
+
+@pytest.mark.parametrize("compact_ballots", [False, True])
+def test_timeline(db, monkeypatch, compact_ballots):
+    monkeypatch.setattr(settings, "compact_ballots", compact_ballots)
+    election = _create_election(db)
+    ref, token = election.ref, election.admin
+
+    assert timeline.get_timeline(db, ref, token).buckets == []
+    timeline.roll_up(db, datetime(2024, 1, 1, 12))
+    # Rolling up again replaces the buckets
+    timeline.roll_up(db, datetime(2024, 1, 1, 12))
+
+    minutes = timeline.get_timeline(db, ref, token, "minute").buckets
+    assert [(b.date_start, b.num_ballots) for b in minutes] == [
+        (datetime(2024, 1, 1, 10), 2),
+        (datetime(2024, 1, 1, 11, 30), 1),
+    ]
+    hours = timeline.get_timeline(db, ref, token, "hour").buckets
+    assert [(b.date_start, b.num_ballots) for b in hours] == [
+        (datetime(2024, 1, 1, 10), 2),
+        (datetime(2024, 1, 1, 11), 1),
+    ]
+    (day,) = timeline.get_timeline(db, ref, token, "day").buckets
+    assert day.num_ballots == 3
+    assert day.grades == crud.get_results(db, ref, None).merit_profile
+
+    start = datetime(2024, 1, 1, 10, 30)
+    (hour,) = timeline.get_timeline(db, ref, token, "hour", start=start).buckets
+    assert hour.date_start == datetime(2024, 1, 1, 11)
+    candidate_ids = [c.id for c in election.candidates]
+    assert hour.grades == {c: {(2 + j) % 4: 1} for j, c in enumerate(candidate_ids)}
+    end = datetime(2024, 1, 1, 10)
+    assert timeline.get_timeline(db, ref, token, "hour", end=end).buckets == []
+
+
+def test_timeline_needs_the_admin_token(db):
+    election = _create_election(db)
+    with pytest.raises(errors.ForbiddenError):
+        timeline.get_timeline(db, election.ref, election.invites[0])
+
+
+def test_too_many_buckets(db, monkeypatch):
+    election = _create_election(db)
+    timeline.roll_up(db, datetime(2024, 1, 1))
+    monkeypatch.setattr(settings, "timeline_max_buckets", 1)
+    with pytest.raises(errors.BadRequestError):
+        timeline.get_timeline(db, election.ref, election.admin, "minute")
+
+
+@pytest.mark.parametrize("compact_ballots", [False, True])
+def test_rewritten_ballots_leave_their_former_buckets(db, monkeypatch, compact_ballots):
+    monkeypatch.setattr(settings, "compact_ballots", compact_ballots)
+    election = _create_election(db)
+    ref, token = election.ref, election.admin
+    timeline.roll_up(db, datetime(2024, 1, 1))
+
+    # The last voter changes their ballot long after it was rolled up, and the
+    # next rollups do not go back to its former day
+    vote(db, election, election.invites[len(DATES) - 1], [0, 0, 0])
+    timeline.roll_up(db, datetime(2024, 1, 2))
+
+    hours = timeline.get_timeline(db, ref, token, "hour", end=datetime(2024, 1, 2))
+    assert [b.num_ballots for b in hours.buckets] == [2, 0]
+    former_day, day = timeline.get_timeline(db, ref, token, "day").buckets
+    assert (former_day.num_ballots, day.num_ballots) == (2, 1)
+    for grades in former_day.grades.values():
+        assert sum(grades.values()) == 2
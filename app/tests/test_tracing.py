@@ -0,0 +1,82 @@
+import json
+import typing as t
+import pytest
+from fastapi.testclient import TestClient
+
+from scripts.trace_breakdown import breakdown, read_requests
+from .. import tracing
+from ..main import app
+from .test_api import _random_election
+
+client = TestClient(tracing.TracingMiddleware(app))
+
+
+@pytest.fixture
+def traces(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracing.configure(str(path))
+    try:
+        yield path
+    finally:
+        tracing.configure(None)
+
+
+def _spans(path) -> list[list[dict[str, t.Any]]]:
+    return list(read_requests(str(path)))
+
+
+def test_spans_outside_of_a_request_are_ignored(traces):
+    with tracing.span("orphan") as span:
+        assert span is None
+
+
+def test_phases_of_the_results(traces):
+    data = client.post("/elections", json=_random_election(3, 3)).json()
+    votes = [
+        {"candidate_id": c["id"], "grade_id": data["grades"][0]["id"]}
+        for c in data["candidates"]
+    ]
+    response = client.post("/ballots", json={"votes": votes, "election_ref": data["ref"]})
+    assert response.status_code == 200, response.text
+    response = client.get(f"/results/{data['ref']}")
+    assert response.status_code == 200, response.text
+
+    _, ballot, results = _spans(traces)
+    root = results[-1]
+    assert root["name"] == "GET /results/{election_ref}"
+    assert root["kind"] == tracing.SPAN_KIND_SERVER
+    assert {"key": "http.status_code", "value": {"intValue": "200"}} in root["attributes"]
+
+    names = [s["name"] for s in results]
+    for phase in ("load_election", "validate", "load_tallies", "majority_judgment", "serialize"):
+        assert phase in names
+    assert all(s["traceId"] == root["traceId"] for s in results)
+    assert all(s["parentSpanId"] == root["spanId"] for s in results[:-1])
+
+    names = [s["name"] for s in ballot]
+    for phase in ("load_election", "validate", "write", "commit", "serialize", "sign_token"):
+        assert phase in names
+
+    durations = breakdown(_spans(traces), route="POST /ballots")
+    assert list(durations) == ["POST /ballots"]
+    assert len(durations["POST /ballots"]["total"]) == 1
+
+
+def test_errors_and_trace_continuation(traces):
+    trace_id = "4bf92f3577b34da6a3ce929d0e0e4736"
+    response = client.get(
+        "/ballots",
+        headers={
+            "Authorization": "Bearer wrong",
+            "traceparent": f"00-{trace_id}-00f067aa0ba902b7-01",
+        },
+    )
+    assert response.status_code == 401
+
+    (spans,) = _spans(traces)
+    verify, root = spans
+    assert root["traceId"] == trace_id
+    assert root["parentSpanId"] == "00f067aa0ba902b7"
+    assert verify["name"] == "jws_verify"
+    assert verify["status"]["code"] == tracing.STATUS_ERROR
+    assert json.dumps(root)  # Serializable as is
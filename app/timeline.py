@@ -0,0 +1,327 @@
+"""
+Participation over time, from rollups of the ballots by time bucket.
+
+Counting the ballots of an election by minute scans its votes, so the timeline
+and the dashboards read rollup tables instead: `timeline_buckets` holds the
+number of ballots cast in each minute, hour and day of an election, and
+`timeline_grades` the grades they gave. `roll_up` recomputes the buckets from a
+date on, as scripts/roll_up_timeline.py does every few minutes: the minutes
+from the votes and the compact ballots, then the hours and days from the
+minutes.
+
+A ballot is counted at its last write: when it is written again, `uncount`
+removes it from the buckets of its former write, which the rollups may not
+recompute anymore.
+"""
+import typing as t
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import (
+    ColumnClause,
+    DateTime,
+    String,
+    delete,
+    distinct,
+    func,
+    insert,
+    literal,
+    literal_column,
+    or_,
+    select,
+    tuple_,
+    update,
+)
+from sqlalchemy.sql.dml import Update
+from sqlalchemy.orm import Session
+
+from . import crud, errors, models, schemas
+from .auth import jws_verify
+from .settings import settings
+
+Period = t.Literal["minute", "hour", "day"]
+
+# Buckets in the format of the dates stored by SQLAlchemy in SQLite, so that
+# they compare with the dates bound to queries
+_SQLITE_FORMATS = {
+    "minute": "%Y-%m-%d %H:%M:00.000000",
+    "hour": "%Y-%m-%d %H:00:00.000000",
+    "day": "%Y-%m-%d 00:00:00.000000",
+}
+
+
+def _is_postgresql(db: Session) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+
+def _bucket(db: Session, date: t.Any, period: Period) -> t.Any:
+    # Inlined, so that the expression of the select is the one of the group by
+    if _is_postgresql(db):
+        return func.date_trunc(literal_column(f"'{period}'"), date)
+    return func.strftime(literal_column(f"'{_SQLITE_FORMATS[period]}'"), date)
+
+
+def _since(db: Session, date: datetime) -> t.Any:
+    if _is_postgresql(db):
+        return literal(date, DateTime)
+    # func.now() stores the dates without microseconds in SQLite
+    return literal(date.strftime("%Y-%m-%d %H:%M:%S"), String)
+
+
+def _minutes(db: Session, since: datetime) -> list[tuple[t.Any, t.Any]]:
+    """
+    Queries of the (ballots, grades) rows of the minute buckets since a date,
+    for the votes and for the compact ballots
+    """
+    minute: ColumnClause[str] = literal_column("'minute'")
+    vote = models.Vote
+    vote_cast = func.coalesce(vote.date_modified, vote.date_created)
+    vote_bucket = _bucket(db, vote_cast, "minute")
+    votes_filter = vote.grade_id.is_not(None) & (vote_cast >= _since(db, since))
+    ballot = models.Ballot
+    ballot_cast = func.coalesce(ballot.date_modified, ballot.date_created)
+    ballot_bucket = _bucket(db, ballot_cast, "minute")
+    ballots_filter = ballot.grades.is_not(None) & (ballot_cast >= _since(db, since))
+    view = models.ballot_votes
+
+    return [
+        (
+            select(
+                vote.election_ref,
+                minute,
+                vote_bucket,
+                func.count(distinct(vote.ballot_id)),
+            )
+            .filter(votes_filter)
+            .group_by(vote.election_ref, vote_bucket),
+            select(
+                vote.election_ref,
+                minute,
+                vote_bucket,
+                vote.candidate_id,
+                vote.grade_id,
+                func.count(),
+            )
+            .filter(votes_filter)
+            .group_by(vote.election_ref, vote_bucket, vote.candidate_id, vote.grade_id),
+        ),
+        (
+            select(ballot.election_ref, minute, ballot_bucket, func.count())
+            .filter(ballots_filter)
+            .group_by(ballot.election_ref, ballot_bucket),
+            select(
+                view.c.election_ref,
+                minute,
+                ballot_bucket,
+                view.c.candidate_id,
+                view.c.grade_id,
+                func.count(),
+            )
+            .join(ballot, ballot.id == view.c.ballot_id)
+            .filter(ballots_filter)
+            .group_by(
+                view.c.election_ref,
+                ballot_bucket,
+                view.c.candidate_id,
+                view.c.grade_id,
+            ),
+        ),
+    ]
+
+
+def uncount(
+    election_ref: str,
+    cast_at: datetime | None,
+    grades: t.Iterable[tuple[t.Any, t.Any]],
+) -> list[Update]:
+    """
+    Statements removing a ballot from the buckets of its former write, given the
+    date and the (candidate_id, grade_id) of this write. A bucket not rolled up
+    yet is left as it is.
+    """
+    pairs = [(c, g) for c, g in grades if c is not None and g is not None]
+    if cast_at is None or not pairs:
+        return []
+
+    starts = {
+        "minute": cast_at.replace(second=0, microsecond=0),
+        "hour": cast_at.replace(minute=0, second=0, microsecond=0),
+        "day": cast_at.replace(hour=0, minute=0, second=0, microsecond=0),
+    }
+
+    def in_buckets(table: t.Any) -> t.Any:
+        return (table.election_ref == election_ref) & or_(
+            *(
+                (table.period == period) & (table.bucket_start == start)
+                for period, start in starts.items()
+            )
+        )
+
+    bucket = models.TimelineBucket
+    grade = models.TimelineGrade
+    graded = tuple_(grade.candidate_id, grade.grade_id).in_(pairs)
+    # The session holds no bucket to synchronize
+    return [
+        update(bucket)
+        .where(in_buckets(bucket))
+        .values(num_ballots=bucket.num_ballots - 1)
+        .execution_options(synchronize_session=False),
+        update(grade)
+        .where(in_buckets(grade) & graded)
+        .values(num_votes=grade.num_votes - 1)
+        .execution_options(synchronize_session=False),
+    ]
+
+
+def roll_up(db: Session, since: datetime) -> int:
+    """
+    Recompute the buckets of the timeline from the day of a date on.
+    Return the number of written buckets.
+    """
+    since = since.replace(hour=0, minute=0, second=0, microsecond=0)
+    buckets = models.TimelineBucket.__table__
+    grades = models.TimelineGrade.__table__
+    bucket_columns = ["election_ref", "period", "bucket_start", "num_ballots"]
+    grade_columns = [
+        "election_ref",
+        "period",
+        "bucket_start",
+        "candidate_id",
+        "grade_id",
+        "num_votes",
+    ]
+    # The ballots of archived elections are gone, but not their buckets
+    hot = select(models.Election.ref).filter(models.Election.archived.is_not(True))
+
+    try:
+        for table in (buckets, grades):
+            db.execute(
+                delete(table).where(
+                    (table.c.bucket_start >= since) & table.c.election_ref.in_(hot)
+                )
+            )
+        for ballots_query, grades_query in _minutes(db, since):
+            db.execute(insert(buckets).from_select(bucket_columns, ballots_query))
+            db.execute(insert(grades).from_select(grade_columns, grades_query))
+
+        for period in ("hour", "day"):
+            period_column: ColumnClause[str] = literal_column(f"'{period}'")
+            bucket = _bucket(db, buckets.c.bucket_start, period)
+            query = (
+                select(
+                    buckets.c.election_ref,
+                    period_column,
+                    bucket,
+                    func.sum(buckets.c.num_ballots),
+                )
+                .filter(
+                    (buckets.c.period == "minute")
+                    & (buckets.c.bucket_start >= since)
+                    & buckets.c.election_ref.in_(hot)
+                )
+                .group_by(buckets.c.election_ref, bucket)
+            )
+            db.execute(insert(buckets).from_select(bucket_columns, query))
+
+            bucket = _bucket(db, grades.c.bucket_start, period)
+            query = (
+                select(
+                    grades.c.election_ref,
+                    period_column,
+                    bucket,
+                    grades.c.candidate_id,
+                    grades.c.grade_id,
+                    func.sum(grades.c.num_votes),
+                )
+                .filter(
+                    (grades.c.period == "minute")
+                    & (grades.c.bucket_start >= since)
+                    & grades.c.election_ref.in_(hot)
+                )
+                .group_by(
+                    grades.c.election_ref,
+                    bucket,
+                    grades.c.candidate_id,
+                    grades.c.grade_id,
+                )
+            )
+            db.execute(insert(grades).from_select(grade_columns, query))
+
+        num_buckets = db.scalar(
+            select(func.count())
+            .select_from(buckets)
+            .filter((buckets.c.bucket_start >= since) & buckets.c.election_ref.in_(hot))
+        )
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise e
+    return int(num_buckets or 0)
+
+
+def get_timeline(
+    db: Session,
+    election_ref: str,
+    token: str,
+    period: Period = "hour",
+    start: datetime | None = None,
+    end: datetime | None = None,
+) -> schemas.Timeline:
+    payload = jws_verify(token)
+    if payload["election"] != election_ref:
+        raise errors.UnauthorizedError("Wrong election ref")
+    if not payload.get("admin"):
+        raise errors.ForbiddenError("You are not allowed to manage the election")
+    crud.get_election(db, election_ref)
+
+    def in_range(table: t.Any) -> t.Any:
+        condition = (table.election_ref == election_ref) & (table.period == period)
+        if start is not None:
+            condition &= table.bucket_start >= start
+        if end is not None:
+            condition &= table.bucket_start < end
+        return condition
+
+    bucket = models.TimelineBucket
+    max_buckets = settings.timeline_max_buckets
+    rows = db.execute(
+        select(bucket.bucket_start, bucket.num_ballots)
+        .filter(in_range(bucket))
+        .order_by(bucket.bucket_start)
+        .limit(max_buckets + 1)
+    ).all()
+    if len(rows) > max_buckets:
+        raise errors.BadRequestError(
+            f"More than {max_buckets} buckets: narrow the range or widen the period"
+        )
+
+    grade = models.TimelineGrade
+    grades: t.DefaultDict[datetime, dict[int, dict[int, int]]] = defaultdict(
+        lambda: defaultdict(dict)
+    )
+    if rows:
+        query = (
+            select(
+                grade.bucket_start,
+                grade.candidate_id,
+                models.Grade.value,
+                grade.num_votes,
+            )
+            .join(models.Grade, models.Grade.id == grade.grade_id)
+            .filter(in_range(grade))
+            .filter(grade.bucket_start.between(rows[0][0], rows[-1][0]))
+        )
+        for bucket_start, candidate_id, value, num_votes in db.execute(query):
+            grades[bucket_start][candidate_id][value] = num_votes
+
+    return schemas.Timeline(
+        period=period,
+        buckets=[
+            schemas.TimelineBucket(
+                date_start=bucket_start,
+                num_ballots=num_ballots,
+                grades=grades.get(bucket_start, {}),
+            )
+            for bucket_start, num_ballots in rows
+        ],
+    )
@@ -0,0 +1,214 @@
+"""
+Lightweight tracing of the phases of the requests.
+
+A span is opened for each request by TracingMiddleware, and for the phases of
+the hot routes with `span()`: token verification, election load, validation,
+database write, commit, ranking and serialization. Spans are nested through a
+context variable, which the thread pool of synchronous routes inherits.
+
+When the request ends, its spans are exported as a line of OTLP-JSON, to the
+file given by TRACING_EXPORT or to stdout with TRACING_EXPORT=-, so that
+scripts/trace_breakdown.py or any OpenTelemetry collector can read them.
+Tracing is disabled by default, and `span()` then costs a function call.
+"""
+import contextlib
+import json
+import random
+import sys
+import threading
+import time
+import typing as t
+from contextvars import ContextVar
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+SERVICE_NAME = "majority-judgment-api"
+
+# https://opentelemetry.io/docs/specs/otlp/#json-protobuf-encoding
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+class Span:
+    __slots__ = (
+        "name",
+        "attributes",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "kind",
+        "start",
+        "end",
+        "error",
+        "spans",
+        "_token",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        attributes: dict[str, t.Any],
+        parent: "Span | None" = None,
+        kind: int = SPAN_KIND_INTERNAL,
+        trace_id: str | None = None,
+        parent_id: str | None = None,
+    ):
+        self.name = name
+        self.attributes = attributes
+        self.trace_id: str = (
+            parent.trace_id if parent else trace_id or f"{random.getrandbits(128):032x}"
+        )
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent.span_id if parent else parent_id
+        self.kind = kind
+        self.start = 0
+        self.end = 0
+        self.error: str | None = None
+        # The spans of the request are gathered by its root span
+        self.spans: list[Span] = parent.spans if parent else []
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        self.start = time.time_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.end = time.time_ns()
+        _current_span.reset(self._token)
+        if exc is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        self.spans.append(self)
+
+    def to_otlp(self) -> dict[str, t.Any]:
+        otlp: dict[str, t.Any] = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start),
+            "endTimeUnixNano": str(self.end),
+            "attributes": [_attribute(k, v) for k, v in self.attributes.items()],
+            "status": (
+                {"code": STATUS_ERROR, "message": self.error}
+                if self.error
+                else {"code": STATUS_OK}
+            ),
+        }
+        if self.parent_id:
+            otlp["parentSpanId"] = self.parent_id
+        return otlp
+
+
+def _attribute(key: str, value: t.Any) -> dict[str, t.Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+_current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+class Exporter:
+    """
+    Write the spans of each request as a line of OTLP-JSON
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file: t.TextIO | None = sys.stdout if path == "-" else None
+
+    def export(self, spans: list[Span]):
+        data = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [_attribute("service.name", SERVICE_NAME)]
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": __name__},
+                            "spans": [span.to_otlp() for span in spans],
+                        }
+                    ],
+                }
+            ]
+        }
+        line = json.dumps(data) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a")
+            self._file.write(line)
+            self._file.flush()
+
+
+_exporter: Exporter | None = None
+
+
+def configure(path: str | None):
+    """
+    Export the spans to a file, or to stdout with "-". None disables tracing.
+    """
+    global _exporter
+    _exporter = Exporter(path) if path else None
+
+
+def span(name: str, **attributes: t.Any) -> t.ContextManager[Span | None]:
+    """
+    Time a phase of the current request
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return contextlib.nullcontext()
+    return Span(name, attributes, parent)
+
+
+def _parse_traceparent(header: bytes | None) -> tuple[str | None, str | None]:
+    """
+    Continue the trace of the caller, given as a W3C traceparent header
+    """
+    if header is None:
+        return None, None
+    parts = header.decode("latin-1").split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None, None
+    return parts[1], parts[2]
+
+
+class TracingMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or _exporter is None:
+            await self.app(scope, receive, send)
+            return
+
+        trace_id, parent_id = _parse_traceparent(dict(scope["headers"]).get(b"traceparent"))
+        root = Span(
+            scope["method"],
+            {"http.method": scope["method"]},
+            kind=SPAN_KIND_SERVER,
+            trace_id=trace_id,
+            parent_id=parent_id,
+        )
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                root.attributes["http.status_code"] = message["status"]
+            await send(message)
+
+        try:
+            with root:
+                await self.app(scope, receive, send_with_status)
+        finally:
+            # FastAPI stores the matched route in the scope
+            route = getattr(scope.get("route"), "path", "unmatched")
+            root.name = f"{scope['method']} {route}"
+            root.attributes["http.route"] = route
+            _exporter.export(root.spans)
@@ -0,0 +1,163 @@
+"""
+Compare the threaded stack with the asyncio stack (ASYNC_DB=True).
+
+For each mode, an uvicorn server is started in a subprocess and loaded with
+concurrent clients casting ballots and polling the results. We report the
+throughput, the latencies and the resident memory per in-flight request.
+
+    SECRET=foo SQLITE=True python -m benchmarks.async_engine --concurrency 200
+"""
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import typing as t
+from pathlib import Path
+
+import httpx
+import tap
+from sqlalchemy import create_engine
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+class Arguments(tap.Tap):
+    concurrency: int = 100  # Number of in-flight requests
+    duration: float = 15.0  # Seconds of load for each mode
+    num_candidates: int = 10
+    num_grades: int = 7
+    port: int = 8899
+    output: t.Optional[str] = None  # Write the report as JSON in this file
+
+
+def rss_kib(pid: int) -> int:
+    """
+    Resident memory of a process in KiB (Linux only)
+    """
+    with open(f"/proc/{pid}/status") as fid:
+        for line in fid:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def start_server(args: Arguments, async_db: bool, workdir: str) -> subprocess.Popen:
+    python_path = os.pathsep.join([str(ROOT), os.environ.get("PYTHONPATH", "")])
+    env = dict(os.environ, ASYNC_DB=str(async_db), PYTHONPATH=python_path)
+    if env.get("SQLITE", "").lower() in ("1", "true"):
+        # The server uses ./main.db, so each mode gets its own database
+        from app.models import Base
+
+        engine = create_engine(f"sqlite:///{workdir}/main.db")
+        Base.metadata.create_all(bind=engine)
+        engine.dispose()
+
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port)],
+        cwd=workdir,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+async def wait_until_ready(client: httpx.AsyncClient, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/liveness")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError("The server did not start")
+
+
+async def run_load(args: Arguments, pid: int) -> dict[str, t.Any]:
+    limits = httpx.Limits(max_connections=args.concurrency)
+    base_url = f"http://127.0.0.1:{args.port}"
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        await wait_until_ready(client)
+
+        election = {
+            "name": "Benchmark",
+            "hide_results": False,
+            "candidates": [{"name": f"C{i}"} for i in range(args.num_candidates)],
+            "grades": [{"name": f"G{i}", "value": i} for i in range(args.num_grades)],
+        }
+        response = await client.post("/elections", json=election)
+        response.raise_for_status()
+        data = response.json()
+        ref = data["ref"]
+        candidates = [c["id"] for c in data["candidates"]]
+        grades = [g["id"] for g in data["grades"]]
+
+        idle_rss = rss_kib(pid)
+        peak_rss = idle_rss
+        latencies: list[float] = []
+        errors = 0
+        deadline = time.monotonic() + args.duration
+
+        async def user(index: int):
+            nonlocal errors
+            while time.monotonic() < deadline:
+                votes = [
+                    {"candidate_id": c, "grade_id": grades[(index + i) % len(grades)]}
+                    for i, c in enumerate(candidates)
+                ]
+                for method, url, body in (
+                    ("POST", "/ballots", {"votes": votes, "election_ref": ref}),
+                    ("GET", f"/results/{ref}", None),
+                ):
+                    start = time.perf_counter()
+                    response = await client.request(method, url, json=body)
+                    latencies.append(time.perf_counter() - start)
+                    errors += response.status_code != 200
+
+        async def monitor():
+            nonlocal peak_rss
+            while time.monotonic() < deadline:
+                peak_rss = max(peak_rss, rss_kib(pid))
+                await asyncio.sleep(0.2)
+
+        start = time.monotonic()
+        await asyncio.gather(monitor(), *(user(i) for i in range(args.concurrency)))
+        elapsed = time.monotonic() - start
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": len(latencies) / elapsed,
+        "latency_p50_ms": quantiles[49] * 1000,
+        "latency_p99_ms": quantiles[98] * 1000,
+        "idle_rss_kib": idle_rss,
+        "peak_rss_kib": peak_rss,
+        "rss_per_inflight_kib": (peak_rss - idle_rss) / args.concurrency,
+    }
+
+
+def main(args: Arguments) -> None:
+    report = {}
+    for mode, async_db in (("threaded", False), ("async", True)):
+        with tempfile.TemporaryDirectory() as workdir:
+            server = start_server(args, async_db, workdir)
+            try:
+                report[mode] = asyncio.run(run_load(args, server.pid))
+            finally:
+                server.terminate()
+                server.wait()
+        print(mode, json.dumps(report[mode], indent=2))
+
+    if args.output:
+        with open(args.output, "w") as fid:
+            json.dump(report, fid, indent=2)
+
+
+if __name__ == "__main__":
+    args = Arguments().parse_args()
+    main(args)
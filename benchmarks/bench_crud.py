@@ -0,0 +1,252 @@
+"""
+pytest-benchmark suite of the crud hot paths on a seeded database.
+
+Each scale seeds an election with `candidates` candidates, 7 grades and
+`ballots` ballots, then times the crud functions serving the routes. The peak
+memory of a call, measured apart with tracemalloc, is stored in the extra info
+of each benchmark.
+
+The file is not collected by the functional suite; run it with
+`python -m benchmarks.crud`, or directly:
+
+    SECRET=foo pytest benchmarks/bench_crud.py -o python_files=bench_*.py \
+        --benchmark-only
+
+BENCH_SCALES selects the scales, e.g. BENCH_SCALES=10x1k,1000x1k,10x1M. They run
+on SQLite by default. Set BENCH_DATABASE_URL to a (disposable) PostgreSQL
+database to time the production database.
+"""
+import os
+import random
+import tracemalloc
+import typing as t
+from dataclasses import dataclass
+
+import pytest
+from sqlalchemy import Engine, create_engine, func, insert, select, text
+from sqlalchemy.orm import sessionmaker
+
+pytest.importorskip("pytest_benchmark")
+
+from app import crud, models, schemas
+from app.auth import create_admin_token, create_ballot_token
+from app.database import Base, create_sqlite_engine
+
+NUM_GRADES = 7
+# Rows inserted by statement while seeding
+CHUNK_SIZE = 10_000
+
+
+@dataclass(frozen=True)
+class Scale:
+    candidates: int
+    ballots: int
+    # Invites created by each call of create_election
+    invites: int
+
+
+SCALES = {
+    "10x1k": Scale(candidates=10, ballots=1_000, invites=100),
+    "100x10k": Scale(candidates=100, ballots=10_000, invites=100),
+    "1000x1k": Scale(candidates=1_000, ballots=1_000, invites=10),
+    "10x100k": Scale(candidates=10, ballots=100_000, invites=1_000),
+    "10x1M": Scale(candidates=10, ballots=1_000_000, invites=1_000),
+}
+
+scale_ids = os.getenv("BENCH_SCALES", "10x1k").split(",")
+
+
+@dataclass
+class Seeded:
+    scale: Scale
+    factory: sessionmaker
+    election: schemas.ElectionCreatedGet
+    candidate_ids: list[int]
+    grade_ids: list[int]
+    # Token of a seeded ballot
+    ballot_token: str
+
+
+def _create_engine(tmp_path_factory: pytest.TempPathFactory) -> Engine:
+    url = os.getenv("BENCH_DATABASE_URL")
+    if url is None:
+        directory = tmp_path_factory.mktemp("bench")
+        return create_sqlite_engine(f"sqlite:///{directory}/bench.db")
+    return create_engine(url)
+
+
+def _election(scale: Scale, num_voters: int = 0) -> schemas.ElectionCreate:
+    return schemas.ElectionCreate(
+        name="Benchmark",
+        hide_results=False,
+        restricted=num_voters > 0,
+        date_start=None,
+        num_voters=num_voters,
+        candidates=[{"name": f"candidate {i}"} for i in range(scale.candidates)],  # type: ignore
+        grades=[{"name": f"grade {i}", "value": i} for i in range(NUM_GRADES)],  # type: ignore
+    )
+
+
+def _seed_ballots(
+    engine: Engine,
+    election_ref: str,
+    candidate_ids: list[int],
+    grade_ids: list[int],
+    num_ballots: int,
+) -> tuple[int, list[int]]:
+    """
+    Insert the ballots with bulk statements, which is much faster than crud.
+    Return the id and the vote ids of the first ballot.
+    """
+    rng = random.Random(0)
+    with engine.begin() as connection:
+        max_ballot_id = connection.execute(select(func.max(models.Ballot.id))).scalar()
+        first_ballot_id = (max_ballot_id or 0) + 1
+
+        ballots_per_chunk = max(1, CHUNK_SIZE // len(candidate_ids))
+        for start in range(0, num_ballots, ballots_per_chunk):
+            ballot_ids = range(
+                first_ballot_id + start,
+                first_ballot_id + min(num_ballots, start + ballots_per_chunk),
+            )
+            connection.execute(
+                insert(models.Ballot),
+                [{"id": i, "election_ref": election_ref} for i in ballot_ids],
+            )
+            connection.execute(
+                insert(models.Vote),
+                [
+                    {
+                        "election_ref": election_ref,
+                        "ballot_id": ballot_id,
+                        "candidate_id": candidate_id,
+                        "grade_id": rng.choice(grade_ids),
+                    }
+                    for ballot_id in ballot_ids
+                    for candidate_id in candidate_ids
+                ],
+            )
+
+        if engine.dialect.name == "postgresql":
+            # The ids of the ballots were given, so their sequence did not move
+            connection.execute(
+                text(
+                    "SELECT setval(pg_get_serial_sequence('ballots', 'id'), "
+                    "(SELECT max(id) FROM ballots))"
+                )
+            )
+        connection.execute(text("ANALYZE"))
+
+        vote_ids = connection.execute(
+            select(models.Vote.id)
+            .filter(models.Vote.ballot_id == first_ballot_id)
+            .order_by(models.Vote.id)
+        ).scalars()
+        return first_ballot_id, list(vote_ids)
+
+
+@pytest.fixture(scope="module", params=scale_ids)
+def seeded(request, tmp_path_factory) -> t.Iterator[Seeded]:
+    scale = SCALES[request.param]
+    engine = _create_engine(tmp_path_factory)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    factory: sessionmaker = sessionmaker(  # type: ignore
+        autocommit=False, autoflush=False, bind=engine
+    )
+
+    with factory() as db:
+        election = crud.create_election(db, _election(scale))
+    candidate_ids = [c.id for c in election.candidates]
+    grade_ids = [g.id for g in election.grades]
+    ballot_id, vote_ids = _seed_ballots(
+        engine, election.ref, candidate_ids, grade_ids, scale.ballots
+    )
+
+    yield Seeded(
+        scale=scale,
+        factory=factory,
+        election=election,
+        candidate_ids=candidate_ids,
+        grade_ids=grade_ids,
+        ballot_token=create_ballot_token(vote_ids, election.ref, ballot_id),
+    )
+    engine.dispose()
+
+
+def _in_session(
+    seeded: Seeded, func: t.Callable[..., t.Any], *args
+) -> t.Callable[[], t.Any]:
+    """
+    Call func in a new session, as each request does
+    """
+
+    def call():
+        with seeded.factory() as db:
+            return func(db, *args)
+
+    return call
+
+
+def _run(benchmark, call: t.Callable[[], t.Any], rounds: int | None = None):
+    tracemalloc.start()
+    try:
+        call()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    benchmark.extra_info["peak_memory_kib"] = peak / 1024
+
+    if rounds is None:
+        return benchmark(call)
+    return benchmark.pedantic(call, rounds=rounds, iterations=1, warmup_rounds=1)
+
+
+def _votes(seeded: Seeded, rng: random.Random) -> list[schemas.VoteCreate]:
+    return [
+        schemas.VoteCreate(candidate_id=c, grade_id=rng.choice(seeded.grade_ids))
+        for c in seeded.candidate_ids
+    ]
+
+
+def test_create_election(benchmark, seeded: Seeded):
+    election = _election(seeded.scale, num_voters=seeded.scale.invites)
+    call = _in_session(seeded, crud.create_election, election)
+    created = _run(benchmark, call, rounds=5)
+    assert len(created.invites) == seeded.scale.invites
+
+
+def test_create_ballot(benchmark, seeded: Seeded):
+    ballot = schemas.BallotCreate(
+        votes=_votes(seeded, random.Random(1)), election_ref=seeded.election.ref
+    )
+    created = _run(benchmark, _in_session(seeded, crud.create_ballot, ballot))
+    assert len(created.votes) == seeded.scale.candidates
+
+
+def test_update_ballot(benchmark, seeded: Seeded):
+    ballot = schemas.BallotUpdate(votes=_votes(seeded, random.Random(2)))
+    updated = _run(
+        benchmark, _in_session(seeded, crud.update_ballot, ballot, seeded.ballot_token)
+    )
+    assert len(updated.votes) == seeded.scale.candidates
+
+
+def test_get_ballot(benchmark, seeded: Seeded):
+    ballot = _run(benchmark, _in_session(seeded, crud.get_ballot, seeded.ballot_token))
+    assert len(ballot.votes) == seeded.scale.candidates
+
+
+def test_get_progress(benchmark, seeded: Seeded):
+    token = create_admin_token(seeded.election.ref)
+    progress = _run(
+        benchmark, _in_session(seeded, crud.get_progress, seeded.election.ref, token)
+    )
+    assert progress.num_voters_voted >= seeded.scale.ballots
+
+
+def test_get_results(benchmark, seeded: Seeded):
+    results = _run(
+        benchmark, _in_session(seeded, crud.get_results, seeded.election.ref, None)
+    )
+    assert len(results.candidates) == seeded.scale.candidates
@@ -0,0 +1,136 @@
+"""
+Run the crud benchmarks of bench_crud.py and compare them with a baseline.
+
+The report gives the median and minimal time and the peak memory of each
+benchmark, with the commit and the database. A benchmark slower (or using more
+memory) than the baseline by more than --tolerance fails the run.
+
+    SECRET=foo python -m benchmarks.crud
+    SECRET=foo python -m benchmarks.crud --scales 10x1k 1000x1k --save_baseline
+
+Record the baseline on the machine that compares with it: the timings of two
+machines are not comparable.
+"""
+import json
+import os
+import platform
+import sys
+import tempfile
+import typing as t
+from pathlib import Path
+
+import pytest
+import tap
+
+from benchmarks.load import commit
+
+HERE = Path(__file__).resolve().parent
+
+
+class Arguments(tap.Tap):
+    scales: list[str] = ["10x1k"]  # Scales of bench_crud.SCALES
+    keyword: t.Optional[str] = None  # Only run the benchmarks matching this -k
+    database_url: t.Optional[str] = None  # Use this database instead of SQLite
+    baseline: str = str(HERE / "crud_baseline.json")
+    save_baseline: bool = False  # Replace the baseline with this run
+    tolerance: float = 0.25  # Relative regression failing the comparison
+    output: t.Optional[str] = None  # Write the report as JSON in this file
+
+
+def run_benchmarks(args: Arguments) -> dict[str, t.Any]:
+    os.environ["BENCH_SCALES"] = ",".join(args.scales)
+    if args.database_url is not None:
+        os.environ["BENCH_DATABASE_URL"] = args.database_url
+
+    with tempfile.TemporaryDirectory() as directory:
+        raw = os.path.join(directory, "benchmarks.json")
+        code = pytest.main(
+            [
+                str(HERE / "bench_crud.py"),
+                "-o",
+                "python_files=bench_*.py",
+                "-p",
+                "no:cacheprovider",
+                "--benchmark-only",
+                f"--benchmark-json={raw}",
+                "-q",
+                *(["-k", args.keyword] if args.keyword else []),
+            ]
+        )
+        if code != 0:
+            sys.exit(code)
+        with open(raw) as fid:
+            data = json.load(fid)
+
+    benchmarks = {}
+    for bench in data["benchmarks"]:
+        stats = bench["stats"]
+        benchmarks[bench["name"]] = {
+            "rounds": stats["rounds"],
+            "median_ms": 1000 * stats["median"],
+            "min_ms": 1000 * stats["min"],
+            "peak_memory_kib": bench["extra_info"].get("peak_memory_kib"),
+        }
+
+    return {
+        "commit": commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "database": "postgresql" if args.database_url else "sqlite",
+        "benchmarks": benchmarks,
+    }
+
+
+def compare(
+    report: dict[str, t.Any], baseline: dict[str, t.Any], tolerance: float
+) -> list[str]:
+    """
+    Print the changes against the baseline, and return the regressions
+    """
+    print(f"Compared with {baseline.get('commit')}:")
+    regressions = []
+    for name, stats in report["benchmarks"].items():
+        before = baseline["benchmarks"].get(name)
+        if before is None:
+            print(f"  {name}: not in the baseline")
+            continue
+        deltas = []
+        for key in ("median_ms", "peak_memory_kib"):
+            if not before.get(key) or stats.get(key) is None:
+                continue
+            change = (stats[key] - before[key]) / before[key]
+            deltas.append(f"{key} {100 * change:+.1f}%")
+            if change > tolerance:
+                regressions.append(f"{name} {key}")
+        print(f"  {name}: {', '.join(deltas)}")
+    return regressions
+
+
+def main(args: Arguments) -> None:
+    report = run_benchmarks(args)
+    print(json.dumps(report, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as fid:
+            json.dump(report, fid, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as fid:
+            json.dump(report, fid, indent=2)
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline in {args.baseline}, record it with --save_baseline")
+        return
+
+    with open(args.baseline) as fid:
+        regressions = compare(report, json.load(fid), args.tolerance)
+    if regressions:
+        threshold = f"{100 * args.tolerance:.0f}%"
+        print(f"Regressions beyond {threshold}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    args = Arguments().parse_args()
+    main(args)
@@ -0,0 +1,298 @@
+"""
+Load the API with the flows of k6/index.js, without k6.
+
+Virtual users read the election and vote, either with an invite of a restricted
+election (GET then PUT /ballots) or on a public election (POST /ballots), while
+pollers read the results and the progress. Users start over `--ramp_up`
+seconds and loop until `--duration`.
+
+The API is served in-process through httpx.ASGITransport, or by any server
+given with --url. The report gives the throughput and the latency percentiles
+of each step, together with the parameters and the commit, so that runs can be
+compared across commits with --baseline.
+
+    SECRET=foo SQLITE=True python -m benchmarks.load --users 50 --output load.json
+    python -m benchmarks.load --url http://localhost:8877 --public --baseline load.json
+"""
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+import typing as t
+from collections import defaultdict
+from pathlib import Path
+
+import httpx
+import tap
+
+ROOT = Path(__file__).resolve().parent.parent
+
+PERCENTILES = (50, 90, 99)
+
+
+class Arguments(tap.Tap):
+    url: t.Optional[str] = None  # Load this server instead of an in-process API
+    users: int = 50  # Virtual users voting
+    duration: float = 30.0  # Seconds of load
+    ramp_up: float = 5.0  # Seconds to start all the users
+    think_time: float = 0.0  # Seconds between two steps of a user (k6 uses 7 to 10)
+    public: bool = False  # Vote on a public election instead of using invites
+    num_candidates: int = 10
+    num_grades: int = 7
+    results_pollers: int = 2  # Clients reading the results in a loop
+    progress_pollers: int = 1  # Clients reading the progress in a loop
+    poll_interval: float = 1.0  # Seconds between two polls
+    seed: int = 0  # Seed of the grades given by the users
+    output: t.Optional[str] = None  # Write the report as JSON in this file
+    baseline: t.Optional[str] = None  # Compare with the report of a previous run
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))
+    return values[index]
+
+
+class Recorder:
+    """
+    Latencies and unexpected statuses of each step
+    """
+
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+
+    async def request(
+        self,
+        client: httpx.AsyncClient,
+        step: str,
+        method: str,
+        url: str,
+        expected: t.Collection[int] = (200,),
+        **kwargs,
+    ) -> httpx.Response | None:
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.TransportError:
+            self.errors[step] += 1
+            return None
+        self.latencies[step].append(time.perf_counter() - start)
+        if response.status_code not in expected:
+            self.errors[step] += 1
+        return response
+
+    def report(self, elapsed: float) -> dict[str, t.Any]:
+        steps = {}
+        for step, latencies in sorted(self.latencies.items()):
+            steps[step] = {
+                "requests": len(latencies),
+                "errors": self.errors[step],
+                "throughput_rps": len(latencies) / elapsed,
+                **{
+                    f"latency_p{q}_ms": 1000 * percentile(latencies, q)
+                    for q in PERCENTILES
+                },
+                "latency_max_ms": 1000 * max(latencies),
+            }
+        num_requests = sum(s["requests"] for s in steps.values())
+        return {
+            "requests": num_requests,
+            "errors": sum(self.errors.values()),
+            "throughput_rps": num_requests / elapsed,
+            "steps": steps,
+        }
+
+
+async def create_election(
+    client: httpx.AsyncClient, args: Arguments
+) -> dict[str, t.Any]:
+    election = {
+        "name": "Load test",
+        "hide_results": False,
+        "restricted": not args.public,
+        "num_voters": 0 if args.public else args.users,
+        "candidates": [
+            {"name": f"Candidate {i}", "description": "", "image": ""}
+            for i in range(args.num_candidates)
+        ],
+        "grades": [{"name": f"Grade {i}", "value": i} for i in range(args.num_grades)],
+    }
+    response = await client.post("/elections", json=election)
+    response.raise_for_status()
+    return response.json()
+
+
+async def run_load(
+    args: Arguments, transport: httpx.AsyncBaseTransport | None = None
+) -> dict[str, t.Any]:
+    base_url = args.url or "http://testserver"
+    num_clients = args.users + args.results_pollers + args.progress_pollers
+    limits = httpx.Limits(max_connections=num_clients)
+    async with httpx.AsyncClient(
+        base_url=base_url, transport=transport, limits=limits, timeout=60
+    ) as client:
+        data = await create_election(client, args)
+        ref = data["ref"]
+        admin = {"Authorization": f"Bearer {data['admin']}"}
+        recorder = Recorder()
+        start = time.monotonic()
+        deadline = start + args.duration
+
+        async def user(index: int):
+            rng = random.Random(args.seed * 1_000_003 + index)
+            invite = None
+            if not args.public:
+                invite = {"Authorization": f"Bearer {data['invites'][index]}"}
+            voted = False
+            await asyncio.sleep(args.ramp_up * index / max(args.users, 1))
+
+            while time.monotonic() < deadline:
+                response = await recorder.request(
+                    client, "GET /elections/{ref}", "GET", f"/elections/{ref}"
+                )
+                if response is None or response.status_code != 200:
+                    await asyncio.sleep(args.think_time)
+                    continue
+                election = response.json()
+
+                if invite is not None:
+                    # Tells whether the voter already voted
+                    await recorder.request(
+                        client,
+                        "GET /ballots",
+                        "GET",
+                        "/ballots",
+                        expected=(200,) if voted else (404,),
+                        headers=invite,
+                    )
+                await asyncio.sleep(args.think_time)
+
+                grades = election["grades"]
+                votes = [
+                    {"candidate_id": c["id"], "grade_id": rng.choice(grades)["id"]}
+                    for c in election["candidates"]
+                ]
+                if invite is not None:
+                    response = await recorder.request(
+                        client,
+                        "PUT /ballots",
+                        "PUT",
+                        "/ballots",
+                        json={"votes": votes},
+                        headers=invite,
+                    )
+                else:
+                    response = await recorder.request(
+                        client,
+                        "POST /ballots",
+                        "POST",
+                        "/ballots",
+                        json={"votes": votes, "election_ref": ref},
+                    )
+                voted = voted or (response is not None and response.status_code == 200)
+                await asyncio.sleep(args.think_time)
+
+        async def poller(step: str, url: str, headers: dict[str, str] | None = None):
+            while time.monotonic() < deadline:
+                # The results exist once a first ballot is cast
+                await recorder.request(
+                    client, step, "GET", url, expected=(200, 403), headers=headers
+                )
+                await asyncio.sleep(args.poll_interval)
+
+        await asyncio.gather(
+            *(user(i) for i in range(args.users)),
+            *(
+                poller("GET /results/{ref}", f"/results/{ref}")
+                for _ in range(args.results_pollers)
+            ),
+            *(
+                poller(
+                    "GET /elections/{ref}/progress",
+                    f"/elections/{ref}/progress",
+                    admin,
+                )
+                for _ in range(args.progress_pollers)
+            ),
+        )
+        elapsed = time.monotonic() - start
+
+    return recorder.report(elapsed)
+
+
+def commit() -> str | None:
+    try:
+        process = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+        )
+    except OSError:
+        return None
+    return process.stdout.strip() or None
+
+
+def in_process_transport() -> httpx.ASGITransport:
+    """
+    Serve the API in this process. With SQLITE=True, it uses a new database
+    in a temporary directory.
+    """
+    if os.getenv("SQLITE", "").lower() in ("1", "true"):
+        os.chdir(tempfile.mkdtemp())
+        from app.database import engine
+        from app.models import Base
+
+        Base.metadata.create_all(bind=engine)
+
+    from app.main import app
+
+    return httpx.ASGITransport(app=app)
+
+
+def compare(report: dict[str, t.Any], baseline: dict[str, t.Any]):
+    print(f"Compared with {baseline.get('commit')}:")
+    for step, stats in report["steps"].items():
+        before = baseline["steps"].get(step)
+        if before is None:
+            continue
+        deltas = []
+        for key in ("throughput_rps", *(f"latency_p{q}_ms" for q in PERCENTILES)):
+            if before[key]:
+                change = 100 * (stats[key] - before[key]) / before[key]
+                deltas.append(f"{key} {change:+.1f}%")
+        print(f"  {step}: {', '.join(deltas)}")
+
+
+def main(args: Arguments) -> None:
+    # The in-process API changes the working directory
+    output = args.output and os.path.abspath(args.output)
+    baseline = args.baseline and os.path.abspath(args.baseline)
+    transport = None if args.url else in_process_transport()
+    report = {
+        "commit": commit(),
+        "python": platform.python_version(),
+        "parameters": {
+            k: v for k, v in args.as_dict().items() if k not in ("output", "baseline")
+        },
+        **asyncio.run(run_load(args, transport)),
+    }
+    print(json.dumps(report, indent=2))
+
+    if baseline:
+        with open(baseline) as fid:
+            compare(report, json.load(fid))
+
+    if output:
+        with open(output, "w") as fid:
+            json.dump(report, fid, indent=2)
+
+
+if __name__ == "__main__":
+    args = Arguments().parse_args()
+    main(args)
@@ -0,0 +1,121 @@
+"""
+Measure the overhead of the Prometheus instrumentation (METRICS=True).
+
+Each round runs the hot routes (reading an election, casting a ballot and
+reading the results) in a fresh interpreter, alternately with and without the
+metrics, in-process so that the network does not hide the difference. We
+report the median time per request of each mode and the relative overhead.
+
+    SECRET=foo SQLITE=True python -m benchmarks.metrics_overhead --rounds 10
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import typing as t
+from pathlib import Path
+
+import tap
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+class Arguments(tap.Tap):
+    requests: int = 3000  # Requests per round
+    rounds: int = 6  # Rounds per mode
+    num_candidates: int = 10
+    num_grades: int = 7
+    worker: t.Optional[str] = None  # Internal: run a round in this process
+    output: t.Optional[str] = None  # Write the report as JSON in this file
+
+
+def run_round(args: Arguments) -> dict[str, float]:
+    from fastapi.testclient import TestClient
+    from app.database import Base, engine
+    from app.main import app
+
+    Base.metadata.create_all(bind=engine)
+    client = TestClient(app)
+
+    election = {
+        "name": "Benchmark",
+        "hide_results": False,
+        "candidates": [{"name": f"C{i}"} for i in range(args.num_candidates)],
+        "grades": [{"name": f"G{i}", "value": i} for i in range(args.num_grades)],
+    }
+    data = client.post("/elections", json=election).json()
+    ref = data["ref"]
+    votes = [
+        {"candidate_id": c["id"], "grade_id": data["grades"][i % args.num_grades]["id"]}
+        for i, c in enumerate(data["candidates"])
+    ]
+
+    def hot_routes():
+        client.get(f"/elections/{ref}").raise_for_status()
+        client.post("/ballots", json={"votes": votes, "election_ref": ref}).raise_for_status()
+        client.get(f"/results/{ref}").raise_for_status()
+
+    for _ in range(100):
+        hot_routes()
+
+    num_loops = args.requests // 3
+    start, start_cpu = time.perf_counter(), time.process_time()
+    for _ in range(num_loops):
+        hot_routes()
+    elapsed, elapsed_cpu = time.perf_counter() - start, time.process_time() - start_cpu
+
+    return {
+        "us_per_request": 1e6 * elapsed / (3 * num_loops),
+        "cpu_us_per_request": 1e6 * elapsed_cpu / (3 * num_loops),
+    }
+
+
+def spawn_round(args: Arguments, metrics: bool) -> dict[str, float]:
+    python_path = os.pathsep.join([str(ROOT), os.environ.get("PYTHONPATH", "")])
+    env = dict(os.environ, METRICS=str(metrics), SQLITE="True", PYTHONPATH=python_path)
+    with tempfile.TemporaryDirectory() as workdir:
+        process = subprocess.run(
+            [sys.executable, "-m", "benchmarks.metrics_overhead", "--worker", "round"]
+            + ["--requests", str(args.requests)]
+            + ["--num_candidates", str(args.num_candidates)]
+            + ["--num_grades", str(args.num_grades)],
+            cwd=workdir,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    return json.loads(process.stdout.splitlines()[-1])
+
+
+def main(args: Arguments) -> None:
+    if args.worker is not None:
+        print(json.dumps(run_round(args)))
+        return
+
+    rounds: dict[str, list[dict[str, float]]] = {"off": [], "on": []}
+    for index in range(args.rounds):
+        # Alternate the order, so that a drift of the machine affects both modes
+        modes = ("off", "on") if index % 2 == 0 else ("on", "off")
+        for mode in modes:
+            rounds[mode].append(spawn_round(args, metrics=mode == "on"))
+
+    report: dict[str, t.Any] = {}
+    for key in ("us_per_request", "cpu_us_per_request"):
+        off = statistics.median(r[key] for r in rounds["off"])
+        on = statistics.median(r[key] for r in rounds["on"])
+        report[key] = {"off": off, "on": on, "overhead_percent": 100 * (on - off) / off}
+
+    print(json.dumps(report, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as fid:
+            json.dump(report, fid, indent=2)
+
+
+if __name__ == "__main__":
+    args = Arguments().parse_args()
+    main(args)
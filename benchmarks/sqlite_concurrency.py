@@ -0,0 +1,147 @@
+"""
+Compare the default SQLite engine with the tuned one (SQLITE_TUNED=True).
+
+Threads cast ballots and read the results of an election concurrently, as the
+thread pool of the API would. We report the throughput, the latencies and the
+number of failed requests, such as "database is locked" errors.
+
+    SECRET=foo SQLITE=True python -m benchmarks.sqlite_concurrency --threads 40
+"""
+import json
+import random
+import statistics
+import tempfile
+import threading
+import time
+import typing as t
+from concurrent.futures import ThreadPoolExecutor
+
+import tap
+from sqlalchemy import create_engine, exc
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, schemas
+from app.database import Base, create_sqlite_engine
+
+
+class Arguments(tap.Tap):
+    threads: int = 40  # Number of concurrent requests
+    duration: float = 10.0  # Seconds of load for each mode
+    read_ratio: float = 0.5  # Share of the requests reading the results
+    num_candidates: int = 10
+    num_grades: int = 7
+    output: t.Optional[str] = None  # Write the report as JSON in this file
+
+
+def run_load(
+    args: Arguments, write_factory: sessionmaker, read_factory: sessionmaker
+) -> dict[str, t.Any]:
+    db = write_factory()
+    try:
+        election = crud.create_election(
+            db,
+            schemas.ElectionCreate(
+                name="Benchmark",
+                hide_results=False,
+                date_start=None,
+                candidates=[{"name": f"C{i}"} for i in range(args.num_candidates)],  # type: ignore
+                grades=[{"name": f"G{i}", "value": i} for i in range(args.num_grades)],  # type: ignore
+            ),
+        )
+    finally:
+        db.close()
+
+    latencies: dict[str, list[float]] = {"write": [], "read": []}
+    errors: dict[str, int] = {"write": 0, "read": 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + args.duration
+
+    def cast(index: int):
+        grades = election.grades
+        votes = [
+            schemas.VoteCreate(candidate_id=c.id, grade_id=grades[(index + i) % len(grades)].id)
+            for i, c in enumerate(election.candidates)
+        ]
+        ballot = schemas.BallotCreate(election_ref=election.ref, votes=votes)
+        db = write_factory()
+        try:
+            crud.create_ballot(db, ballot)
+        finally:
+            db.close()
+
+    def read(index: int):
+        db = read_factory()
+        try:
+            crud.get_results(db, election.ref, None)
+        finally:
+            db.close()
+
+    def user(index: int):
+        rng = random.Random(index)
+        while time.monotonic() < deadline:
+            kind = "read" if rng.random() < args.read_ratio else "write"
+            start = time.perf_counter()
+            failed = False
+            try:
+                (read if kind == "read" else cast)(rng.randrange(args.num_grades))
+            except exc.OperationalError:
+                failed = True
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies[kind].append(elapsed)
+                errors[kind] += failed
+
+    # The results need at least one ballot
+    cast(0)
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        for future in [executor.submit(user, i) for i in range(args.threads)]:
+            future.result()
+    elapsed = time.monotonic() - start
+
+    report: dict[str, t.Any] = {}
+    for kind, values in latencies.items():
+        if len(values) < 2:
+            continue
+        quantiles = statistics.quantiles(values, n=100)
+        report[kind] = {
+            "requests": len(values),
+            "errors": errors[kind],
+            "throughput_rps": len(values) / elapsed,
+            "latency_p50_ms": quantiles[49] * 1000,
+            "latency_p99_ms": quantiles[98] * 1000,
+        }
+    return report
+
+
+def main(args: Arguments) -> None:
+    report = {}
+    for mode in ("default", "tuned"):
+        with tempfile.TemporaryDirectory() as workdir:
+            url = f"sqlite:///{workdir}/main.db"
+            if mode == "tuned":
+                write_engine = create_sqlite_engine(url)
+                read_engine = create_sqlite_engine(url, writer=False)
+            else:
+                write_engine = create_engine(url, connect_args={"check_same_thread": False})
+                read_engine = write_engine
+            Base.metadata.create_all(bind=write_engine)
+
+            report[mode] = run_load(
+                args,
+                sessionmaker(autocommit=False, autoflush=False, bind=write_engine),
+                sessionmaker(autocommit=False, autoflush=False, bind=read_engine),
+            )
+            write_engine.dispose()
+            read_engine.dispose()
+        print(mode, json.dumps(report[mode], indent=2))
+
+    if args.output:
+        with open(args.output, "w") as fid:
+            json.dump(report, fid, indent=2)
+
+
+if __name__ == "__main__":
+    args = Arguments().parse_args()
+    main(args)
@@ -0,0 +1,111 @@
+"""
+Measure how long a worker takes to start.
+
+The application is imported with `python -X importtime` in fresh interpreters.
+We report the median import time of the application, the modules taking the
+most time, and optionally the time until uvicorn answers its first request.
+
+    SECRET=foo SQLITE=True python -m benchmarks.startup --runs 10 --serve
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import typing as t
+from pathlib import Path
+
+import httpx
+import tap
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+class Arguments(tap.Tap):
+    module: str = "app.main"
+    runs: int = 5  # Number of fresh interpreters
+    top: int = 15  # Number of slowest modules to report
+    serve: bool = False  # Also measure the time until uvicorn answers
+    port: int = 8899
+    output: t.Optional[str] = None  # Write the report as JSON in this file
+
+
+def _env(extra: dict[str, str] | None = None) -> dict[str, str]:
+    python_path = os.pathsep.join([str(ROOT), os.environ.get("PYTHONPATH", "")])
+    return dict(os.environ, PYTHONPATH=python_path, **(extra or {}))
+
+
+def import_times(
+    module: str, cwd: str | None = None, env: dict[str, str] | None = None
+) -> dict[str, tuple[int, int]]:
+    """
+    Import a module in a fresh interpreter and provide the (self, cumulative)
+    import time of every imported module, in microseconds
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd,
+        env=_env(env),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def time_to_first_response(args: Arguments, cwd: str) -> float:
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port)],
+        cwd=cwd,
+        env=_env(),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            try:
+                httpx.get(f"http://127.0.0.1:{args.port}/liveness").raise_for_status()
+                return time.perf_counter() - start
+            except httpx.TransportError:
+                if server.poll() is not None:
+                    raise RuntimeError("The server did not start")
+                time.sleep(0.01)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main(args: Arguments) -> None:
+    with tempfile.TemporaryDirectory() as workdir:
+        runs = [import_times(args.module, cwd=workdir) for _ in range(args.runs)]
+        slowest = sorted(runs[-1].items(), key=lambda item: item[1][0], reverse=True)
+        report: dict[str, t.Any] = {
+            "import_ms": statistics.median(r[args.module][1] for r in runs) / 1000,
+            "slowest_modules_ms": {
+                name: self_us / 1000 for name, (self_us, _) in slowest[: args.top]
+            },
+        }
+        if args.serve:
+            report["first_response_ms"] = 1000 * statistics.median(
+                time_to_first_response(args, workdir) for _ in range(args.runs)
+            )
+
+    print(json.dumps(report, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as fid:
+            json.dump(report, fid, indent=2)
+
+
+if __name__ == "__main__":
+    args = Arguments().parse_args()
+    main(args)
@@ -0,0 +1,87 @@
+"""Create the initial tables
+
+The tables used to be created by the API at startup. Databases created that
+way are already past this revision.
+
+Revision ID: 0b2d4f6a8c1e
+Revises: 
+Create Date: 2026-10-19 18:02:16.240871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0b2d4f6a8c1e'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('elections',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('ref', sa.String(length=20), nullable=True),
+        sa.Column('name', sa.String(length=255), nullable=True),
+        sa.Column('description', sa.String(length=1024), nullable=True),
+        sa.Column('num_voters', sa.Integer(), nullable=True),
+        sa.Column('date_created', sa.DateTime(), server_default=sa.func.now(), nullable=True),
+        sa.Column('date_modified', sa.DateTime(), nullable=True),
+        sa.Column('date_start', sa.DateTime(), server_default=sa.func.now(), nullable=True),
+        sa.Column('date_end', sa.DateTime(), nullable=True),
+        sa.Column('hide_results', sa.Boolean(), nullable=True),
+        sa.Column('restricted', sa.Boolean(), nullable=True),
+        sa.Column('force_close', sa.Boolean(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('ref')
+    )
+    op.create_index(op.f('ix_elections_id'), 'elections', ['id'], unique=False)
+    op.create_table('candidates',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=255), nullable=True),
+        sa.Column('description', sa.String(length=1024), nullable=True),
+        sa.Column('image', sa.String(length=100), nullable=True),
+        sa.Column('date_created', sa.DateTime(), server_default=sa.func.now(), nullable=True),
+        sa.Column('date_modified', sa.DateTime(), nullable=True),
+        sa.Column('election_ref', sa.String(length=20), nullable=True),
+        sa.ForeignKeyConstraint(['election_ref'], ['elections.ref'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_candidates_id'), 'candidates', ['id'], unique=False)
+    op.create_table('grades',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=True),
+        sa.Column('description', sa.String(), nullable=True),
+        sa.Column('value', sa.Integer(), nullable=True),
+        sa.Column('date_created', sa.DateTime(), server_default=sa.func.now(), nullable=True),
+        sa.Column('date_modified', sa.DateTime(), nullable=True),
+        sa.Column('election_ref', sa.String(length=20), nullable=True),
+        sa.ForeignKeyConstraint(['election_ref'], ['elections.ref'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_grades_id'), 'grades', ['id'], unique=False)
+    op.create_table('votes',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('date_created', sa.DateTime(), server_default=sa.func.now(), nullable=True),
+        sa.Column('date_modified', sa.DateTime(), nullable=True),
+        sa.Column('candidate_id', sa.Integer(), nullable=True),
+        sa.Column('grade_id', sa.Integer(), nullable=True),
+        sa.Column('election_ref', sa.String(length=20), nullable=True),
+        sa.ForeignKeyConstraint(['candidate_id'], ['candidates.id'], ),
+        sa.ForeignKeyConstraint(['election_ref'], ['elections.ref'], ),
+        sa.ForeignKeyConstraint(['grade_id'], ['grades.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_votes_id'), 'votes', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_votes_id'), table_name='votes')
+    op.drop_table('votes')
+    op.drop_index(op.f('ix_grades_id'), table_name='grades')
+    op.drop_table('grades')
+    op.drop_index(op.f('ix_candidates_id'), table_name='candidates')
+    op.drop_table('candidates')
+    op.drop_index(op.f('ix_elections_id'), table_name='elections')
+    op.drop_table('elections')
@@ -1,7 +1,7 @@
 """Add auth_for_result column
 
 Revision ID: 48bf0bdc1ca1
-Revises: 
+Revises: 0b2d4f6a8c1e
 Create Date: 2025-06-14 00:57:13.427496
 
 """
@@ -11,7 +11,7 @@ import sqlalchemy as sa
 
 # revision identifiers, used by Alembic.
 revision = '48bf0bdc1ca1'
-down_revision = None
+down_revision = '0b2d4f6a8c1e'
 branch_labels = None
 depends_on = None
 
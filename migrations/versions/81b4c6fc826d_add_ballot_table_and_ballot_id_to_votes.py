@@ -21,22 +21,25 @@ def upgrade() -> None:
     op.create_table('ballots',
         sa.Column('id', sa.Integer(), nullable=False),
         sa.Column('voter_uuid', sa.UUID(), nullable=True),
-        sa.Column('date_created', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+        sa.Column('date_created', sa.DateTime(), server_default=sa.func.now(), nullable=True),
         sa.Column('election_ref', sa.String(length=20), nullable=True),
         sa.ForeignKeyConstraint(['election_ref'], ['elections.ref'], ),
         sa.PrimaryKeyConstraint('id')
     )
     op.create_index(op.f('ix_ballots_id'), 'ballots', ['id'], unique=False)
     op.create_index(op.f('ix_ballots_voter_uuid'), 'ballots', ['voter_uuid'], unique=True)
-    op.add_column('votes', sa.Column('ballot_id', sa.Integer(), nullable=True))
-    op.create_foreign_key(None, 'votes', 'ballots', ['ballot_id'], ['id'])
+    # SQLite can only add the foreign key by copying the table
+    with op.batch_alter_table('votes') as batch_op:
+        batch_op.add_column(sa.Column('ballot_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('votes_ballot_id_fkey', 'ballots', ['ballot_id'], ['id'])
     # ### end Alembic commands ###
 
 
 def downgrade() -> None:
     # ### commands auto generated by Alembic - please adjust! ###
-    op.drop_constraint(None, 'votes', type_='foreignkey')
-    op.drop_column('votes', 'ballot_id')
+    with op.batch_alter_table('votes') as batch_op:
+        batch_op.drop_constraint('votes_ballot_id_fkey', type_='foreignkey')
+        batch_op.drop_column('ballot_id')
     op.drop_index(op.f('ix_ballots_voter_uuid'), table_name='ballots')
     op.drop_index(op.f('ix_ballots_id'), table_name='ballots')
     op.drop_table('ballots')
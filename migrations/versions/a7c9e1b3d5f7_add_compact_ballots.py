@@ -0,0 +1,55 @@
+"""Add compact ballots, with their grades packed in the ballots
+
+Revision ID: a7c9e1b3d5f7
+Revises: f1a3c5e7b9d0
+Create Date: 2026-10-19 19:02:17.448310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c9e1b3d5f7'
+down_revision = 'f1a3c5e7b9d0'
+branch_labels = None
+depends_on = None
+
+# The view as of this revision, which later changes of app.models must not alter
+BALLOT_VOTES_VIEW = """
+CREATE VIEW ballot_votes AS
+SELECT b.id AS ballot_id, b.election_ref AS election_ref,
+       c.id AS candidate_id, g.id AS grade_id
+FROM ballots b
+JOIN (
+    SELECT id, election_ref,
+           row_number() OVER (PARTITION BY election_ref ORDER BY id) AS position
+    FROM candidates
+) c ON c.election_ref = b.election_ref AND c.position <= length(b.grades)
+JOIN (
+    SELECT id, election_ref,
+           row_number() OVER (PARTITION BY election_ref ORDER BY id) AS position
+    FROM grades
+) g ON g.election_ref = b.election_ref AND g.position = {grade_position}
+WHERE b.grades IS NOT NULL
+"""
+GRADE_POSITIONS = {
+    "postgresql": "get_byte(b.grades, CAST(c.position - 1 AS integer))",
+    "sqlite": "unicode(substr(b.grades, c.position, 1))",
+}
+
+
+def upgrade() -> None:
+    op.add_column(
+        'elections',
+        sa.Column('compact_ballots', sa.Boolean(), server_default=sa.false(), nullable=True),
+    )
+    op.add_column('ballots', sa.Column('grades', sa.LargeBinary(), nullable=True))
+    grade_position = GRADE_POSITIONS[op.get_bind().dialect.name]
+    op.execute(BALLOT_VOTES_VIEW.format(grade_position=grade_position))
+
+
+def downgrade() -> None:
+    op.execute("DROP VIEW IF EXISTS ballot_votes")
+    op.drop_column('ballots', 'grades')
+    op.drop_column('elections', 'compact_ballots')
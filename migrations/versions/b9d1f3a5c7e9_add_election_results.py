@@ -0,0 +1,36 @@
+"""Add the results of elections computed in batch
+
+Revision ID: b9d1f3a5c7e9
+Revises: a7c9e1b3d5f7
+Create Date: 2026-10-19 21:37:05.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b9d1f3a5c7e9'
+down_revision = 'a7c9e1b3d5f7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('election_results',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('election_ref', sa.String(length=20), nullable=True),
+        sa.Column('date_created', sa.DateTime(), server_default=sa.func.now(), nullable=True),
+        sa.Column('merit_profile', sa.JSON(), nullable=True),
+        sa.Column('ranking', sa.JSON(), nullable=True),
+        sa.ForeignKeyConstraint(['election_ref'], ['elections.ref'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_election_results_id'), 'election_results', ['id'], unique=False)
+    op.create_index(op.f('ix_election_results_election_ref'), 'election_results', ['election_ref'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_election_results_election_ref'), table_name='election_results')
+    op.drop_index(op.f('ix_election_results_id'), table_name='election_results')
+    op.drop_table('election_results')
@@ -0,0 +1,39 @@
+"""Add the tallies of the provisional results
+
+Revision ID: c2e4a6b8d0f1
+Revises: b9d1f3a5c7e9
+Create Date: 2026-10-19 22:24:51.602733
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2e4a6b8d0f1'
+down_revision = 'b9d1f3a5c7e9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('provisional_tallies',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('election_ref', sa.String(length=20), nullable=True),
+        sa.Column('candidate_id', sa.Integer(), nullable=True),
+        sa.Column('grade_id', sa.Integer(), nullable=True),
+        sa.Column('num_votes', sa.Integer(), nullable=True),
+        sa.Column('date_modified', sa.DateTime(), server_default=sa.func.now(), nullable=True),
+        sa.ForeignKeyConstraint(['election_ref'], ['elections.ref'], ),
+        sa.ForeignKeyConstraint(['candidate_id'], ['candidates.id'], ),
+        sa.ForeignKeyConstraint(['grade_id'], ['grades.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_provisional_tallies_id'), 'provisional_tallies', ['id'], unique=False)
+    op.create_index('ix_provisional_tallies_election_ref_candidate_id_grade_id', 'provisional_tallies', ['election_ref', 'candidate_id', 'grade_id'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_provisional_tallies_election_ref_candidate_id_grade_id', table_name='provisional_tallies')
+    op.drop_index(op.f('ix_provisional_tallies_id'), table_name='provisional_tallies')
+    op.drop_table('provisional_tallies')
@@ -0,0 +1,39 @@
+"""Add indexes on votes, candidates, grades and ballots foreign keys
+
+Revision ID: c3d5e7a9b1f2
+Revises: 81b4c6fc826d
+Create Date: 2026-10-19 10:12:41.318202
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3d5e7a9b1f2'
+down_revision = '81b4c6fc826d'
+branch_labels = None
+depends_on = None
+
+# (index name, table, columns)
+INDEXES = [
+    ('ix_votes_election_ref_candidate_id_grade_id', 'votes', ['election_ref', 'candidate_id', 'grade_id']),
+    ('ix_votes_ballot_id', 'votes', ['ballot_id']),
+    ('ix_candidates_election_ref', 'candidates', ['election_ref']),
+    ('ix_grades_election_ref', 'grades', ['election_ref']),
+    ('ix_ballots_election_ref', 'ballots', ['election_ref']),
+]
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY does not lock the tables against writes,
+    # but it can not run inside a transaction.
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,66 @@
+"""Add the rollups of the timeline
+
+Revision ID: d4f6a8c0e2b4
+Revises: c2e4a6b8d0f1
+Create Date: 2026-10-19 23:41:07.215482
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4f6a8c0e2b4'
+down_revision = 'c2e4a6b8d0f1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('ballots', sa.Column('date_modified', sa.DateTime(), nullable=True))
+    # CREATE INDEX CONCURRENTLY does not lock the tables against writes,
+    # but it can not run inside a transaction.
+    with op.get_context().autocommit_block():
+        op.create_index('ix_votes_date_cast', 'votes', [sa.text('coalesce(date_modified, date_created)')], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_ballots_date_cast', 'ballots', [sa.text('coalesce(date_modified, date_created)')], unique=False, postgresql_concurrently=True)
+
+    op.create_table('timeline_buckets',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('election_ref', sa.String(length=20), nullable=True),
+        sa.Column('period', sa.String(length=6), nullable=True),
+        sa.Column('bucket_start', sa.DateTime(), nullable=True),
+        sa.Column('num_ballots', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['election_ref'], ['elections.ref'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_timeline_buckets_id'), 'timeline_buckets', ['id'], unique=False)
+    op.create_index('ix_timeline_buckets_election_ref_period_bucket_start', 'timeline_buckets', ['election_ref', 'period', 'bucket_start'], unique=True)
+
+    op.create_table('timeline_grades',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('election_ref', sa.String(length=20), nullable=True),
+        sa.Column('period', sa.String(length=6), nullable=True),
+        sa.Column('bucket_start', sa.DateTime(), nullable=True),
+        sa.Column('candidate_id', sa.Integer(), nullable=True),
+        sa.Column('grade_id', sa.Integer(), nullable=True),
+        sa.Column('num_votes', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['election_ref'], ['elections.ref'], ),
+        sa.ForeignKeyConstraint(['candidate_id'], ['candidates.id'], ),
+        sa.ForeignKeyConstraint(['grade_id'], ['grades.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_timeline_grades_id'), 'timeline_grades', ['id'], unique=False)
+    op.create_index('ix_timeline_grades_election_ref_period_bucket_start', 'timeline_grades', ['election_ref', 'period', 'bucket_start'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_timeline_grades_election_ref_period_bucket_start', table_name='timeline_grades')
+    op.drop_index(op.f('ix_timeline_grades_id'), table_name='timeline_grades')
+    op.drop_table('timeline_grades')
+    op.drop_index('ix_timeline_buckets_election_ref_period_bucket_start', table_name='timeline_buckets')
+    op.drop_index(op.f('ix_timeline_buckets_id'), table_name='timeline_buckets')
+    op.drop_table('timeline_buckets')
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_ballots_date_cast', table_name='ballots', postgresql_concurrently=True)
+        op.drop_index('ix_votes_date_cast', table_name='votes', postgresql_concurrently=True)
+    op.drop_column('ballots', 'date_modified')
@@ -0,0 +1,31 @@
+"""Add the versions of the elections for the invalidations on SQLite
+
+Revision ID: e6a8c0e2f4b6
+Revises: d4f6a8c0e2b4
+Create Date: 2026-10-20 00:37:12.480193
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6a8c0e2f4b6'
+down_revision = 'd4f6a8c0e2b4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('election_versions',
+        sa.Column('election_ref', sa.String(length=20), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['election_ref'], ['elections.ref'], ),
+        sa.PrimaryKeyConstraint('election_ref')
+    )
+    op.create_index(op.f('ix_election_versions_version'), 'election_versions', ['version'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_election_versions_version'), table_name='election_versions')
+    op.drop_table('election_versions')
@@ -0,0 +1,47 @@
+"""Optionally hash-partition votes and ballots by election
+
+The layout is only applied on PostgreSQL, when asked for with:
+
+    alembic -x partitions=16 upgrade head
+
+It copies the tables in a single transaction, which suits new or small
+databases. Large databases should use `python -m scripts.partition_tables`,
+which copies the rows in batches while the API keeps running.
+
+Revision ID: e8f0a2c4d6b8
+Revises: c3d5e7a9b1f2
+Create Date: 2026-10-19 14:38:05.902117
+
+"""
+from alembic import context, op
+import sqlalchemy as sa
+
+from app import partitioning
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8f0a2c4d6b8'
+down_revision = 'c3d5e7a9b1f2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    num_partitions = int(context.get_x_argument(as_dictionary=True).get("partitions", 0))
+    connection = op.get_bind()
+    if num_partitions <= 0 or connection.dialect.name != "postgresql":
+        return
+    if partitioning.is_partitioned(connection, "votes"):
+        return
+
+    partitioning.prepare(connection, num_partitions)
+    for table in partitioning.TABLES:
+        start, stop = partitioning.id_range(connection, table)
+        partitioning.copy_batch(connection, table, start, stop + 1)
+    partitioning.switch(connection)
+    partitioning.drop_old_tables(connection)
+
+
+def downgrade() -> None:
+    # Both layouts are served by the same models: the partitioned one is kept.
+    pass
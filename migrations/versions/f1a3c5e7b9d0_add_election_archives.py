@@ -0,0 +1,43 @@
+"""Add election archives
+
+Revision ID: f1a3c5e7b9d0
+Revises: e8f0a2c4d6b8
+Create Date: 2026-10-19 16:12:41.530218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1a3c5e7b9d0'
+down_revision = 'e8f0a2c4d6b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'elections',
+        sa.Column('archived', sa.Boolean(), server_default=sa.false(), nullable=True),
+    )
+    op.create_table('election_archives',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('election_ref', sa.String(length=20), nullable=True),
+        sa.Column('date_created', sa.DateTime(), server_default=sa.func.now(), nullable=True),
+        sa.Column('tallies', sa.JSON(), nullable=True),
+        sa.Column('num_voters', sa.Integer(), nullable=True),
+        sa.Column('num_voters_voted', sa.Integer(), nullable=True),
+        sa.Column('data', sa.LargeBinary(), nullable=True),
+        sa.ForeignKeyConstraint(['election_ref'], ['elections.ref'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_election_archives_id'), 'election_archives', ['id'], unique=False)
+    op.create_index(op.f('ix_election_archives_election_ref'), 'election_archives', ['election_ref'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_election_archives_election_ref'), table_name='election_archives')
+    op.drop_index(op.f('ix_election_archives_id'), table_name='election_archives')
+    op.drop_table('election_archives')
+    op.drop_column('elections', 'archived')
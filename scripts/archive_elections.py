@@ -0,0 +1,53 @@
+"""
+Archive the ballots of the elections closed for more than ARCHIVE_RETENTION_DAYS.
+
+    python -m scripts.archive_elections
+    python -m scripts.archive_elections --loop --interval 3600
+    python -m scripts.archive_elections --restore <election ref>
+"""
+import time
+import tap
+
+from app import archive
+from app.database import SessionLocal
+from app.settings import settings
+
+
+class Arguments(tap.Tap):
+    retention_days: int = settings.archive_retention_days
+    restore: list[str] = []  # Restore the ballots of these elections instead
+    loop: bool = False  # Keep archiving elections every interval
+    interval: float = 3600.0  # Seconds between two runs with --loop
+
+
+def run(args: Arguments) -> None:
+    db = SessionLocal()
+    try:
+        refs = archive.find_archivable(db, args.retention_days)
+        for ref in refs:
+            db_archive = archive.archive_election(db, ref)
+            print(f"Archived {ref} ({len(db_archive.data)} bytes)")  # type: ignore
+    finally:
+        db.close()
+
+
+def main(args: Arguments) -> None:
+    if args.restore:
+        db = SessionLocal()
+        try:
+            for ref in args.restore:
+                num_rows = archive.restore_election(db, ref)
+                print(f"Restored {num_rows} rows of {ref}")
+        finally:
+            db.close()
+        return
+
+    run(args)
+    while args.loop:
+        time.sleep(args.interval)
+        run(args)
+
+
+if __name__ == "__main__":
+    args = Arguments().parse_args()
+    main(args)
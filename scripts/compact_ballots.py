@@ -0,0 +1,57 @@
+"""
+Convert elections between the votes layout and compact ballots (see app.compact).
+
+    python -m scripts.compact_ballots --pack <election ref> ...
+    python -m scripts.compact_ballots --pack_all
+    python -m scripts.compact_ballots --unpack <election ref> ...
+
+Each election is converted in its own transaction.
+"""
+import time
+import tap
+from sqlalchemy import select
+
+from app import compact, errors, models
+from app.database import SessionLocal
+
+
+class Arguments(tap.Tap):
+    pack: list[str] = []  # Pack the ballots of these elections
+    pack_all: bool = False  # Pack the ballots of every election in the votes layout
+    unpack: list[str] = []  # Write the ballots of these elections back as votes
+
+
+def main(args: Arguments) -> None:
+    db = SessionLocal()
+    try:
+        refs = list(args.pack)
+        if args.pack_all:
+            refs += db.scalars(
+                select(models.Election.ref).filter(
+                    models.Election.compact_ballots.is_not(True)
+                    & models.Election.archived.is_not(True)
+                )
+            )
+
+        for ref in refs:
+            tic = time.monotonic()
+            try:
+                num_ballots = compact.pack_election(db, ref)
+            except errors.CustomError as e:
+                print(f"Skipped {ref}: {e}")
+                continue
+            elapsed = time.monotonic() - tic
+            print(f"Packed {num_ballots} ballots of {ref} in {elapsed:.1f}s")
+
+        for ref in args.unpack:
+            tic = time.monotonic()
+            num_votes = compact.unpack_election(db, ref)
+            elapsed = time.monotonic() - tic
+            print(f"Unpacked {num_votes} votes of {ref} in {elapsed:.1f}s")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    args = Arguments().parse_args()
+    main(args)
@@ -1,10 +1,12 @@
 from jose import jws
 import tap
+import typing as t
 
 
 class Arguments(tap.Tap):
-    ref: str
     secret: str
+    ref: t.Optional[str] = None
+    operator: bool = False  # Create a token for the /admin routes instead
 
 
 def create_admin_token(election_ref: str, secret: str) -> str:
@@ -15,8 +17,17 @@ def create_admin_token(election_ref: str, secret: str) -> str:
     )
 
 
+def create_operator_token(secret: str) -> str:
+    return jws.sign({"operator": True}, secret, algorithm="HS256")
+
+
 def main(args: Arguments) -> None:
-    print(create_admin_token(args.ref, args.secret))
+    if args.operator:
+        print(create_operator_token(args.secret))
+    elif args.ref is not None:
+        print(create_admin_token(args.ref, args.secret))
+    else:
+        raise ValueError("Provide either --ref or --operator")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,192 @@
+"""
+Fill a database with synthetic elections, for benchmarks and capacity planning.
+
+The rows are written with bulk inserts matching app/models.py, which is orders
+of magnitude faster than the API:
+
+    python -m scripts.generate_data --elections 1000 --opinions polarized
+    python -m scripts.generate_data --database_url sqlite:///./big.db --create_tables
+
+The number of ballots of an election is drawn around --ballots, with a long
+tail of large elections by default. A share of the elections is restricted:
+all their invites are created, but only --fill_rate of them have voted.
+"""
+import math
+import random
+import string
+import time
+import typing as t
+from datetime import datetime
+
+import tap
+from sqlalchemy import Connection, create_engine, insert
+
+from app import models
+from app.database import Base, database_url
+
+Opinions = t.Literal["uniform", "polarized", "consensual", "mixed"]
+
+
+class Arguments(tap.Tap):
+    elections: int = 100
+    candidates: list[int] = [2, 12]  # Range of the number of candidates
+    grades: list[int] = [3, 7]  # Range of the number of grades
+    ballots: int = 1000  # Mean number of ballots per election
+    ballots_distribution: t.Literal["fixed", "uniform", "lognormal"] = "lognormal"
+    opinions: Opinions = "mixed"  # How the grades are distributed
+    restricted: float = 0.2  # Share of restricted elections
+    fill_rate: float = 0.6  # Share of the invites of restricted elections that voted
+    batch_size: int = 10_000  # Rows inserted by statement
+    seed: int = 0
+    database_url: t.Optional[str] = None  # Defaults to the database of the API
+    create_tables: bool = False  # Create the tables in a fresh database
+
+
+def num_ballots(args: Arguments, rng: random.Random) -> int:
+    if args.ballots_distribution == "fixed":
+        return args.ballots
+    if args.ballots_distribution == "uniform":
+        return rng.randint(1, 2 * args.ballots)
+    # Most elections are small, and a few are huge, with the same mean
+    sigma = 1.5
+    mu = math.log(args.ballots) - sigma**2 / 2
+    return max(1, round(rng.lognormvariate(mu, sigma)))
+
+
+def grade_sampler(
+    opinions: Opinions, num_candidates: int, num_grades: int, rng: random.Random
+) -> t.Callable[[int], int]:
+    """
+    Return a function drawing the grade index given to a candidate
+    """
+    if opinions == "mixed":
+        opinions = rng.choice(("uniform", "polarized", "consensual"))
+    top = num_grades - 1
+
+    if opinions == "uniform":
+        return lambda candidate: rng.randint(0, top)
+
+    if opinions == "polarized":
+        # Each candidate has supporters giving high grades and opponents
+        # giving low grades, in a proportion of its own
+        support = [rng.uniform(0.2, 0.8) for _ in range(num_candidates)]
+        spread = max(1, num_grades // 4)
+
+        def polarized(candidate: int) -> int:
+            if rng.random() < support[candidate]:
+                return top - rng.randrange(spread)
+            return rng.randrange(spread)
+
+        return polarized
+
+    # Consensual: the voters agree on the grade of each candidate, give or take
+    means = [rng.uniform(0, top) for _ in range(num_candidates)]
+    return lambda candidate: min(top, max(0, round(rng.gauss(means[candidate], 0.7))))
+
+
+def insert_returning_ids(
+    connection: Connection, model: t.Any, rows: list[dict[str, t.Any]]
+) -> list[int]:
+    result = connection.execute(
+        insert(model).returning(model.id, sort_by_parameter_order=True), rows
+    )
+    return list(result.scalars())
+
+
+def generate_election(
+    connection: Connection, args: Arguments, rng: random.Random
+) -> int:
+    """
+    Write an election, its candidates, grades, ballots and votes.
+    Return the number of rows.
+    """
+    num_candidates = rng.randint(*args.candidates)
+    num_grades = rng.randint(*args.grades)
+    ballots = num_ballots(args, rng)
+    restricted = rng.random() < args.restricted
+    now = datetime.now()
+
+    ref = "".join(rng.choices(string.ascii_lowercase, k=10))
+    connection.execute(
+        insert(models.Election),
+        {
+            "ref": ref,
+            "name": f"Synthetic election {ref}",
+            "description": "",
+            "num_voters": ballots if restricted else 0,
+            "date_start": now,
+            "restricted": restricted,
+        },
+    )
+    candidate_ids = insert_returning_ids(
+        connection,
+        models.Candidate,
+        [
+            {"election_ref": ref, "name": f"Candidate {i}", "description": ""}
+            for i in range(num_candidates)
+        ],
+    )
+    grade_ids = insert_returning_ids(
+        connection,
+        models.Grade,
+        [
+            {"election_ref": ref, "name": f"Grade {i}", "description": "", "value": i}
+            for i in range(num_grades)
+        ],
+    )
+    sample = grade_sampler(args.opinions, num_candidates, num_grades, rng)
+    num_rows = 1 + num_candidates + num_grades
+
+    ballots_per_batch = max(1, args.batch_size // num_candidates)
+    for start in range(0, ballots, ballots_per_batch):
+        size = min(ballots_per_batch, ballots - start)
+        ballot_ids = insert_returning_ids(
+            connection, models.Ballot, [{"election_ref": ref}] * size
+        )
+        votes = []
+        for ballot_id in ballot_ids:
+            # The invites that did not vote have no candidate and no grade yet
+            voted = not restricted or rng.random() < args.fill_rate
+            for index, candidate_id in enumerate(candidate_ids):
+                votes.append(
+                    {
+                        "election_ref": ref,
+                        "ballot_id": ballot_id,
+                        "candidate_id": candidate_id if voted else None,
+                        "grade_id": grade_ids[sample(index)] if voted else None,
+                        "date_created": now,
+                        "date_modified": now,
+                    }
+                )
+        connection.execute(insert(models.Vote), votes)
+        num_rows += size + len(votes)
+
+    return num_rows
+
+
+def main(args: Arguments) -> None:
+    engine = create_engine(args.database_url or database_url)
+
+    if args.create_tables:
+        Base.metadata.create_all(bind=engine)
+
+    rng = random.Random(args.seed)
+    total_rows = 0
+    tic = time.monotonic()
+    for index in range(args.elections):
+        # One transaction per election, so that an interruption leaves no
+        # election half written
+        with engine.begin() as connection:
+            total_rows += generate_election(connection, args, rng)
+        rate = total_rows / max(time.monotonic() - tic, 1e-9)
+        print(
+            f"{index + 1}/{args.elections} elections, "
+            f"{total_rows} rows ({rate:.0f} rows/s)"
+        )
+
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    args = Arguments().parse_args()
+    main(args)
@@ -0,0 +1,76 @@
+"""
+Hash-partition the votes and ballots tables by election while the API runs.
+
+    python -m scripts.partition_tables --partitions 16
+
+The rows are copied in batches of ids, each in its own transaction, while
+triggers mirror the concurrent writes. The final switch only locks the tables
+for the time of a few renames. Each step can also be run alone, e.g. to resume
+an interrupted copy with `--step copy --start-id 123456`.
+"""
+import time
+import typing as t
+import tap
+from sqlalchemy import create_engine
+
+from app import partitioning
+from app.database import database_url
+
+
+class Arguments(tap.Tap):
+    partitions: int = 16  # Number of hash partitions of each table
+    batch_size: int = 50_000  # Number of ids copied in each transaction
+    step: t.Literal["all", "prepare", "copy", "switch", "cleanup"] = "all"
+    start_id: int = 0  # Resume the copy from this id
+    pause: float = 0.0  # Seconds to sleep between batches, to spare the database
+
+
+def copy(args: Arguments, engine) -> None:
+    for table in partitioning.TABLES:
+        with engine.connect() as connection:
+            low, high = partitioning.id_range(connection, table)
+
+        start = max(low, args.start_id)
+        copied = 0
+        tic = time.monotonic()
+        while start <= high:
+            stop = start + args.batch_size
+            with engine.begin() as connection:
+                copied += partitioning.copy_batch(connection, table, start, stop)
+            rate = copied / max(time.monotonic() - tic, 1e-9)
+            print(f"{table}: copied up to id {stop - 1}/{high} ({rate:.0f} rows/s)")
+            start = stop
+            time.sleep(args.pause)
+
+
+def main(args: Arguments) -> None:
+    engine = create_engine(database_url)
+    if engine.dialect.name != "postgresql":
+        raise SystemExit("Partitioning requires PostgreSQL")
+
+    if args.step in ("all", "prepare"):
+        with engine.begin() as connection:
+            if partitioning.is_partitioned(connection, "votes"):
+                raise SystemExit("The votes table is already partitioned")
+            partitioning.prepare(connection, args.partitions)
+        print("Created the partitioned tables")
+
+    if args.step in ("all", "copy"):
+        copy(args, engine)
+
+    if args.step in ("all", "switch"):
+        tic = time.monotonic()
+        with engine.begin() as connection:
+            connection.exec_driver_sql("SET LOCAL lock_timeout = '5s'")
+            partitioning.switch(connection)
+        print(f"Switched the tables in {time.monotonic() - tic:.3f}s")
+
+    if args.step == "cleanup":
+        with engine.begin() as connection:
+            partitioning.drop_old_tables(connection)
+        print("Dropped the former tables")
+
+
+if __name__ == "__main__":
+    args = Arguments().parse_args()
+    main(args)
@@ -0,0 +1,38 @@
+"""
+Seed the provisional counts of elections from their votes (see app.provisional).
+
+    python -m scripts.provisional_results --rebuild <election ref> ...
+
+Run it for the elections opened before PROVISIONAL_RESULTS was enabled, or to
+correct the drift of the counts after a worker was killed.
+"""
+import time
+import tap
+
+from app import errors, provisional
+from app.database import SessionLocal
+
+
+class Arguments(tap.Tap):
+    rebuild: list[str]  # Recount the grades of these elections
+
+
+def main(args: Arguments) -> None:
+    db = SessionLocal()
+    try:
+        for ref in args.rebuild:
+            tic = time.monotonic()
+            try:
+                num_rows = provisional.rebuild(db, ref)
+            except errors.CustomError as e:
+                print(f"Skipped {ref}: {e}")
+                continue
+            elapsed = time.monotonic() - tic
+            print(f"Recounted {num_rows} grades of {ref} in {elapsed:.1f}s")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    args = Arguments().parse_args()
+    main(args)
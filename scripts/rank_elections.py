@@ -0,0 +1,63 @@
+"""
+Compute the results of many elections in batch (see app.ranking), and store
+them in election_results.
+
+    python -m scripts.rank_elections --closed
+    python -m scripts.rank_elections --refs <election ref> ... --dry_run
+
+The tallies of --batch_size elections are read by one query per layout, and
+the throughput is printed after each batch.
+"""
+import time
+import tap
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Session
+
+from app import models, ranking
+from app.database import SessionLocal
+
+
+class Arguments(tap.Tap):
+    refs: list[str] = []  # Rank these elections
+    closed: bool = False  # Rank every closed election
+    batch_size: int = ranking.BATCH_SIZE
+    dry_run: bool = False  # Do not store the results
+
+
+def closed_elections(db: Session) -> list[str]:
+    query = select(models.Election.ref).filter(
+        or_(
+            models.Election.date_end < func.now(),
+            models.Election.force_close.is_(True),
+        )
+    )
+    return [str(ref) for ref in db.scalars(query.order_by(models.Election.id))]
+
+
+def main(args: Arguments) -> None:
+    db = SessionLocal()
+    try:
+        refs = list(args.refs)
+        if args.closed:
+            refs += closed_elections(db)
+
+        num_ranked = 0
+        tic = time.monotonic()
+        for first in range(0, len(refs), args.batch_size):
+            batch = refs[first : first + args.batch_size]
+            results = ranking.rank_tallies(ranking.read_tallies(db, batch))
+            if not args.dry_run:
+                ranking.save_results(db, results)
+            num_ranked += len(results)
+            rate = (first + len(batch)) / max(time.monotonic() - tic, 1e-9)
+            print(
+                f"{first + len(batch)}/{len(refs)} elections, {num_ranked} ranked "
+                f"({rate:.0f} elections/s)"
+            )
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    args = Arguments().parse_args()
+    main(args)
@@ -0,0 +1,56 @@
+"""
+Recompute the buckets of the timeline (see app.timeline).
+
+    python -m scripts.roll_up_timeline
+    python -m scripts.roll_up_timeline --loop --interval 300
+    python -m scripts.roll_up_timeline --since 2024-01-01
+
+The buckets are recomputed from the start of the day --days before now, or from
+--since, to roll up again the ballots updated long after they were cast.
+"""
+import time
+import typing as t
+from datetime import datetime, timedelta
+
+import tap
+from sqlalchemy import func, select
+
+from app import timeline
+from app.database import SessionLocal
+
+
+class Arguments(tap.Tap):
+    days: float = 1.0  # Recompute the buckets of the last days
+    since: t.Optional[str] = None  # Recompute the buckets from this ISO date instead
+    loop: bool = False  # Keep rolling up every interval
+    interval: float = 300.0  # Seconds between two runs with --loop
+
+
+def run(args: Arguments) -> None:
+    db = SessionLocal()
+    try:
+        if args.since is not None:
+            since = datetime.fromisoformat(args.since)
+        else:
+            # The dates of the ballots are those of the database
+            since = db.scalar(select(func.now())) - timedelta(days=args.days)
+        tic = time.monotonic()
+        num_buckets = timeline.roll_up(db, since)
+        elapsed = time.monotonic() - tic
+        print(
+            f"Rolled up {num_buckets} buckets since {since:%Y-%m-%d} in {elapsed:.1f}s"
+        )
+    finally:
+        db.close()
+
+
+def main(args: Arguments) -> None:
+    run(args)
+    while args.loop:
+        time.sleep(args.interval)
+        run(args)
+
+
+if __name__ == "__main__":
+    args = Arguments().parse_args()
+    main(args)
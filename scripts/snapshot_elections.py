@@ -0,0 +1,45 @@
+"""
+Write the memory-mapped snapshots of elections (see app.snapshots), and print
+their ranking read back from the snapshot.
+
+    python -m scripts.snapshot_elections <election ref> ...
+    python -m scripts.snapshot_elections <election ref> --directory /dev/shm/mj
+"""
+import time
+import typing as t
+import tap
+
+from app import errors, snapshots
+from app.database import SessionLocal
+
+
+class Arguments(tap.Tap):
+    refs: list[str]  # Elections to snapshot
+    directory: t.Optional[str] = None  # Defaults to SNAPSHOTS_DIR
+
+    def configure(self):
+        self.add_argument("refs", nargs="+")
+
+
+def main(args: Arguments) -> None:
+    db = SessionLocal()
+    try:
+        for ref in args.refs:
+            tic = time.monotonic()
+            try:
+                path = snapshots.write_snapshot(db, ref, args.directory)
+            except errors.CustomError as e:
+                print(f"Skipped {ref}: {e}")
+                continue
+            elapsed = time.monotonic() - tic
+
+            snapshot = snapshots.load_snapshot(ref, args.directory)
+            print(f"Wrote {snapshot.num_ballots} ballots of {ref} in {elapsed:.1f}s")
+            print(f"  {path}, ranking {snapshot.ranking()}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    args = Arguments().parse_args()
+    main(args)
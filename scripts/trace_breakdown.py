@@ -0,0 +1,74 @@
+"""
+Break down the latency of the routes by phase, from the spans exported with
+TRACING_EXPORT (one line of OTLP-JSON per request).
+
+    python -m scripts.trace_breakdown traces.jsonl --route "POST /ballots"
+"""
+import json
+import typing as t
+from collections import defaultdict
+
+import tap
+
+from app.tracing import SPAN_KIND_SERVER
+
+
+class Arguments(tap.Tap):
+    path: str  # File written with TRACING_EXPORT
+    route: t.Optional[str] = None  # Only this route, e.g. "GET /results/{election_ref}"
+    percentiles: list[float] = [50, 90, 99]
+
+    def configure(self):
+        self.add_argument("path")
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def read_requests(path: str) -> t.Iterator[list[dict[str, t.Any]]]:
+    with open(path) as fid:
+        for line in fid:
+            for resource in json.loads(line)["resourceSpans"]:
+                for scope in resource["scopeSpans"]:
+                    yield scope["spans"]
+
+
+def breakdown(
+    requests: t.Iterable[list[dict[str, t.Any]]], route: str | None = None
+) -> dict[str, dict[str, list[float]]]:
+    """
+    Durations in milliseconds of each phase, by route. A phase occurring several
+    times in a request counts for its total duration.
+    """
+    durations: dict[str, dict[str, list[float]]] = defaultdict(lambda: defaultdict(list))
+    for spans in requests:
+        root = next((s for s in spans if s["kind"] == SPAN_KIND_SERVER), None)
+        if root is None or (route is not None and root["name"] != route):
+            continue
+
+        phases: dict[str, float] = defaultdict(float)
+        for span in spans:
+            duration = (int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])) / 1e6
+            phases["total" if span is root else span["name"]] += duration
+        for name, duration in phases.items():
+            durations[root["name"]][name].append(duration)
+    return durations
+
+
+def main(args: Arguments) -> None:
+    durations = breakdown(read_requests(args.path), args.route)
+    header = "".join(f"{f'p{q:g} (ms)':>12}" for q in args.percentiles)
+    for route, phases in sorted(durations.items()):
+        print(f"{route} ({len(phases['total'])} requests)")
+        print(f"  {'phase':<20}{header}")
+        for name, values in sorted(phases.items(), key=lambda item: -max(item[1])):
+            row = "".join(f"{percentile(values, q):12.2f}" for q in args.percentiles)
+            print(f"  {name:<20}{row}")
+
+
+if __name__ == "__main__":
+    args = Arguments().parse_args()
+    main(args)